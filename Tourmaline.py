@@ -5,14 +5,41 @@
 # Licensed under the GNU General Public License v3.0
 ########################
 
+from __future__ import annotations
+
 import re
+import gc
+import os
+import sys
 import math
+import mmap
+import time
+import pickle
+import hashlib
+import operator
+import itertools
+import weakref
+import collections
+import functools
+import threading
+import contextlib
 import random as py_random
-from typing import Any, Dict, List, Callable
+import array as py_array
+from types import MappingProxyType
+
+# Type hints are only read by type checkers; not importing typing at run time
+# takes a few milliseconds off every start
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Callable, Iterator, Optional, Tuple
 
 class TourmalineError(Exception):
     pass
 
+class CallDepthError(TourmalineError):
+    """Raised when calls nest deeper than the interpreter's max_depth"""
+    pass
+
 class TourmalineList(list):
     """Extended list with chainable methods"""
     def append(self, item):
@@ -35,22 +62,3023 @@ class TourmalineList(list):
         super().clear()
         return self
 
-class TourmalineInterpreter:
-    def __init__(self):
+MEMO_SIZE = 1024  # results kept per cached function
+# Arguments a result may be stored under: values that can never change. Arrays,
+# string builders, files and channels hash by identity but are mutable
+MEMO_KEY_TYPES = frozenset((bool, int, float, str, type(None), range))
+
+class MemoCache:
+    """Bounded LRU of a cached function's results, keyed by its arguments"""
+    __slots__ = ('entries', 'maxsize', 'hits', 'misses', 'uncached')
+    def __init__(self, maxsize: int = MEMO_SIZE):
+        self.entries = collections.OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0  # calls with mutable arguments, which always run
+    
+    def key(self, args: List[Any]) -> Optional[Tuple]:
+        """The cache key for a call, or None if an argument could change"""
+        types = tuple(map(type, args))
+        if not MEMO_KEY_TYPES.issuperset(types):
+            self.uncached += 1
+            return None
+        # 1, 1.0 and true are equal in Python but not interchangeable here
+        return tuple(args) + types
+    
+    def lookup(self, key: Tuple) -> Any:
+        """The stored result for key, or UNSET"""
+        value = self.entries.get(key, UNSET)
+        if value is UNSET:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+    
+    def store(self, key: Tuple, value: Any):
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+    
+    def info(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'uncached': self.uncached,
+                'size': len(self.entries), 'maxsize': self.maxsize}
+    
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.uncached = 0
+
+class TourmalineFunction:
+    """User-defined function, prepared once when its definition runs"""
+    __slots__ = ('name', 'params', 'arity', 'body', 'code', 'local_names', 'memo', 'definition', 'module')
+    def __init__(self, name, params, body, local_names, definition, cached=False, module=None):
+        self.name = name
+        self.params = tuple(params)
+        self.arity = len(self.params)
+        self.body = body  # Block for the tree walker, CodeObject for the VM
+        # What the VM runs. Tree walker functions are compiled when a call first needs it
+        self.code = body if isinstance(body, CodeObject) else None
+        self.local_names = tuple(local_names)  # frame slot layout
+        self.memo = MemoCache() if cached else None
+        self.definition = definition  # the FunctionDef, to define it again in worker processes
+        self.module = module  # the TourmalineModule whose globals the body sees
+    
+    def check_arity(self, count: int):
+        if count != self.arity:
+            raise TourmalineError(f"{self.name}() takes {self.arity} argument{'s' if self.arity != 1 else ''} but {count} {'were' if count != 1 else 'was'} given")
+    
+    def __repr__(self):
+        return f"<function {self.name}({', '.join(self.params)})>"
+
+class TourmalineModule:
+    """Globals, functions and structs of one program or imported .trm file"""
+    __slots__ = ('name', 'path', 'variables', 'functions', 'structs', 'loaded')
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path  # absolute; None for a program not run from a file
         self.variables = {}
         self.functions = {}
         self.structs = {}
+        self.loaded = False  # imported modules run their top level on first use
+    
+    def __repr__(self):
+        return f"<module {self.name}>"
+
+@contextlib.contextmanager
+def gc_paused():
+    """Suspend the cycle collector while building large acyclic structures"""
+    # Tokens and trees hold no reference cycles, so collections triggered by
+    # allocating them only rescan the same objects over and over. The collector
+    # is one for the whole process, so it is left alone while other threads,
+    # such as those of a pool or of tasks, may be allocating
+    if threading.active_count() > 1 or not gc.isenabled():
+        yield
+        return
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.enable()
+
+########################
+# Lexer
+########################
+
+class Token:
+    """Lexical token with its source position"""
+    __slots__ = ('kind', 'text', 'value', 'line', 'col')
+    def __init__(self, kind, text, value, line, col):
+        self.kind = kind  # 'name', 'number', 'string', 'op' or 'newline'
+        self.text = text
+        self.value = value  # decoded value of number and string literals
+        self.line = line
+        self.col = col
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.text!r}, {self.line}:{self.col})"
+
+STRING_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '0': '\0', '\\': '\\', '"': '"', "'": "'"}
+ESCAPE_PATTERN = re.compile(r'\\(.)')
+# Every match starts with the spaces before the token; most frequent kinds first
+TOKEN_PATTERN = re.compile(r"""[ \t\r]*(?:
+    (?P<name>[^\W\d]\w*)
+  | (?P<op>==|!=|<=|>=|\+=|-=|\*=|/=|[=!<>+\-*/%()\[\]{},:.])
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<newline>\n)
+  | (?P<comment>\#[^\n]*)
+  | (?P<end>\Z)
+  | (?P<error>.)
+)""", re.VERBOSE)
+
+def decode_escape(match) -> str:
+    # Unknown escapes are kept as written
+    return STRING_ESCAPES.get(match.group(1), match.group(0))
+
+def lex(code: str) -> Iterator[Token]:
+    """Yield the tokens of code one at a time, ending every line with a newline token"""
+    line = 1
+    line_start = 0
+    for match in TOKEN_PATTERN.finditer(code):
+        kind = match.lastgroup
+        if kind == 'name' or kind == 'op':
+            yield Token(kind, match.group(kind), None, line, match.start(kind) - line_start + 1)
+        elif kind == 'newline':
+            start = match.start(kind)
+            yield Token(kind, '\n', None, line, start - line_start + 1)
+            line += 1
+            line_start = start + 1
+        elif kind == 'number':
+            text = match.group(kind)
+            value = float(text) if '.' in text or 'e' in text or 'E' in text else int(text)
+            yield Token(kind, text, value, line, match.start(kind) - line_start + 1)
+        elif kind == 'string':
+            text = match.group(kind)
+            value = ESCAPE_PATTERN.sub(decode_escape, text[1:-1])
+            yield Token(kind, text, value, line, match.start(kind) - line_start + 1)
+        elif kind == 'end':
+            break
+        elif kind == 'error':
+            text = match.group(kind)
+            col = match.start(kind) - line_start + 1
+            if text in ('"', "'"):
+                raise TourmalineError(f"Unterminated string at line {line}, column {col}")
+            raise TourmalineError(f"Unexpected character '{text}' at line {line}, column {col}")
+    yield Token('newline', '', None, line, len(code) - line_start + 1)
+
+########################
+# Syntax tree
+########################
+
+class Node:
+    """Base class for parsed program nodes"""
+    # Statements also get the column they start at, for execution hooks
+    __slots__ = ('line', 'col')
+
+class Block(Node):
+    """Sequence of statements"""
+    __slots__ = ('statements',)
+    def __init__(self, statements, line):
+        self.statements = statements
+        self.line = line
+
+# Statements that bind a name carry a local slot once resolved inside a function;
+# None means the name is a global
+
+class ImportStatement(Node):
+    __slots__ = ('name', 'slot')
+    def __init__(self, name, line, slot=None):
+        self.name = name
+        self.line = line
+        self.slot = slot
+
+class ModuleImport(Node):
+    __slots__ = ('path', 'name', 'names')
+    def __init__(self, path, name, names, line):
+        self.path = path
+        self.name = name  # the variable `import "path"` binds the module to
+        self.names = names  # the members `from "path" import ...` binds; None for a plain import
+        self.line = line
+
+class LetStatement(Node):
+    __slots__ = ('name', 'value', 'slot')
+    def __init__(self, name, value, line, slot=None):
+        self.name = name
+        self.value = value
+        self.line = line
+        self.slot = slot
+
+class AssignStatement(Node):
+    __slots__ = ('name', 'op', 'value', 'slot')
+    def __init__(self, name, op, value, line, slot=None):
+        self.name = name
+        self.op = op
+        self.value = value
+        self.line = line
+        self.slot = slot
+
+class FunctionDef(Node):
+    __slots__ = ('name', 'params', 'body', 'cached')
+    def __init__(self, name, params, body, line, cached=False):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.line = line
+        self.cached = cached
+
+class StructDef(Node):
+    __slots__ = ('name', 'fields')
+    def __init__(self, name, fields, line):
+        self.name = name
+        self.fields = fields
+        self.line = line
+
+class TryStatement(Node):
+    __slots__ = ('body', 'exception_var', 'handler', 'slot')
+    def __init__(self, body, exception_var, handler, line, slot=None):
+        self.body = body
+        self.exception_var = exception_var
+        self.handler = handler
+        self.line = line
+        self.slot = slot
+
+class IfStatement(Node):
+    __slots__ = ('condition', 'body', 'elif_branches', 'else_body')
+    def __init__(self, condition, body, elif_branches, else_body, line):
+        self.condition = condition
+        self.body = body
+        self.elif_branches = elif_branches  # list of (condition, Block)
+        self.else_body = else_body
+        self.line = line
+
+class WhileStatement(Node):
+    __slots__ = ('condition', 'body')
+    def __init__(self, condition, body, line):
+        self.condition = condition
+        self.body = body
+        self.line = line
+
+class ForStatement(Node):
+    __slots__ = ('var_name', 'iterable', 'body', 'slot')
+    def __init__(self, var_name, iterable, body, line, slot=None):
+        self.var_name = var_name
+        self.iterable = iterable
+        self.body = body
+        self.line = line
+        self.slot = slot
+
+class ReturnStatement(Node):
+    __slots__ = ('value', 'tail')
+    def __init__(self, value, line, tail=False):
+        self.value = value
+        self.line = line
+        self.tail = tail  # value is a call whose result is returned as-is
+
+class SpawnStatement(Node):
+    __slots__ = ('call',)
+    def __init__(self, call, line):
+        self.call = call
+        self.line = line
+
+class ExpressionStatement(Node):
+    __slots__ = ('expr',)
+    def __init__(self, expr, line):
+        self.expr = expr
+        self.line = line
+
+BLOCK_OPENERS = ('if', 'while', 'for', 'function', 'try', 'struct')
+CLAUSE_OWNERS = {'elif': 'if', 'else': 'if', 'except': 'try'}
+ASSIGN_OPS = ('=', '+=', '-=', '*=', '/=')
+
+class TourmalineParser:
+    """Builds a syntax tree from Tourmaline source, lexing it once"""
+    def __init__(self):
+        self.expressions = ExpressionParser()
+        self.source_lines = []
+        self.block_ends = {}
+        self.block_clauses = {}
+
+    def parse(self, code: str) -> Block:
+        """Parse a whole program"""
+        with gc_paused():
+            # Each entry is one line: (line number, token texts, tokens)
+            entries = []
+            tokens = []
+            for token in lex(code):
+                if token.kind != 'newline':
+                    tokens.append(token)
+                elif tokens:
+                    entries.append((tokens[0].line, [t.text for t in tokens], tokens))
+                    tokens = []
+            self.source_lines = code.split('\n')
+            self.block_ends, self.block_clauses = self.scan_blocks(entries)
+            return self.parse_block(entries, 0, len(entries))
+
+    def source_text(self, tokens: List[Token]) -> str:
+        """Source text of a line of tokens, without surrounding spaces or comments"""
+        first, last = tokens[0], tokens[-1]
+        line = self.source_lines[first.line - 1]
+        return line[first.col - 1:last.col - 1 + len(last.text)]
+
+    def scan_blocks(self, entries):
+        """Match every block opener with its clauses and closing 'end' in one pass"""
+        ends = {}
+        clauses = {}
+        open_blocks = []
+        for i, (line_no, words, _) in enumerate(entries):
+            keyword = words[0]
+            if len(words) > 1 and words[1] in ASSIGN_OPS:
+                continue
+            if keyword == 'cached' and len(words) > 1 and words[1] == 'function':
+                keyword = 'function'
+            if keyword in BLOCK_OPENERS:
+                open_blocks.append(i)
+                clauses[i] = []
+            elif keyword == 'end' and len(words) == 1:
+                if not open_blocks:
+                    raise TourmalineError(f"Unexpected 'end' at line {line_no}")
+                ends[open_blocks.pop()] = i
+            elif keyword in CLAUSE_OWNERS:
+                if not open_blocks or entries[open_blocks[-1]][1][0] != CLAUSE_OWNERS[keyword]:
+                    raise TourmalineError(f"Unexpected '{keyword}' at line {line_no}")
+                clauses[open_blocks[-1]].append(i)
+        if open_blocks:
+            line_no, words, _ = entries[open_blocks[-1]]
+            raise TourmalineError(f"Missing 'end' for '{words[0]}' at line {line_no}")
+        return ends, clauses
+
+    def parse_expression(self, tokens: List[Token], line_no: int) -> Node:
+        """Parse expression tokens; malformed expressions raise when evaluated"""
+        try:
+            return self.expressions.parse(tokens, line_no)
+        except TourmalineError as e:
+            return InvalidExpression(str(e), line_no)
+
+    def parse_module_import(self, words: List[str], tokens: List[Token], line_no: int) -> ModuleImport:
+        """`import "path"` or `import "path" as name`"""
+        path = tokens[1].value
+        if len(words) == 4 and words[2] == 'as' and tokens[3].kind == 'name':
+            return ModuleImport(path, words[3], None, line_no)
+        if len(words) != 2:
+            raise TourmalineError(f"Invalid import statement at line {line_no}")
+        # Named after the file, so "lib/utils.trm" is used as utils
+        name = os.path.splitext(os.path.basename(path))[0]
+        if not name.isidentifier():
+            raise TourmalineError(f"Cannot use '{path}' as a name at line {line_no}; write import \"{path}\" as name")
+        return ModuleImport(path, name, None, line_no)
+
+    def parse_block(self, entries, start: int, stop: int) -> Block:
+        """Parse the statements in entries[start:stop]"""
+        statements = []
+        line = entries[start][0] if start < stop else 0
+        i = start
+        while i < stop:
+            col = entries[i][2][0].col
+            statement, i = self.parse_statement(entries, i)
+            statement.col = col
+            statements.append(statement)
+        return Block(statements, line)
+
+    def parse_statement(self, entries, i: int):
+        """Parse the statement starting at entries[i], returning it and the next index"""
+        line_no, words, tokens = entries[i]
+        keyword = words[0]
+
+        # Import statement; a quoted path imports another .trm file
+        if keyword == 'import':
+            if len(words) < 2:
+                raise TourmalineError(f"Invalid import statement at line {line_no}")
+            if tokens[1].kind == 'string':
+                return self.parse_module_import(words, tokens, line_no), i + 1
+            return ImportStatement(words[1], line_no), i + 1
+        if keyword == 'from' and len(words) > 1 and tokens[1].kind == 'string':
+            names = words[3::2]
+            if (len(words) < 4 or words[2] != 'import' or words[4::2] != [','] * (len(names) - 1)
+                    or any(token.kind != 'name' for token in tokens[3::2])):
+                raise TourmalineError(f"Invalid import statement at line {line_no}")
+            return ModuleImport(tokens[1].value, None, names, line_no), i + 1
+
+        # Variable declaration
+        if keyword == 'let':
+            if len(words) < 4 or words[2] != '=':
+                raise TourmalineError(f"Invalid variable declaration at line {line_no}")
+            return LetStatement(words[1], self.parse_expression(tokens[3:], line_no), line_no), i + 1
+
+        # Variable assignment
+        if len(words) >= 3 and words[1] in ASSIGN_OPS:
+            return AssignStatement(words[0], words[1], self.parse_expression(tokens[2:], line_no), line_no), i + 1
+
+        # Function definition, memoized when written `cached function`
+        cached = keyword == 'cached' and len(words) > 1 and words[1] == 'function'
+        if cached:
+            keyword, words = 'function', words[1:]
+        if keyword == 'function':
+            if len(words) < 2:
+                raise TourmalineError(f"Invalid function definition at line {line_no}")
+            params = []
+            if '(' in words:
+                j = words.index('(') + 1
+                while j < len(words) and words[j] != ')':
+                    if words[j] != ',':
+                        params.append(words[j])
+                    j += 1
+            end = self.block_ends[i]
+            body = self.parse_block(entries, i + 1, end)
+            return FunctionDef(words[1], params, body, line_no, cached), end + 1
+
+        # Struct definition
+        if keyword == 'struct':
+            end = self.block_ends[i]
+            fields = [self.source_text(entries[j][2]) for j in range(i + 1, end)]
+            return StructDef(words[1], fields, line_no), end + 1
+
+        # Try-except block
+        if keyword == 'try':
+            end = self.block_ends[i]
+            clauses = self.block_clauses[i]
+            exception_var = None
+            if len(clauses) > 1:
+                raise TourmalineError(f"Unexpected 'except' at line {entries[clauses[1]][0]}")
+            if clauses:
+                except_idx = clauses[0]
+                except_words = entries[except_idx][1]
+                if len(except_words) > 1:
+                    exception_var = except_words[1]
+                body = self.parse_block(entries, i + 1, except_idx)
+                handler = self.parse_block(entries, except_idx + 1, end)
+            else:
+                body = self.parse_block(entries, i + 1, end)
+                handler = None
+            return TryStatement(body, exception_var, handler, line_no), end + 1
+
+        # If statement
+        if keyword == 'if':
+            end = self.block_ends[i]
+            clauses = self.block_clauses[i]
+            bounds = clauses + [end]
+            body = self.parse_block(entries, i + 1, bounds[0])
+            elif_branches = []
+            else_body = None
+            for k, idx in enumerate(clauses):
+                clause_no, clause_words, clause_tokens = entries[idx]
+                clause_body = self.parse_block(entries, idx + 1, bounds[k + 1])
+                if else_body is not None:
+                    raise TourmalineError(f"Unexpected '{clause_words[0]}' after 'else' at line {clause_no}")
+                if clause_words[0] == 'elif':
+                    elif_branches.append((self.parse_expression(clause_tokens[1:], clause_no), clause_body))
+                else:
+                    else_body = clause_body
+            return IfStatement(self.parse_expression(tokens[1:], line_no), body, elif_branches, else_body, line_no), end + 1
+
+        # While loop
+        if keyword == 'while':
+            end = self.block_ends[i]
+            body = self.parse_block(entries, i + 1, end)
+            return WhileStatement(self.parse_expression(tokens[1:], line_no), body, line_no), end + 1
+
+        # For loop
+        if keyword == 'for':
+            if len(words) < 4 or words[2] != 'in':
+                raise TourmalineError(f"Expected 'in' in for loop at line {line_no}")
+            end = self.block_ends[i]
+            body = self.parse_block(entries, i + 1, end)
+            return ForStatement(words[1], self.parse_expression(tokens[3:], line_no), body, line_no), end + 1
+
+        # Return statement
+        if keyword == 'return':
+            value = self.parse_expression(tokens[1:], line_no) if len(words) > 1 else None
+            return ReturnStatement(value, line_no), i + 1
+
+        # Task start; `spawn(...)` on its own is still a call to a function named spawn
+        if keyword == 'spawn' and len(words) > 1 and words[1] != '(':
+            call = self.parse_expression(tokens[1:], line_no)
+            if not isinstance(call, Call):
+                raise TourmalineError(f"Expected a function call after 'spawn' at line {line_no}")
+            return SpawnStatement(call, line_no), i + 1
+
+        if keyword in ('end', 'elif', 'else', 'except'):
+            raise TourmalineError(f"Unexpected '{keyword}' at line {line_no}")
+
+        # Function call or expression
+        return ExpressionStatement(self.parse_expression(tokens, line_no), line_no), i + 1
+
+########################
+# Expression trees
+########################
+
+KEYWORD_CONSTANTS = {'true': True, 'false': False, 'nil': None}
+
+class Constant(Node):
+    __slots__ = ('value',)
+    def __init__(self, value, line):
+        self.value = value
+        self.line = line
+
+class Name(Node):
+    __slots__ = ('name',)
+    def __init__(self, name, line):
+        self.name = name
+        self.line = line
+
+class LocalName(Node):
+    """Function local resolved to a frame slot"""
+    __slots__ = ('name', 'slot')
+    def __init__(self, name, slot, line):
+        self.name = name
+        self.slot = slot
+        self.line = line
+
+class BinaryOp(Node):
+    __slots__ = ('op', 'left', 'right')
+    def __init__(self, op, left, right, line):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.line = line
+
+# Calls carry the builtin or library function they were bound to, if any
+
+class Call(Node):
+    __slots__ = ('name', 'args', 'target')
+    def __init__(self, name, args, line, target=None):
+        self.name = name
+        self.args = args
+        self.line = line
+        self.target = target
+
+class LibraryCall(Node):
+    __slots__ = ('library', 'name', 'args', 'target')
+    def __init__(self, library, name, args, line, target=None):
+        self.library = library
+        self.name = name
+        self.args = args
+        self.line = line
+        self.target = target
+
+class Member(Node):
+    __slots__ = ('obj', 'name')
+    def __init__(self, obj, name, line):
+        self.obj = obj
+        self.name = name
+        self.line = line
+
+class Index(Node):
+    __slots__ = ('obj', 'index')
+    def __init__(self, obj, index, line):
+        self.obj = obj
+        self.index = index
+        self.line = line
+
+class ListLiteral(Node):
+    __slots__ = ('items',)
+    def __init__(self, items, line):
+        self.items = items
+        self.line = line
+
+class DictLiteral(Node):
+    __slots__ = ('pairs',)
+    def __init__(self, pairs, line):
+        self.pairs = pairs  # list of (key, value) nodes
+        self.line = line
+
+class UnaryOp(Node):
+    __slots__ = ('op', 'operand')
+    def __init__(self, op, operand, line):
+        self.op = op
+        self.operand = operand
+        self.line = line
+
+class InvalidExpression(Node):
+    """Expression that could not be parsed; raises its error when evaluated"""
+    __slots__ = ('message',)
+    def __init__(self, message, line):
+        self.message = message
+        self.line = line
+
+# Binding power of binary operators; higher binds tighter
+BINARY_PRECEDENCE = {
+    'or': 1,
+    'and': 2,
+    '==': 4, '!=': 4,
+    '<': 5, '>': 5, '<=': 5, '>=': 5,
+    '+': 6, '-': 6,
+    '*': 7, '/': 7, '%': 7,
+}
+NOT_PRECEDENCE = 3
+
+class ExpressionParser:
+    """Precedence-climbing parser that turns expression tokens into trees in one pass"""
+    def parse(self, tokens: List[Token], line: int) -> Node:
+        self.tokens = tokens
+        self.pos = 0
+        self.line = line
+        if not tokens:
+            self.error("Empty expression")
+        node = self.parse_binary(0)
+        if self.pos < len(tokens):
+            self.error(f"Unexpected '{self.peek()}'")
+        return node
+
+    def error(self, message: str):
+        where = f" at line {self.line}" if self.line else ""
+        raise TourmalineError(f"{message} in expression{where}: {' '.join(t.text for t in self.tokens)}")
+
+    def peek(self) -> Optional[str]:
+        """Text of the current token"""
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos].text
+        return None
+
+    def expect(self, token: str):
+        if self.peek() != token:
+            found = self.peek()
+            self.error(f"Expected '{token}' but found '{found}'" if found else f"Expected '{token}'")
+        self.pos += 1
+
+    def parse_binary(self, min_precedence: int) -> Node:
+        left = self.parse_unary()
+        while True:
+            op = self.peek()
+            precedence = BINARY_PRECEDENCE.get(op)
+            if precedence is None or precedence <= min_precedence:
+                return left
+            self.pos += 1
+            right = self.parse_binary(precedence)
+            left = BinaryOp(op, left, right, self.line)
+
+    def parse_unary(self) -> Node:
+        token = self.peek()
+        if token == 'not':
+            self.pos += 1
+            return UnaryOp('not', self.parse_binary(NOT_PRECEDENCE), self.line)
+        if token == '-':
+            self.pos += 1
+            return UnaryOp('-', self.parse_unary(), self.line)
+        return self.parse_postfix(self.parse_primary())
+
+    def parse_primary(self) -> Node:
+        token = self.peek()
+        if token is None:
+            self.error("Unexpected end")
+        current = self.tokens[self.pos]
+        self.pos += 1
+        
+        if token == '(':
+            node = self.parse_binary(0)
+            self.expect(')')
+            return node
+        if token == '[':
+            return ListLiteral(self.parse_sequence(']'), self.line)
+        if token == '{':
+            return self.parse_dict()
+        if current.kind == 'op' or token in BINARY_PRECEDENCE:
+            self.error(f"Unexpected '{token}'")
+        
+        if current.kind in ('number', 'string'):
+            return Constant(current.value, self.line)
+        if token in KEYWORD_CONSTANTS:
+            return Constant(KEYWORD_CONSTANTS[token], self.line)
+        return Name(token, self.line)
+
+    def parse_sequence(self, closing: str) -> List[Node]:
+        """Parse comma-separated expressions up to the closing bracket"""
+        items = []
+        while self.peek() != closing:
+            items.append(self.parse_binary(0))
+            if self.peek() != ',':
+                break
+            self.pos += 1
+        self.expect(closing)
+        return items
+
+    def parse_dict(self) -> Node:
+        pairs = []
+        while self.peek() != '}':
+            key = self.parse_binary(0)
+            self.expect(':')
+            pairs.append((key, self.parse_binary(0)))
+            if self.peek() != ',':
+                break
+            self.pos += 1
+        self.expect('}')
+        return DictLiteral(pairs, self.line)
+
+    def parse_postfix(self, node: Node) -> Node:
+        """Apply call, member and index suffixes to a primary expression"""
+        while True:
+            token = self.peek()
+            if token == '(':
+                self.pos += 1
+                args = self.parse_sequence(')')
+                if isinstance(node, Name):
+                    node = Call(node.name, args, self.line)
+                elif isinstance(node, Member) and isinstance(node.obj, Name):
+                    node = LibraryCall(node.obj.name, node.name, args, self.line)
+                else:
+                    self.error("Only named functions can be called")
+            elif token == '.':
+                self.pos += 1
+                member = self.peek()
+                if member is None or self.tokens[self.pos].kind != 'name':
+                    self.error("Expected member name after '.'")
+                self.pos += 1
+                node = Member(node, member, self.line)
+            elif token == '[':
+                self.pos += 1
+                index = self.parse_binary(0)
+                self.expect(']')
+                node = Index(node, index, self.line)
+            else:
+                return node
+
+
+########################
+# Optimization
+########################
+
+OPTIMIZE_LEVELS = (0, 1)
+# Builtins without side effects whose result depends only on their arguments
+PURE_BUILTINS = frozenset(('len', 'str', 'int', 'float', 'type', 'abs', 'sqrt', 'pow', 'sin', 'cos', 'tan',
+                           'floor', 'ceil', 'round', 'min', 'max'))
+# Folded values must be immutable, so they can be shared by every evaluation
+FOLDABLE_TYPES = (bool, int, float, str, type(None))
+MAX_FOLDED_SIZE = 4096  # longest string, or widest integer in bits, a fold may produce
+
+def fold_size(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, int):
+        return value.bit_length()
+    return 0
+
+class TourmalineOptimizer:
+    """Folds constant expressions and drops unreachable code (-O1)"""
+    def __init__(self, builtins: Dict[str, Callable], functions: Dict[str, Any]):
+        self.builtins = builtins
+        self.functions = functions
+        self.shadowed = set()
+
+    def optimize(self, program: Block) -> Block:
+        # A user function with a builtin's name replaces it, so calls to it are never folded
+        self.shadowed = set(self.functions) | set(self.defined_functions(program))
+        return self.optimize_block(program)
+
+    def defined_functions(self, block: Block) -> List[str]:
+        names = []
+        for stmt in block.statements:
+            if isinstance(stmt, FunctionDef):
+                names.append(stmt.name)
+                children = [stmt.body]
+            elif isinstance(stmt, ModuleImport):
+                names.extend(stmt.names or ())
+                children = []
+            elif isinstance(stmt, IfStatement):
+                children = [stmt.body] + [body for _, body in stmt.elif_branches] + [stmt.else_body]
+            elif isinstance(stmt, TryStatement):
+                children = [stmt.body, stmt.handler]
+            elif isinstance(stmt, (WhileStatement, ForStatement)):
+                children = [stmt.body]
+            else:
+                children = []
+            for child in children:
+                if child is not None:
+                    names.extend(self.defined_functions(child))
+        return names
+
+    def optimize_block(self, block: Optional[Block]) -> Optional[Block]:
+        if block is None:
+            return None
+        statements = []
+        for stmt in block.statements:
+            for new in self.optimize_statement(stmt):
+                # Statements from the same line replace stmt; others come from a folded if
+                if new.line == stmt.line:
+                    new.col = stmt.col
+                statements.append(new)
+                # Nothing after a return can run
+                if isinstance(new, ReturnStatement):
+                    return Block(statements, block.line)
+        return Block(statements, block.line)
+
+    def optimize_statement(self, stmt: Node) -> List[Node]:
+        """Return the statements that replace stmt"""
+        line = stmt.line
+        if isinstance(stmt, LetStatement):
+            return [LetStatement(stmt.name, self.fold(stmt.value), line)]
+        if isinstance(stmt, AssignStatement):
+            return [AssignStatement(stmt.name, stmt.op, self.fold(stmt.value), line)]
+        if isinstance(stmt, ExpressionStatement):
+            expr = self.fold(stmt.expr)
+            # A lone constant has no effect
+            return [] if isinstance(expr, Constant) else [ExpressionStatement(expr, line)]
+        if isinstance(stmt, IfStatement):
+            return self.optimize_if(stmt)
+        if isinstance(stmt, WhileStatement):
+            condition = self.fold(stmt.condition)
+            if isinstance(condition, Constant) and not condition.value:
+                return []
+            return [WhileStatement(condition, self.optimize_block(stmt.body), line)]
+        if isinstance(stmt, ForStatement):
+            return [ForStatement(stmt.var_name, self.fold(stmt.iterable), self.optimize_block(stmt.body), line)]
+        if isinstance(stmt, ReturnStatement):
+            return [ReturnStatement(self.fold(stmt.value) if stmt.value is not None else None, line)]
+        if isinstance(stmt, TryStatement):
+            return [TryStatement(self.optimize_block(stmt.body), stmt.exception_var,
+                                 self.optimize_block(stmt.handler), line)]
+        if isinstance(stmt, FunctionDef):
+            return [FunctionDef(stmt.name, stmt.params, self.optimize_block(stmt.body), line, stmt.cached)]
+        if isinstance(stmt, SpawnStatement):
+            # Only the arguments: the call itself must run in the new task
+            call = stmt.call
+            return [SpawnStatement(Call(call.name, [self.fold(arg) for arg in call.args], call.line), line)]
+        return [stmt]
+
+    def optimize_if(self, stmt: IfStatement) -> List[Node]:
+        """Drop branches whose condition is constant false, and everything after a constant true one"""
+        branches = []
+        else_body = stmt.else_body
+        for condition, body in [(stmt.condition, stmt.body)] + stmt.elif_branches:
+            condition = self.fold(condition)
+            if not isinstance(condition, Constant):
+                branches.append((condition, body))
+            elif condition.value:
+                else_body = body
+                break
+        else_body = self.optimize_block(else_body)
+        if not branches:
+            # Blocks do not open a scope, so the chosen body can replace the if
+            return else_body.statements if else_body else []
+        branches = [(condition, self.optimize_block(body)) for condition, body in branches]
+        return [IfStatement(branches[0][0], branches[0][1], branches[1:], else_body, stmt.line)]
+
+    def fold(self, node: Node) -> Node:
+        """Return node with its constant sub-expressions evaluated"""
+        line = node.line
+        if isinstance(node, BinaryOp):
+            left = self.fold(node.left)
+            right = self.fold(node.right)
+            if node.op in ('and', 'or') and isinstance(left, Constant):
+                # The left value either decides the result or is discarded
+                if (node.op == 'and') == bool(left.value):
+                    return right
+                return left
+            if isinstance(left, Constant) and isinstance(right, Constant) and node.op in BINARY_OPERATORS:
+                folded = self.constant(BINARY_OPERATORS[node.op], [left.value, right.value], node.op, line)
+                if folded is not None:
+                    return folded
+            return BinaryOp(node.op, left, right, line)
+        if isinstance(node, UnaryOp):
+            operand = self.fold(node.operand)
+            if isinstance(operand, Constant):
+                folded = self.constant(UNARY_OPERATORS[node.op], [operand.value], node.op, line)
+                if folded is not None:
+                    return folded
+            return UnaryOp(node.op, operand, line)
+        if isinstance(node, Call):
+            args = [self.fold(arg) for arg in node.args]
+            if (node.name in PURE_BUILTINS and node.name in self.builtins and node.name not in self.shadowed
+                    and all(isinstance(arg, Constant) for arg in args)):
+                folded = self.constant(self.builtins[node.name], [arg.value for arg in args], node.name, line)
+                if folded is not None:
+                    return folded
+            return Call(node.name, args, line)
+        if isinstance(node, LibraryCall):
+            return LibraryCall(node.library, node.name, [self.fold(arg) for arg in node.args], line)
+        if isinstance(node, Member):
+            return Member(self.fold(node.obj), node.name, line)
+        if isinstance(node, Index):
+            return Index(self.fold(node.obj), self.fold(node.index), line)
+        if isinstance(node, ListLiteral):
+            return ListLiteral([self.fold(item) for item in node.items], line)
+        if isinstance(node, DictLiteral):
+            return DictLiteral([(self.fold(key), self.fold(value)) for key, value in node.pairs], line)
+        return node
+
+    def constant(self, func: Callable, args: List[Any], op: str, line: int) -> Optional[Constant]:
+        """Evaluate func(*args) now, or return None to leave it for run time"""
+        # Refuse before computing anything that would be too large to keep
+        if op in ('*', 'pow') and len(args) == 2:
+            a, b = args
+            if isinstance(b, str):
+                a, b = b, a
+            if isinstance(a, str) and isinstance(b, int) and len(a) * b > MAX_FOLDED_SIZE:
+                return None
+            if op == '*' and isinstance(a, int) and isinstance(b, int) and a.bit_length() + b.bit_length() > MAX_FOLDED_SIZE:
+                return None
+            if op == 'pow' and isinstance(a, int) and isinstance(b, int) and a.bit_length() * b > MAX_FOLDED_SIZE:
+                return None
+        try:
+            value = func(*args)
+        except Exception:
+            # Errors are raised at run time, where the program expects them
+            return None
+        if type(value) not in FOLDABLE_TYPES or fold_size(value) > MAX_FOLDED_SIZE:
+            return None
+        return Constant(value, line)
+
+########################
+# Name resolution
+########################
+
+def assigned_names(block: Block) -> List[str]:
+    """Names bound anywhere in a function body, excluding nested functions"""
+    names = []
+    for stmt in block.statements:
+        if isinstance(stmt, (LetStatement, AssignStatement, ImportStatement)):
+            names.append(stmt.name)
+        elif isinstance(stmt, ForStatement):
+            names.append(stmt.var_name)
+            names.extend(assigned_names(stmt.body))
+        elif isinstance(stmt, WhileStatement):
+            names.extend(assigned_names(stmt.body))
+        elif isinstance(stmt, IfStatement):
+            names.extend(assigned_names(stmt.body))
+            for _, body in stmt.elif_branches:
+                names.extend(assigned_names(body))
+            if stmt.else_body:
+                names.extend(assigned_names(stmt.else_body))
+        elif isinstance(stmt, TryStatement):
+            if stmt.exception_var:
+                names.append(stmt.exception_var)
+            names.extend(assigned_names(stmt.body))
+            if stmt.handler:
+                names.extend(assigned_names(stmt.handler))
+    return names
+
+def local_names(params: List[str], body: Block) -> List[str]:
+    """Slot layout of a function frame: parameters first, then other locals"""
+    names = list(params)
+    for name in assigned_names(body):
+        if name not in names:
+            names.append(name)
+    return names
+
+class TourmalineResolver:
+    """Binds function locals to frame slots and calls to the builtins they name"""
+    def __init__(self, builtins: Dict[str, Callable], load_library: Callable[[str], Optional[Dict[str, Callable]]]):
+        self.builtins = builtins
+        self.load_library = load_library
+
+    def bind_builtin(self, name: str) -> Optional[Callable]:
+        return self.builtins.get(name)
+
+    def bind_library(self, library: str, name: str) -> Optional[Callable]:
+        table = self.load_library(library)
+        return table.get(name) if table is not None else None
+
+    def resolve_program(self, program: Block) -> Block:
+        return self.resolve_block(program, {}, False)
+
+    def resolve_function(self, func: FunctionDef) -> Tuple[Block, List[str]]:
+        """Return the resolved body and the frame layout of a function"""
+        names = local_names(func.params, func.body)
+        slots = {name: i for i, name in enumerate(names)}
+        return self.resolve_block(func.body, slots, True), names
+
+    def is_tail_call(self, value: Optional[Node]) -> bool:
+        """Whether a returned value can be a tail call to a user function"""
+        return isinstance(value, Call) and self.bind_builtin(value.name) is None
+
+    # `tail` says whether returns in the block may reuse the caller's frame:
+    # only inside functions, and never inside a try body
+    def resolve_block(self, block: Optional[Block], slots: Dict[str, int], tail: bool) -> Optional[Block]:
+        if block is None:
+            return None
+        statements = []
+        for stmt in block.statements:
+            resolved = self.resolve_statement(stmt, slots, tail)
+            resolved.col = stmt.col
+            statements.append(resolved)
+        return Block(statements, block.line)
+
+    def resolve_statement(self, stmt: Node, slots: Dict[str, int], tail: bool) -> Node:
+        line = stmt.line
+        if isinstance(stmt, LetStatement):
+            return LetStatement(stmt.name, self.resolve(stmt.value, slots), line, slots.get(stmt.name))
+        if isinstance(stmt, AssignStatement):
+            return AssignStatement(stmt.name, stmt.op, self.resolve(stmt.value, slots), line, slots.get(stmt.name))
+        if isinstance(stmt, ExpressionStatement):
+            return ExpressionStatement(self.resolve(stmt.expr, slots), line)
+        if isinstance(stmt, IfStatement):
+            return IfStatement(self.resolve(stmt.condition, slots), self.resolve_block(stmt.body, slots, tail),
+                               [(self.resolve(condition, slots), self.resolve_block(body, slots, tail))
+                                for condition, body in stmt.elif_branches],
+                               self.resolve_block(stmt.else_body, slots, tail), line)
+        if isinstance(stmt, WhileStatement):
+            return WhileStatement(self.resolve(stmt.condition, slots), self.resolve_block(stmt.body, slots, tail), line)
+        if isinstance(stmt, ForStatement):
+            return ForStatement(stmt.var_name, self.resolve(stmt.iterable, slots),
+                                self.resolve_block(stmt.body, slots, tail), line, slots.get(stmt.var_name))
+        if isinstance(stmt, ReturnStatement):
+            value = self.resolve(stmt.value, slots) if stmt.value is not None else None
+            return ReturnStatement(value, line, tail and self.is_tail_call(value))
+        if isinstance(stmt, TryStatement):
+            return TryStatement(self.resolve_block(stmt.body, slots, False), stmt.exception_var,
+                                self.resolve_block(stmt.handler, slots, tail), line, slots.get(stmt.exception_var))
+        if isinstance(stmt, ImportStatement):
+            return ImportStatement(stmt.name, line, slots.get(stmt.name))
+        if isinstance(stmt, SpawnStatement):
+            return SpawnStatement(self.resolve(stmt.call, slots), line)
+        # Function and struct definitions are resolved when they run
+        return stmt
+
+    def resolve(self, node: Node, slots: Dict[str, int]) -> Node:
+        line = node.line
+        if isinstance(node, Name):
+            if node.name in slots:
+                return LocalName(node.name, slots[node.name], line)
+            return node
+        if isinstance(node, BinaryOp):
+            return BinaryOp(node.op, self.resolve(node.left, slots), self.resolve(node.right, slots), line)
+        if isinstance(node, UnaryOp):
+            return UnaryOp(node.op, self.resolve(node.operand, slots), line)
+        if isinstance(node, Call):
+            return Call(node.name, [self.resolve(arg, slots) for arg in node.args], line,
+                        self.bind_builtin(node.name))
+        if isinstance(node, LibraryCall):
+            return LibraryCall(node.library, node.name, [self.resolve(arg, slots) for arg in node.args], line,
+                               self.bind_library(node.library, node.name))
+        if isinstance(node, Member):
+            return Member(self.resolve(node.obj, slots), node.name, line)
+        if isinstance(node, Index):
+            return Index(self.resolve(node.obj, slots), self.resolve(node.index, slots), line)
+        if isinstance(node, ListLiteral):
+            return ListLiteral([self.resolve(item, slots) for item in node.items], line)
+        if isinstance(node, DictLiteral):
+            return DictLiteral([(self.resolve(key, slots), self.resolve(value, slots))
+                                for key, value in node.pairs], line)
+        return node
+
+########################
+# Bytecode compiler and virtual machine
+########################
+
+# Opcodes; the argument of every instruction follows it in the code list. They are
+# numbered from the most to the least often run, in groups the VM tells apart with
+# one comparison before testing opcodes one by one. Superinstructions such as
+# BINARY_OP_CONST do the work of a common sequence in one trip through the loop.
+LOAD_FAST = 0
+LOAD_NAME = 1
+BINARY_OP_CONST = 2  # LOAD_CONST + BINARY_OP
+LOAD_CONST = 3
+BINARY_OP = 4
+POP_JUMP_IF_FALSE = 5
+POP_JUMP_IF_TRUE = 6  # closes a while loop, so each pass takes one jump instead of two
+STORE_FAST = 7
+STORE_NAME = 8
+JUMP = 9
+
+INPLACE_ADD_FAST_CONST = 10  # CHECK_FAST + LOAD_CONST + INPLACE_ADD_FAST
+INPLACE_ADD_NAME_CONST = 11  # CHECK_NAME + LOAD_CONST + INPLACE_ADD_NAME
+CHECK_FAST = 12
+CHECK_NAME = 13
+INPLACE_ADD_FAST = 14
+INPLACE_ADD_NAME = 15
+ASSIGN_FAST = 16
+FOR_ITER = 17
+BINARY_SUBSCR = 18
+LOAD_ATTR = 19
+
+CALL_FUNCTION = 20
+RETURN_VALUE = 21
+CALL_BUILTIN = 22
+CALL_LIBRARY = 23
+TAIL_CALL = 24
+POP_TOP = 25
+POP_BLOCK = 26
+UNARY_OP = 27
+INPLACE_OP = 28
+
+JUMP_IF_FALSE_OR_POP = 29
+JUMP_IF_TRUE_OR_POP = 30
+SETUP_EXCEPT = 31
+GET_ITER = 32
+BUILD_LIST = 33
+BUILD_MAP = 34
+MAKE_FUNCTION = 35
+SPAWN = 36
+IMPORT_NAME = 37
+IMPORT_MODULE = 38
+DEFINE_STRUCT = 39
+RAISE_ERROR = 40
+LINE = 41  # only emitted while hooks are registered
+
+OPNAMES = (
+    'LOAD_FAST', 'LOAD_NAME', 'BINARY_OP_CONST', 'LOAD_CONST', 'BINARY_OP', 'POP_JUMP_IF_FALSE',
+    'POP_JUMP_IF_TRUE', 'STORE_FAST', 'STORE_NAME', 'JUMP', 'INPLACE_ADD_FAST_CONST',
+    'INPLACE_ADD_NAME_CONST', 'CHECK_FAST', 'CHECK_NAME', 'INPLACE_ADD_FAST', 'INPLACE_ADD_NAME',
+    'ASSIGN_FAST', 'FOR_ITER', 'BINARY_SUBSCR', 'LOAD_ATTR', 'CALL_FUNCTION', 'RETURN_VALUE',
+    'CALL_BUILTIN', 'CALL_LIBRARY', 'TAIL_CALL', 'POP_TOP', 'POP_BLOCK', 'UNARY_OP', 'INPLACE_OP',
+    'JUMP_IF_FALSE_OR_POP', 'JUMP_IF_TRUE_OR_POP', 'SETUP_EXCEPT', 'GET_ITER', 'BUILD_LIST',
+    'BUILD_MAP', 'MAKE_FUNCTION', 'SPAWN', 'IMPORT_NAME', 'IMPORT_MODULE', 'DEFINE_STRUCT',
+    'RAISE_ERROR', 'LINE',
+)
+
+BINARY_OPS = ('+', '-', '*', '/', '%', '==', '!=', '<', '>', '<=', '>=')
+BINARY_FUNCS = (
+    operator.add, operator.sub, operator.mul, operator.truediv, operator.mod,
+    operator.eq, operator.ne, operator.lt, operator.gt, operator.le, operator.ge,
+)
+BINARY_OPERATORS = dict(zip(BINARY_OPS, BINARY_FUNCS))
+UNARY_OPS = ('-', 'not')
+UNARY_FUNCS = (operator.neg, operator.not_)
+UNARY_OPERATORS = dict(zip(UNARY_OPS, UNARY_FUNCS))
+INPLACE_OPS = ('+=', '-=', '*=', '/=')
+INPLACE_FUNCS = (operator.iadd, operator.isub, operator.imul, operator.itruediv)
+INPLACE_OPERATORS = dict(zip(INPLACE_OPS, INPLACE_FUNCS))
+
+def add_in_place(target, key, piece):
+    """target[key] += piece, extending strings in place where possible"""
+    value = target[key]
+    if type(value) is str and type(piece) is str:
+        # With the container's reference gone CPython can grow the string
+        # instead of copying it, so building text with += takes linear time
+        target[key] = None
+        value += piece
+    else:
+        value = operator.iadd(value, piece)
+    target[key] = value
+
+UNSET = object()
+
+class Frame:
+    """Activation record of code running on the VM"""
+    __slots__ = ('name', 'code_obj', 'fast', 'stack', 'blocks', 'pc', 'memo')
+    def __init__(self, name, code_obj, args):
+        self.name = name  # function the caller asked for, kept across tail calls
+        self.code_obj = code_obj
+        self.fast = list(args) + [UNSET] * (len(code_obj.local_names) - len(args))
+        self.stack = []
+        self.blocks = []
+        self.pc = 0
+        self.memo = None  # (MemoCache, key) pairs to store the result under
+
+class CodeObject:
+    """Compiled bytecode for a program or function body"""
+    __slots__ = ('name', 'params', 'code', 'consts', 'names', 'local_names', 'lines', 'swallows', 'traced')
+    def __init__(self, name, params, code, consts, names, local_names, lines, swallows):
+        self.name = name
+        self.params = params
+        self.code = code
+        self.consts = consts
+        self.names = names
+        self.local_names = local_names
+        self.lines = lines  # source line of each instruction
+        # (start, end, stack depth) of each bare expression, whose errors are discarded
+        # by jumping to end; a table instead of instructions costs nothing until one fails
+        self.swallows = swallows
+        self.traced = None  # a function body with LINE instructions, see traced_body
+
+    def disassemble(self) -> str:
+        """Return a readable listing of the bytecode"""
+        out = [f"<code {self.name}>"]
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc + 1]
+            if op in (LOAD_CONST, CALL_FUNCTION, TAIL_CALL, MAKE_FUNCTION, DEFINE_STRUCT, RAISE_ERROR, SPAWN,
+                      IMPORT_MODULE, LINE):
+                detail = repr(self.consts[arg])
+            elif op == CALL_BUILTIN:
+                detail = repr(self.consts[arg][0::2])
+            elif op == CALL_LIBRARY:
+                detail = repr(self.consts[arg][:3])
+            elif op in (LOAD_NAME, STORE_NAME, CHECK_NAME, LOAD_ATTR, IMPORT_NAME, INPLACE_ADD_NAME):
+                detail = self.names[arg]
+            elif op in (LOAD_FAST, STORE_FAST, CHECK_FAST, ASSIGN_FAST, INPLACE_ADD_FAST):
+                detail = self.local_names[arg]
+            elif op == BINARY_OP:
+                detail = BINARY_OPS[arg]
+            elif op == BINARY_OP_CONST:
+                func, value = self.consts[arg]
+                detail = f"{BINARY_OPS[BINARY_FUNCS.index(func)]} {value!r}"
+            elif op == INPLACE_ADD_FAST_CONST:
+                slot, value = self.consts[arg]
+                detail = f"{self.local_names[slot]} += {value!r}"
+            elif op == INPLACE_ADD_NAME_CONST:
+                detail = f"{self.consts[arg][0]} += {self.consts[arg][1]!r}"
+            elif op == UNARY_OP:
+                detail = UNARY_OPS[arg]
+            elif op == INPLACE_OP:
+                detail = INPLACE_OPS[arg]
+            else:
+                detail = ''
+            out.append(f"{self.lines[pc // 2]:>5} {pc:>5} {OPNAMES[op]:<18} {arg:<4} {detail}")
+        for start, end, _ in self.swallows:
+            out.append(f"errors in {start}-{end - 2} are discarded, resuming at {end}")
+        return '\n'.join(out)
+
+class CodeUnit:
+    """Bytecode under construction for one program or function"""
+    def __init__(self, name, params, local_names):
+        self.name = name
+        self.params = params
+        self.code = []
+        self.lines = []
+        self.consts = []
+        self.const_index = {}
+        self.names = []
+        self.name_index = {}
+        self.local_names = local_names
+        self.local_index = {n: i for i, n in enumerate(local_names)}
+        self.tail_calls = False  # whether a return may reuse the frame
+        self.iterators = 0  # iterators of the enclosing for loops, on the stack under each statement
+        self.swallows = []
+
+    def emit(self, op: int, arg: int, line: int) -> int:
+        """Append an instruction and return its position"""
+        self.code.append(op)
+        self.code.append(arg)
+        self.lines.append(line)
+        return len(self.code) - 2
+
+    def here(self) -> int:
+        return len(self.code)
+
+    def patch(self, position: int, target: int):
+        self.code[position + 1] = target
+
+    def add_const(self, value) -> int:
+        if isinstance(value, (str, int, float, bool, type(None))):
+            key = (type(value), repr(value))
+        else:
+            key = (type(value), id(value))
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def add_name(self, name: str) -> int:
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def finish(self) -> CodeObject:
+        return CodeObject(self.name, self.params, self.code, tuple(self.consts),
+                          tuple(self.names), tuple(self.local_names), self.lines, tuple(self.swallows))
+
+def swallow_target(frame: Frame) -> Optional[Tuple[int, int]]:
+    """Where a frame resumes when its current instruction failed in a bare expression,
+    with the stack depth to cut back to; None if the error is not discarded there"""
+    pc = frame.pc - 2  # the pc has already moved past the failing instruction
+    for start, end, depth in frame.code_obj.swallows:
+        if start <= pc < end:
+            return end, depth
+    return None
+
+class TourmalineCompiler:
+    """Lowers parsed programs to bytecode for TourmalineVM"""
+    def __init__(self, resolver: TourmalineResolver):
+        self.resolver = resolver
+        self.trace_lines = False  # emit a LINE instruction before each statement
+
+    def compile_program(self, program: Block) -> CodeObject:
+        unit = CodeUnit('<program>', [], [])
+        self.compile_block(unit, program)
+        unit.emit(LOAD_CONST, unit.add_const(None), 0)
+        unit.emit(RETURN_VALUE, 0, 0)
+        return unit.finish()
+
+    def compile_function(self, func: FunctionDef, traced: bool = False) -> CodeObject:
+        # Bodies are compiled without LINE instructions even while tracing, so
+        # the function runs at full speed once the hooks are removed
+        unit = CodeUnit(func.name, list(func.params), local_names(func.params, func.body))
+        unit.tail_calls = True
+        trace_lines, self.trace_lines = self.trace_lines, traced
+        try:
+            self.compile_block(unit, func.body)
+        finally:
+            self.trace_lines = trace_lines
+        unit.emit(LOAD_CONST, unit.add_const(None), func.line)
+        unit.emit(RETURN_VALUE, 0, func.line)
+        return unit.finish()
+
+    def function_code(self, func: TourmalineFunction) -> CodeObject:
+        """The body of func as bytecode, compiled on first use for tree walker functions"""
+        if func.code is None:
+            func.code = self.compile_function(func.definition)
+        return func.code
+
+    def traced_body(self, func: TourmalineFunction) -> CodeObject:
+        """The body of func with a LINE instruction before each statement, for traced calls"""
+        body = self.function_code(func)
+        if body.traced is None:
+            body.traced = self.compile_function(func.definition, traced=True)
+        return body.traced
+
+    def emit_load(self, unit: CodeUnit, name: str, line: int):
+        if name in unit.local_index:
+            unit.emit(LOAD_FAST, unit.local_index[name], line)
+        else:
+            unit.emit(LOAD_NAME, unit.add_name(name), line)
+
+    def emit_store(self, unit: CodeUnit, name: str, line: int):
+        if name in unit.local_index:
+            unit.emit(STORE_FAST, unit.local_index[name], line)
+        else:
+            unit.emit(STORE_NAME, unit.add_name(name), line)
+
+    def compile_block(self, unit: CodeUnit, block: Block):
+        for stmt in block.statements:
+            self.compile_statement(unit, stmt)
+
+    def compile_statement(self, unit: CodeUnit, stmt: Node):
+        line = stmt.line
+        if self.trace_lines:
+            unit.emit(LINE, unit.add_const((line, stmt.col)), line)
+        if isinstance(stmt, LetStatement):
+            self.compile_expression(unit, stmt.value)
+            self.emit_store(unit, stmt.name, line)
+        
+        elif isinstance(stmt, AssignStatement) and stmt.op == '+=' and isinstance(stmt.value, Constant):
+            if stmt.name in unit.local_index:
+                target = (unit.local_index[stmt.name], stmt.value.value)
+                unit.emit(INPLACE_ADD_FAST_CONST, unit.add_const(target), line)
+            else:
+                unit.emit(INPLACE_ADD_NAME_CONST, unit.add_const((stmt.name, stmt.value.value)), line)
+        
+        elif isinstance(stmt, AssignStatement):
+            if stmt.name in unit.local_index:
+                unit.emit(CHECK_FAST, unit.local_index[stmt.name], line)
+            else:
+                unit.emit(CHECK_NAME, unit.add_name(stmt.name), line)
+            if stmt.op == '+=':
+                # Adds into the variable itself; see add_in_place
+                self.compile_expression(unit, stmt.value)
+                if stmt.name in unit.local_index:
+                    unit.emit(INPLACE_ADD_FAST, unit.local_index[stmt.name], line)
+                else:
+                    unit.emit(INPLACE_ADD_NAME, unit.add_name(stmt.name), line)
+            else:
+                if stmt.op == '=':
+                    self.compile_expression(unit, stmt.value)
+                else:
+                    self.emit_load(unit, stmt.name, line)
+                    self.compile_expression(unit, stmt.value)
+                    unit.emit(INPLACE_OP, INPLACE_OPS.index(stmt.op), line)
+                if stmt.name in unit.local_index:
+                    unit.emit(ASSIGN_FAST, unit.local_index[stmt.name], line)
+                else:
+                    unit.emit(STORE_NAME, unit.add_name(stmt.name), line)
+        
+        elif isinstance(stmt, ExpressionStatement):
+            # Errors in bare expressions are discarded, as in the tree walker
+            start = unit.here()
+            self.compile_expression(unit, stmt.expr)
+            unit.emit(POP_TOP, 0, line)
+            unit.swallows.append((start, unit.here(), unit.iterators))
+        
+        elif isinstance(stmt, IfStatement):
+            end_jumps = []
+            branches = [(stmt.condition, stmt.body)] + stmt.elif_branches
+            for k, (condition, body) in enumerate(branches):
+                self.compile_expression(unit, condition)
+                skip = unit.emit(POP_JUMP_IF_FALSE, 0, condition.line)
+                self.compile_block(unit, body)
+                if stmt.else_body or k < len(branches) - 1:
+                    end_jumps.append(unit.emit(JUMP, 0, condition.line))
+                unit.patch(skip, unit.here())
+            if stmt.else_body:
+                self.compile_block(unit, stmt.else_body)
+            for jump in end_jumps:
+                unit.patch(jump, unit.here())
+        
+        elif isinstance(stmt, WhileStatement):
+            # The condition goes after the body, so each pass ends with one jump back
+            enter = unit.emit(JUMP, 0, line)
+            top = unit.here()
+            self.compile_block(unit, stmt.body)
+            unit.patch(enter, unit.here())
+            self.compile_expression(unit, stmt.condition)
+            unit.emit(POP_JUMP_IF_TRUE, top, line)
+        
+        elif isinstance(stmt, ForStatement):
+            # Like while loops, the test for another pass comes after the body
+            self.compile_expression(unit, stmt.iterable)
+            unit.emit(GET_ITER, 0, line)
+            enter = unit.emit(JUMP, 0, line)
+            top = unit.here()
+            self.emit_store(unit, stmt.var_name, line)
+            unit.iterators += 1
+            self.compile_block(unit, stmt.body)
+            unit.iterators -= 1
+            unit.patch(enter, unit.here())
+            unit.emit(FOR_ITER, top, line)
+        
+        elif isinstance(stmt, ReturnStatement):
+            if unit.tail_calls and self.resolver.is_tail_call(stmt.value):
+                # Falls through to RETURN_VALUE when the callee is not a user function
+                for arg in stmt.value.args:
+                    self.compile_expression(unit, arg)
+                unit.emit(TAIL_CALL, unit.add_const((stmt.value.name, len(stmt.value.args))), line)
+            elif stmt.value is not None:
+                self.compile_expression(unit, stmt.value)
+            else:
+                unit.emit(LOAD_CONST, unit.add_const(None), line)
+            unit.emit(RETURN_VALUE, 0, line)
+        
+        elif isinstance(stmt, TryStatement):
+            setup = unit.emit(SETUP_EXCEPT, 0, line)
+            # Errors from a call in the body must reach this handler
+            tail_calls, unit.tail_calls = unit.tail_calls, False
+            self.compile_block(unit, stmt.body)
+            unit.tail_calls = tail_calls
+            unit.emit(POP_BLOCK, 0, line)
+            skip = unit.emit(JUMP, 0, line)
+            unit.patch(setup, unit.here())
+            # The handler starts with the error message on the stack
+            if stmt.exception_var:
+                self.emit_store(unit, stmt.exception_var, line)
+            else:
+                unit.emit(POP_TOP, 0, line)
+            if stmt.handler:
+                self.compile_block(unit, stmt.handler)
+            unit.patch(skip, unit.here())
+        
+        elif isinstance(stmt, FunctionDef):
+            code_obj = self.compile_function(stmt)
+            func = TourmalineFunction(stmt.name, stmt.params, code_obj, code_obj.local_names, stmt, stmt.cached)
+            unit.emit(MAKE_FUNCTION, unit.add_const(func), line)
+        
+        elif isinstance(stmt, ImportStatement):
+            unit.emit(IMPORT_NAME, unit.add_name(stmt.name), line)
+            self.emit_store(unit, stmt.name, line)
+        
+        elif isinstance(stmt, ModuleImport):
+            unit.emit(IMPORT_MODULE, unit.add_const((stmt.path, stmt.name, stmt.names)), line)
+        
+        elif isinstance(stmt, SpawnStatement):
+            for arg in stmt.call.args:
+                self.compile_expression(unit, arg)
+            unit.emit(SPAWN, unit.add_const((stmt.call.name, len(stmt.call.args))), line)
+        
+        elif isinstance(stmt, StructDef):
+            unit.emit(DEFINE_STRUCT, unit.add_const((stmt.name, tuple(stmt.fields))), line)
+        
+        else:
+            raise TourmalineError(f"Cannot compile {type(stmt).__name__}")
+
+    def compile_expression(self, unit: CodeUnit, node: Node):
+        line = node.line
+        if isinstance(node, Constant):
+            unit.emit(LOAD_CONST, unit.add_const(node.value), line)
+        elif isinstance(node, Name):
+            self.emit_load(unit, node.name, line)
+        elif isinstance(node, BinaryOp):
+            self.compile_expression(unit, node.left)
+            if node.op in ('and', 'or'):
+                # Short-circuit: keep the left value if it decides the result
+                jump_op = JUMP_IF_FALSE_OR_POP if node.op == 'and' else JUMP_IF_TRUE_OR_POP
+                jump = unit.emit(jump_op, 0, line)
+                self.compile_expression(unit, node.right)
+                unit.patch(jump, unit.here())
+            elif isinstance(node.right, Constant):
+                func = BINARY_FUNCS[BINARY_OPS.index(node.op)]
+                unit.emit(BINARY_OP_CONST, unit.add_const((func, node.right.value)), line)
+            else:
+                self.compile_expression(unit, node.right)
+                unit.emit(BINARY_OP, BINARY_OPS.index(node.op), line)
+        elif isinstance(node, UnaryOp):
+            self.compile_expression(unit, node.operand)
+            unit.emit(UNARY_OP, UNARY_OPS.index(node.op), line)
+        elif isinstance(node, Call):
+            for arg in node.args:
+                self.compile_expression(unit, arg)
+            builtin = self.resolver.bind_builtin(node.name)
+            if builtin is not None:
+                unit.emit(CALL_BUILTIN, unit.add_const((node.name, builtin, len(node.args))), line)
+            else:
+                unit.emit(CALL_FUNCTION, unit.add_const((node.name, len(node.args))), line)
+        elif isinstance(node, LibraryCall):
+            for arg in node.args:
+                self.compile_expression(unit, arg)
+            target = self.resolver.bind_library(node.library, node.name)
+            unit.emit(CALL_LIBRARY, unit.add_const((node.library, node.name, len(node.args), target)), line)
+        elif isinstance(node, Member):
+            self.compile_expression(unit, node.obj)
+            unit.emit(LOAD_ATTR, unit.add_name(node.name), line)
+        elif isinstance(node, Index):
+            self.compile_expression(unit, node.obj)
+            self.compile_expression(unit, node.index)
+            unit.emit(BINARY_SUBSCR, 0, line)
+        elif isinstance(node, ListLiteral):
+            for item in node.items:
+                self.compile_expression(unit, item)
+            unit.emit(BUILD_LIST, len(node.items), line)
+        elif isinstance(node, DictLiteral):
+            for key, value in node.pairs:
+                self.compile_expression(unit, key)
+                self.compile_expression(unit, value)
+            unit.emit(BUILD_MAP, len(node.pairs), line)
+        elif isinstance(node, InvalidExpression):
+            unit.emit(RAISE_ERROR, unit.add_const(node.message), line)
+        else:
+            raise TourmalineError(f"Cannot compile {type(node).__name__}")
+
+class TourmalineVM:
+    """Stack-based virtual machine running compiled Tourmaline code"""
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+
+    def run(self, code_obj: CodeObject, args: List[Any] = ()) -> Any:
+        """Execute a code object and return its result"""
+        # User function calls switch frames in this loop instead of recursing,
+        # so only max_depth limits how deep calls can nest
+        interp = self.interpreter
+        variables = interp.variables
+        functions = interp.functions
+        module = interp.module
+        entry_depth = interp.depth
+        tracer = interp.tracer
+        traced_body = interp.compiler.traced_body
+        function_code = interp.compiler.function_code
+        callers = []  # suspended frames, innermost last
+        frame = Frame(code_obj.name, code_obj, args)
+        
+        try:
+            while True:
+                # Calls and returns break out of the dispatch loop to switch frames
+                code_obj = frame.code_obj
+                code = code_obj.code
+                consts = code_obj.consts
+                names = code_obj.names
+                local_names = code_obj.local_names
+                fast = frame.fast
+                stack = frame.stack
+                push = stack.append
+                pop = stack.pop
+                blocks = frame.blocks
+                pc = frame.pc
+                
+                try:
+                    while True:
+                        op = code[pc]
+                        arg = code[pc + 1]
+                        pc += 2
+                        
+                        if op < INPLACE_ADD_FAST_CONST:
+                            if op == LOAD_FAST:
+                                value = fast[arg]
+                                if value is UNSET:
+                                    value = interp.lookup_variable(local_names[arg])
+                                push(value)
+                            elif op == LOAD_NAME:
+                                name = names[arg]
+                                if name in variables:
+                                    push(variables[name])
+                                else:
+                                    push(interp.lookup_variable(name))
+                            elif op == BINARY_OP_CONST:
+                                func, right = consts[arg]
+                                stack[-1] = func(stack[-1], right)
+                            elif op == LOAD_CONST:
+                                push(consts[arg])
+                            elif op == BINARY_OP:
+                                right = pop()
+                                stack[-1] = BINARY_FUNCS[arg](stack[-1], right)
+                            elif op == POP_JUMP_IF_FALSE:
+                                if not pop():
+                                    pc = arg
+                            elif op == POP_JUMP_IF_TRUE:
+                                if pop():
+                                    pc = arg
+                            elif op == STORE_FAST:
+                                fast[arg] = pop()
+                            elif op == STORE_NAME:
+                                variables[names[arg]] = pop()
+                            elif op == JUMP:
+                                pc = arg
+                        elif op < CALL_FUNCTION:
+                            if op == INPLACE_ADD_FAST_CONST:
+                                slot, right = consts[arg]
+                                if fast[slot] is UNSET:
+                                    name = local_names[slot]
+                                    if name not in variables:
+                                        raise TourmalineError(f"Variable '{name}' not declared")
+                                    add_in_place(variables, name, right)
+                                elif type(right) is str:
+                                    add_in_place(fast, slot, right)
+                                else:
+                                    fast[slot] += right
+                            elif op == INPLACE_ADD_NAME_CONST:
+                                name, right = consts[arg]
+                                if name not in variables:
+                                    raise TourmalineError(f"Variable '{name}' not declared")
+                                if type(right) is str:
+                                    add_in_place(variables, name, right)
+                                else:
+                                    variables[name] += right
+                            elif op == CHECK_FAST:
+                                if fast[arg] is UNSET and local_names[arg] not in variables:
+                                    raise TourmalineError(f"Variable '{local_names[arg]}' not declared")
+                            elif op == CHECK_NAME:
+                                if names[arg] not in variables:
+                                    raise TourmalineError(f"Variable '{names[arg]}' not declared")
+                            elif op == INPLACE_ADD_FAST:
+                                right = pop()
+                                # Until the local is bound, += updates the global
+                                if fast[arg] is UNSET:
+                                    add_in_place(variables, local_names[arg], right)
+                                elif type(right) is str:
+                                    add_in_place(fast, arg, right)
+                                else:
+                                    fast[arg] += right
+                            elif op == INPLACE_ADD_NAME:
+                                right = pop()
+                                if type(right) is str:
+                                    add_in_place(variables, names[arg], right)
+                                else:
+                                    variables[names[arg]] += right
+                            elif op == ASSIGN_FAST:
+                                # Until the local is bound, assignment updates the global
+                                if fast[arg] is UNSET and local_names[arg] in variables:
+                                    variables[local_names[arg]] = pop()
+                                else:
+                                    fast[arg] = pop()
+                            elif op == FOR_ITER:
+                                item = next(stack[-1], UNSET)
+                                if item is UNSET:
+                                    pop()
+                                else:
+                                    push(item)
+                                    pc = arg
+                            elif op == BINARY_SUBSCR:
+                                index = pop()
+                                stack[-1] = stack[-1][index]
+                            elif op == LOAD_ATTR:
+                                stack[-1] = interp.get_member(stack[-1], names[arg])
+                        elif op < JUMP_IF_FALSE_OR_POP:
+                            if op == CALL_FUNCTION:
+                                name, argc = consts[arg]
+                                if argc:
+                                    call_args = stack[-argc:]
+                                    del stack[-argc:]
+                                else:
+                                    call_args = []
+                                func = functions.get(name)
+                                if func is None or func.arity != argc or func.module is not module:
+                                    # Builtins, functions imported from other modules, and the
+                                    # errors for unknown functions and bad arity
+                                    push(interp.call_function(name, call_args))
+                                    continue
+                                memo = func.memo
+                                if memo is not None:
+                                    key = memo.key(call_args)
+                                    if key is not None:
+                                        value = memo.lookup(key)
+                                        if value is not UNSET:
+                                            push(value)
+                                            continue
+                                interp.enter_call(name)
+                                body = func.code
+                                if body is None:
+                                    body = function_code(func)
+                                if tracer is not None:
+                                    tracer.call(name, call_args)
+                                    body = traced_body(func)
+                                frame.pc = pc
+                                callers.append(frame)
+                                frame = Frame(name, body, call_args)
+                                if memo is not None and key is not None:
+                                    frame.memo = [(memo, key)]
+                                break
+                            elif op == RETURN_VALUE:
+                                value = pop()
+                                if frame.memo is not None:
+                                    for memo, key in frame.memo:
+                                        memo.store(key, value)
+                                if not callers:
+                                    return value
+                                interp.depth -= 1
+                                if tracer is not None:
+                                    tracer.ret(value)
+                                frame = callers.pop()
+                                frame.stack.append(value)
+                                break
+                            elif op == CALL_BUILTIN:
+                                name, builtin, argc = consts[arg]
+                                if argc:
+                                    call_args = stack[-argc:]
+                                    del stack[-argc:]
+                                else:
+                                    call_args = []
+                                # A user function defined later may shadow the builtin
+                                if name in functions:
+                                    push(interp.call_function(name, call_args))
+                                else:
+                                    push(interp.call_builtin(name, builtin, call_args))
+                            elif op == CALL_LIBRARY:
+                                lib_name, func_name, argc, target = consts[arg]
+                                if argc:
+                                    call_args = stack[-argc:]
+                                    del stack[-argc:]
+                                else:
+                                    call_args = []
+                                if target is not None:
+                                    push(interp.call_bound_library(lib_name, func_name, target, call_args))
+                                else:
+                                    push(interp.call_library(lib_name, func_name, call_args))
+                            elif op == TAIL_CALL:
+                                name, argc = consts[arg]
+                                if argc:
+                                    call_args = stack[-argc:]
+                                    del stack[-argc:]
+                                else:
+                                    call_args = []
+                                func = functions.get(name)
+                                if func is None or func.arity != argc or func.module is not module:
+                                    push(interp.call_function(name, call_args))
+                                    continue
+                                # The callee's result is ours, so it can take over this frame,
+                                # along with the caches waiting to store that result
+                                pending = frame.memo
+                                memo = func.memo
+                                if memo is not None:
+                                    key = memo.key(call_args)
+                                    if key is not None:
+                                        value = memo.lookup(key)
+                                        if value is not UNSET:
+                                            push(value)
+                                            continue
+                                        pending = (pending or []) + [(memo, key)]
+                                body = func.code
+                                if body is None:
+                                    body = function_code(func)
+                                if tracer is not None:
+                                    tracer.ret()
+                                    tracer.call(name, call_args)
+                                    body = traced_body(func)
+                                frame = Frame(frame.name, body, call_args)
+                                frame.memo = pending
+                                break
+                            elif op == POP_TOP:
+                                pop()
+                            elif op == POP_BLOCK:
+                                blocks.pop()
+                            elif op == UNARY_OP:
+                                stack[-1] = UNARY_FUNCS[arg](stack[-1])
+                            elif op == INPLACE_OP:
+                                right = pop()
+                                stack[-1] = INPLACE_FUNCS[arg](stack[-1], right)
+                        else:
+                            if op == JUMP_IF_FALSE_OR_POP:
+                                if stack[-1]:
+                                    pop()
+                                else:
+                                    pc = arg
+                            elif op == JUMP_IF_TRUE_OR_POP:
+                                if stack[-1]:
+                                    pc = arg
+                                else:
+                                    pop()
+                            elif op == SETUP_EXCEPT:
+                                blocks.append((arg, len(stack)))
+                            elif op == GET_ITER:
+                                stack[-1] = interp.iterate(stack[-1])
+                            elif op == BUILD_LIST:
+                                if arg:
+                                    items = stack[-arg:]
+                                    del stack[-arg:]
+                                else:
+                                    items = []
+                                push(items)
+                            elif op == BUILD_MAP:
+                                items = stack[len(stack) - 2 * arg:]
+                                del stack[len(stack) - 2 * arg:]
+                                push({str(items[k]): items[k + 1] for k in range(0, len(items), 2)})
+                            elif op == MAKE_FUNCTION:
+                                # A fresh function each time, so a rerun starts with an empty memo
+                                func = consts[arg]
+                                interp.functions[func.name] = TourmalineFunction(func.name, func.params, func.body,
+                                                                                 func.local_names, func.definition,
+                                                                                 func.memo is not None, module)
+                            elif op == SPAWN:
+                                name, argc = consts[arg]
+                                if argc:
+                                    call_args = stack[-argc:]
+                                    del stack[-argc:]
+                                else:
+                                    call_args = []
+                                interp.spawn(name, call_args)
+                            elif op == IMPORT_NAME:
+                                name = names[arg]
+                                if interp.load_library(name) is None:
+                                    raise TourmalineError(f"Library '{name}' not found")
+                                # The library name itself is stored as the variable
+                                push(name)
+                            elif op == IMPORT_MODULE:
+                                interp.import_module(*consts[arg])
+                            elif op == DEFINE_STRUCT:
+                                struct_name, fields = consts[arg]
+                                interp.structs[struct_name] = list(fields)
+                            elif op == RAISE_ERROR:
+                                raise TourmalineError(consts[arg])
+                            elif op == LINE:
+                                # Code compiled for a traced run may run again after the hooks are gone
+                                if tracer is not None:
+                                    line, col = consts[arg]
+                                    tracer.line(line, col, interp.module)
+                            else:
+                                raise TourmalineError(f"Unknown opcode {op}")
+                except Exception as e:
+                    error = e
+                    frame.pc = pc
+                    # Unwind to the innermost frame with an active handler
+                    while True:
+                        swallowed = swallow_target(frame)
+                        if swallowed is not None or frame.blocks:
+                            break
+                        if not callers:
+                            raise error
+                        interp.depth -= 1
+                        if tracer is not None:
+                            tracer.ret()
+                        if not isinstance(error, CallDepthError):
+                            wrapped = TourmalineError(f"Error calling function '{frame.name}': {error}")
+                            wrapped.__context__ = error
+                            error = wrapped
+                        frame = callers.pop()
+                    if swallowed is not None:
+                        frame.pc, depth = swallowed
+                        del frame.stack[depth:]
+                    else:
+                        handler, depth = frame.blocks.pop()
+                        del frame.stack[depth:]
+                        if tracer is not None:
+                            tracer.exception(error)
+                        if interp.scheduler is not None:
+                            interp.scheduler.caught(error)
+                        frame.stack.append(str(error))
+                        frame.pc = handler
+        finally:
+            interp.depth = entry_depth
+
+########################
+# Array library
+########################
+
+ARRAY_KINDS = {'float': 'd', 'int': 'q'}
+
+def is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+class TourmalineArray:
+    """Typed numeric array in contiguous memory; slices are views sharing it"""
+    __slots__ = ('data',)
+
+    def __init__(self, data: memoryview):
+        self.data = data
+
+    @classmethod
+    def build(cls, typecode: str, values) -> 'TourmalineArray':
+        return cls(memoryview(py_array.array(typecode, values)))
+
+    @property
+    def kind(self) -> str:
+        return 'int' if self.data.format == 'q' else 'float'
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TourmalineArray(self.data[index])
+        return self.data[index]
+
+    def __str__(self):
+        return f"array({self.data.tolist()})"
+
+    __repr__ = __str__
+
+    def elementwise(self, other: Any, func: Callable, reverse: bool = False) -> 'TourmalineArray':
+        """Apply func item by item against another array or a single number"""
+        if isinstance(other, TourmalineArray):
+            if len(other.data) != len(self.data):
+                raise TourmalineError(f"Arrays have different lengths ({len(self.data)} and {len(other.data)})")
+            right = other.data
+            integral = self.data.format == 'q' and other.data.format == 'q'
+        elif is_number(other):
+            right = itertools.repeat(other, len(self.data))
+            integral = self.data.format == 'q' and isinstance(other, int)
+        else:
+            return NotImplemented
+        left = self.data
+        if reverse:
+            left, right = right, left
+        typecode = 'q' if integral and func is not operator.truediv else 'd'
+        # map() runs the loop in C; only the results are boxed, one at a time
+        return TourmalineArray.build(typecode, map(func, left, right))
+
+    def __add__(self, other):
+        return self.elementwise(other, operator.add)
+
+    def __radd__(self, other):
+        return self.elementwise(other, operator.add, True)
+
+    def __sub__(self, other):
+        return self.elementwise(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self.elementwise(other, operator.sub, True)
+
+    def __mul__(self, other):
+        return self.elementwise(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self.elementwise(other, operator.mul, True)
+
+    def __truediv__(self, other):
+        return self.elementwise(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self.elementwise(other, operator.truediv, True)
+
+    def __neg__(self):
+        return TourmalineArray.build(self.data.format, map(operator.neg, self.data))
+
+def expect_array(value: Any) -> TourmalineArray:
+    if not isinstance(value, TourmalineArray):
+        raise TourmalineError(f"expected an array, got {type(value).__name__}")
+    return value
+
+def array_typecode(kind: str) -> str:
+    if kind not in ARRAY_KINDS:
+        raise TourmalineError(f"Unknown array kind '{kind}' (expected one of: {', '.join(ARRAY_KINDS)})")
+    return ARRAY_KINDS[kind]
+
+def array_from_list(items: Any, kind: Optional[str] = None) -> TourmalineArray:
+    """New array holding a list's numbers; int unless a float is present or kind says otherwise"""
+    items = list(items)
+    for item in items:
+        if not is_number(item):
+            raise TourmalineError(f"Array items must be numbers, got {item!r}")
+    if kind is None:
+        kind = 'int' if all(isinstance(item, int) for item in items) else 'float'
+    typecode = array_typecode(kind)
+    if typecode == 'd':
+        items = [float(item) for item in items]
+    elif not all(isinstance(item, int) or item.is_integer() for item in items):
+        raise TourmalineError("An int array can only hold whole numbers")
+    else:
+        items = [int(item) for item in items]
+    return TourmalineArray.build(typecode, items)
+
+def array_zeros(length: int, kind: str = 'float') -> TourmalineArray:
+    typecode = array_typecode(kind)
+    return TourmalineArray.build(typecode, bytes(length * py_array.array(typecode).itemsize))
+
+def array_range(start: int, stop: Optional[int] = None, step: int = 1) -> TourmalineArray:
+    if stop is None:
+        start, stop = 0, start
+    return TourmalineArray.build('q', range(start, stop, step))
+
+def array_to_list(arr: Any) -> List[Any]:
+    return expect_array(arr).data.tolist()
+
+def array_copy(arr: Any) -> TourmalineArray:
+    arr = expect_array(arr)
+    return TourmalineArray.build(arr.data.format, arr.data)
+
+def array_slice(arr: Any, start: int, stop: int, step: int = 1) -> TourmalineArray:
+    """View of part of an array, sharing its memory"""
+    return expect_array(arr)[start:stop:step]
+
+def array_set(arr: Any, index: int, value: Any) -> TourmalineArray:
+    arr = expect_array(arr)
+    if not is_number(value):
+        raise TourmalineError(f"Array items must be numbers, got {value!r}")
+    if arr.data.format == 'd':
+        value = float(value)
+    elif isinstance(value, float):
+        if not value.is_integer():
+            raise TourmalineError("An int array can only hold whole numbers")
+        value = int(value)
+    arr.data[index] = value
+    return arr
+
+def array_sum(arr: Any) -> Any:
+    return sum(expect_array(arr).data)
+
+def array_mean(arr: Any) -> float:
+    arr = expect_array(arr)
+    if not len(arr.data):
+        raise TourmalineError("mean() of an empty array")
+    return sum(arr.data) / len(arr.data)
+
+def array_min(arr: Any) -> Any:
+    arr = expect_array(arr)
+    if not len(arr.data):
+        raise TourmalineError("min() of an empty array")
+    return min(arr.data)
+
+def array_max(arr: Any) -> Any:
+    arr = expect_array(arr)
+    if not len(arr.data):
+        raise TourmalineError("max() of an empty array")
+    return max(arr.data)
+
+def array_dot(left: Any, right: Any) -> Any:
+    left, right = expect_array(left), expect_array(right)
+    if len(left.data) != len(right.data):
+        raise TourmalineError(f"Arrays have different lengths ({len(left.data)} and {len(right.data)})")
+    return sum(map(operator.mul, left.data, right.data))
+
+########################
+# IO library
+########################
+
+IO_MODES = {'r': 'read', 'w': 'write', 'a': 'append'}
+
+class TourmalineFile:
+    """Open text file; reads and writes go through Python's buffered streams"""
+    __slots__ = ('path', 'mode', 'stream')
+
+    def __init__(self, path: str, mode: str):
+        if mode not in IO_MODES:
+            raise TourmalineError(f"Unknown file mode '{mode}' (expected one of: {', '.join(IO_MODES)})")
+        self.path = path
+        self.mode = mode
+        self.stream = open(path, mode, encoding='utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for line in self.stream:
+            yield line.rstrip('\n')
+
+    def __str__(self):
+        state = 'closed' if self.stream.closed else IO_MODES[self.mode]
+        return f"<file {self.path} ({state})>"
+
+    __repr__ = __str__
+
+class MappedFile:
+    """File mapped into memory; slicing and searching work on byte offsets without copying"""
+    __slots__ = ('path', 'data', 'closed')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.closed = False
+        with open(path, 'rb') as f:
+            # Empty files cannot be mapped, but behave the same as empty bytes
+            if os.fstat(f.fileno()).st_size == 0:
+                self.data = b''
+            else:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        if self.closed:
+            raise TourmalineError(f"{self.path} is closed")
+        return len(self.data)
+
+    def __iter__(self) -> Iterator[str]:
+        start = 0
+        size = len(self)
+        while start < size:
+            end = self.data.find(b'\n', start)
+            if end == -1:
+                end = size
+            yield self.data[start:end].decode('utf-8').rstrip('\r')
+            start = end + 1
+
+    def close(self):
+        """Unmap the file, so it is no longer held open (or locked, on Windows)"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.closed = True
+
+    def __str__(self):
+        if self.closed:
+            return f"<mapped file {self.path} (closed)>"
+        return f"<mapped file {self.path} ({len(self.data)} bytes)>"
+
+    __repr__ = __str__
+
+def expect_file(value: Any) -> TourmalineFile:
+    if not isinstance(value, TourmalineFile):
+        raise TourmalineError(f"expected a file from io.open(), got {type(value).__name__}")
+    return value
+
+def expect_mapped(value: Any) -> MappedFile:
+    if not isinstance(value, MappedFile):
+        raise TourmalineError(f"expected a file from io.map(), got {type(value).__name__}")
+    if value.closed:
+        raise TourmalineError(f"{value.path} is closed")
+    return value
+
+def io_lines(source: Any) -> Iterator[str]:
+    """Lazy lines of a file path, open file or mapped file, without line endings"""
+    if isinstance(source, (TourmalineFile, MappedFile)):
+        return iter(source)
+    if not isinstance(source, str):
+        raise TourmalineError(f"expected a file path or file, got {type(source).__name__}")
+    return read_lines(source)
+
+def read_lines(path: str) -> Iterator[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line.rstrip('\n')
+
+def io_read(source: Any, size: int = -1) -> str:
+    """A whole file by path, or up to size characters of an open file"""
+    if isinstance(source, str):
+        with open(source, 'r', encoding='utf-8') as f:
+            return f.read()
+    return expect_file(source).stream.read(size)
+
+def io_read_line(source: Any) -> Optional[str]:
+    """The next line of an open file, or nil at the end"""
+    line = expect_file(source).stream.readline()
+    if not line:
+        return None
+    return line.rstrip('\n')
+
+def io_write(target: Any, text: Any):
+    expect_file(target).stream.write(text if isinstance(text, str) else str(text))
+
+def io_write_line(target: Any, text: Any):
+    expect_file(target).stream.write((text if isinstance(text, str) else str(text)) + '\n')
+
+def io_flush(target: Any):
+    expect_file(target).stream.flush()
+
+def io_close(target: Any):
+    if isinstance(target, MappedFile):
+        target.close()
+    else:
+        expect_file(target).stream.close()
+
+def io_slice(source: Any, start: int, stop: int) -> str:
+    return expect_mapped(source).data[start:stop].decode('utf-8')
+
+def io_find(source: Any, text: str, start: int = 0) -> int:
+    """Byte offset of text in a mapped file, or -1"""
+    return expect_mapped(source).data.find(text.encode('utf-8'), start)
+
+########################
+# Strings library
+########################
+
+class StringBuilder:
+    """Text collected piece by piece and joined once, when it is built"""
+    __slots__ = ('parts', 'length')
+
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return ''.join(self.parts)
+
+    __repr__ = __str__
+
+def expect_builder(value: Any) -> StringBuilder:
+    if not isinstance(value, StringBuilder):
+        raise TourmalineError(f"expected a builder from strings.builder(), got {type(value).__name__}")
+    return value
+
+def as_text(value: Any) -> str:
+    return value if isinstance(value, str) else str(value)
+
+def strings_add(builder: Any, *pieces: Any) -> StringBuilder:
+    builder = expect_builder(builder)
+    for piece in pieces:
+        piece = as_text(piece)
+        builder.parts.append(piece)
+        builder.length += len(piece)
+    return builder
+
+def strings_build(builder: Any) -> str:
+    builder = expect_builder(builder)
+    text = ''.join(builder.parts)
+    # Keep the joined text, so building again does not repeat the work
+    builder.parts = [text] if text else []
+    return text
+
+def strings_join(items: Any, separator: str = '') -> str:
+    return as_text(separator).join(as_text(item) for item in items)
+
+def strings_split(text: str, separator: Optional[str] = None, limit: int = -1) -> List[str]:
+    """Pieces of text between separators; on runs of whitespace without one"""
+    return as_text(text).split(separator, limit)
+
+def strings_format(template: str, *args: Any) -> str:
+    """Fill {} placeholders in order, or {0}, {1}, ... by position"""
+    return as_text(template).format(*args)
+
+########################
+# Parallel library
+########################
+
+CHUNKS_PER_WORKER = 4  # smaller batches balance uneven work, larger ones cost less to send
+
+def referenced_names(node: Any) -> Iterator[str]:
+    """Every variable name read anywhere in a syntax tree"""
+    if isinstance(node, Name):
+        yield node.name
+    elif isinstance(node, Node):
+        for slot in type(node).__slots__:
+            yield from referenced_names(getattr(node, slot, None))
+    elif isinstance(node, (list, tuple)):
+        for item in node:
+            yield from referenced_names(item)
+
+def chunked(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+class WorkerPool:
+    """Worker processes, each with an interpreter holding the caller's functions"""
+    __slots__ = ('size', 'setup', 'executor')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.setup = None
+        self.executor = None
+
+    def prepare(self, setup: bytes):
+        """Start workers for the given definitions, replacing any with stale ones"""
+        if setup != self.setup:
+            import concurrent.futures  # only scripts that use parallel pay for loading it
+            self.close()
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.size, initializer=worker_init,
+                                                                   initargs=(setup,))
+            self.setup = setup
+
+    def map(self, task: Callable, items: List[Any], chunk_size: int) -> List[Any]:
+        import concurrent.futures
+        try:
+            return list(self.executor.map(task, items, chunksize=chunk_size))
+        except concurrent.futures.process.BrokenProcessPool:
+            self.close()
+            raise TourmalineError("a worker process stopped unexpectedly")
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.executor = None
+        self.setup = None
+
+# The interpreter of a worker process, set up once when the worker starts
+worker_interpreter = None
+# The pickled globals its variables were last loaded from
+worker_shared = None
+
+def worker_init(setup: bytes):
+    global worker_interpreter
+    engine, max_depth, optimize, definitions, structs = pickle.loads(setup)
+    # A single worker runs nested parallel calls itself instead of starting more processes
+    interpreter = TourmalineInterpreter(engine, max_depth, optimize, workers=1)
+    interpreter.structs.update(structs)
+    interpreter.run_program(Block(definitions, 0))
+    worker_interpreter = interpreter
+
+def worker_globals(shared: bytes) -> TourmalineInterpreter:
+    """The worker's interpreter, holding the globals of the parallel call being run"""
+    global worker_shared
+    # Every batch of a call brings the same globals; only a new call loads them again
+    if shared != worker_shared:
+        variables = worker_interpreter.variables
+        variables.clear()
+        for name, value in pickle.loads(shared).items():
+            variables[name] = pickle.loads(value)
+        worker_shared = shared
+    return worker_interpreter
+
+def worker_call(name: str, shared: bytes, item: Any) -> Any:
+    return worker_globals(shared).call_function(name, [item])
+
+def worker_run(name: str, shared: bytes, item: Any):
+    # Results are dropped here so they never need to be sent back
+    worker_globals(shared).call_function(name, [item])
+
+def worker_reduce(name: str, shared: bytes, items: List[Any]) -> Any:
+    interpreter = worker_globals(shared)
+    return functools.reduce(lambda total, item: interpreter.call_function(name, [total, item]), items)
+
+########################
+# Tasks and channels
+########################
+
+class TaskCancelled(BaseException):
+    """Ends a task left running when its program stops; `try` never catches it"""
+
+class Task:
+    """A spawned call, run on its own thread only while it holds the baton"""
+    __slots__ = ('name', 'baton', 'wait', 'woken', 'value', 'interrupt')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.baton = threading.Semaphore(0)
+        self.wait = 0  # counts the task's waits, so late wakeups for old ones are ignored
+        self.woken = -1
+        self.value = UNSET  # what a channel handed over while the task waited
+        self.interrupt = None  # error to raise when the task resumes
+
+class TaskScheduler:
+    """Runs tasks one at a time, switching only where a task waits"""
+    # Interpreter state belongs to whichever task holds the baton. The event
+    # loop thread decides who gets it next, fires timers and spots deadlocks;
+    # everything else runs on the task threads.
+    __slots__ = ('interpreter', 'loop', 'thread', 'main', 'current', 'running', 'ready', 'live',
+                 'timers', 'blocked', 'joining', 'failure')
+
+    def __init__(self, interpreter: 'TourmalineInterpreter'):
+        # Deferred: only programs that spawn tasks pay for importing asyncio
+        import asyncio
+        self.interpreter = interpreter
+        self.loop = asyncio.new_event_loop()
+        self.main = Task('<program>')
+        self.current = self.main  # the baton holder, as it sees itself
+        self.running = self.main  # the baton holder, as the loop sees it
+        self.ready = collections.deque()
+        self.live = set()  # spawned tasks that have not finished
+        self.timers = 0  # sleeps and timeouts pending
+        self.blocked = 0  # tasks waiting on the operating system
+        self.joining = False
+        self.failure = None  # a task's error no try in the program has handled yet
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    # Loop thread
+
+    def dispatch(self):
+        """Hand the baton to the next ready task, if there is one"""
+        if self.ready:
+            self.running = self.ready.popleft()
+            self.running.baton.release()
+            return
+        self.running = None
+        if not self.timers and not self.blocked:
+            # Every task waits on a channel or on the others: nothing can ever wake them
+            main = self.main
+            if main.interrupt is None:
+                main.interrupt = TourmalineError("All tasks are waiting on channels (deadlock)")
+            self.wake(main, main.wait)
+
+    def wake(self, task: Task, wait: int):
+        if task.woken != wait and task.wait == wait:
+            task.woken = wait
+            self.ready.append(task)
+            if self.running is None:
+                self.dispatch()
+
+    def paused(self, task: Task, delay: Optional[float]):
+        if delay is not None:
+            self.timers += 1
+            self.loop.call_later(max(0, delay), self.timer_done, task, task.wait)
+        self.dispatch()
+
+    def timer_done(self, task: Task, wait: int):
+        self.timers -= 1
+        self.wake(task, wait)
+        if self.running is None:
+            # A stale timer wakes no one, but it may have been all that kept a deadlock from being noticed
+            self.dispatch()
+
+    def blocking_started(self):
+        self.blocked += 1
+        self.dispatch()
+
+    def blocking_done(self, task: Task, wait: int):
+        self.blocked -= 1
+        self.wake(task, wait)
+
+    def finished(self, task: Task):
+        self.live.discard(task)
+        if self.joining and not self.live:
+            self.wake(self.main, self.main.wait)
+        self.dispatch()
+
+    # Task threads, holding the baton
+
+    def post(self, callback: Callable, *args: Any):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def wake_soon(self, task: Task):
+        self.post(self.wake, task, task.wait)
+
+    def pause(self, callback: Callable, *args: Any):
+        """Give up the baton until the loop hands it back, then raise any interrupt"""
+        task = self.current
+        state = self.interpreter.save_state()
+        self.post(callback, task, *args)
+        task.baton.acquire()
+        self.current = task
+        self.interpreter.restore_state(state)
+        if task.interrupt is not None:
+            error, task.interrupt = task.interrupt, None
+            raise error
+
+    def wait(self, timeout: Optional[float] = None):
+        """Wait until woken, or for at most timeout seconds"""
+        self.current.wait += 1
+        self.pause(self.paused, timeout)
+
+    def spawn(self, name: str, args: List[Any], module: TourmalineModule):
+        task = Task(name)
+        self.live.add(task)
+        threading.Thread(target=self.run, args=(task, name, args, module), daemon=True).start()
+        self.wake_soon(task)
+
+    def run(self, task: Task, name: str, args: List[Any], module: TourmalineModule):
+        task.baton.acquire()
+        self.current = task
+        self.interpreter.restore_state(None)
+        # The function is looked up among the globals of the code that spawned it
+        self.interpreter.use_module(module)
+        try:
+            if task.interrupt is None:
+                self.interpreter.call_function(name, args)
+        except TaskCancelled:
+            pass
+        except Exception as e:
+            # The program hears about it the next time it waits. Waits are mostly
+            # bare expressions, which discard errors, so unless a try handles it
+            # there it is raised again when the program ends
+            if self.failure is None:
+                self.failure = TourmalineError(f"Task '{name}' failed: {e}")
+                main = self.main
+                if main.interrupt is None:
+                    main.interrupt = self.failure
+            self.wake_soon(self.main)
+        finally:
+            self.post(self.finished, task)
+
+    def blocking(self, func: Callable, args: List[Any]) -> Any:
+        """Call func without the baton, so other tasks run while it waits"""
+        task = self.current
+        task.wait += 1
+        state = self.interpreter.save_state()
+        self.post(self.blocking_started)
+        try:
+            return func(*args)
+        finally:
+            self.post(self.blocking_done, task, task.wait)
+            task.baton.acquire()
+            self.current = task
+            self.interpreter.restore_state(state)
+            if task.interrupt is not None:
+                error, task.interrupt = task.interrupt, None
+                raise error
+
+    def join(self):
+        """Wait for every spawned task to finish"""
+        while self.live:
+            self.joining = True
+            try:
+                self.wait()
+            finally:
+                self.joining = False
+        if self.main.interrupt is not None:
+            error, self.main.interrupt = self.main.interrupt, None
+            if error is self.failure:
+                self.failure = None
+            raise error
+        if self.failure is not None:
+            error, self.failure = self.failure, None
+            raise error
+
+    def caught(self, error: Exception):
+        """Forget the pending task failure once a try has handled an error caused by it"""
+        while error is not None:
+            if error is self.failure:
+                self.failure = None
+                return
+            error = error.__context__
+
+    def close(self):
+        """Cancel tasks still running, then stop the event loop"""
+        for task in list(self.live):
+            task.interrupt = TaskCancelled()
+            self.wake_soon(task)
+        while self.live:
+            try:
+                self.join()
+            except TourmalineError:
+                pass
+        self.post(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+class Channel:
+    """Queue that tasks pass values through, holding at most capacity of them"""
+    __slots__ = ('interpreter', 'capacity', 'items', 'receivers', 'senders', 'closed')
+
+    def __init__(self, interpreter: 'TourmalineInterpreter', capacity: int = 0):
+        if not isinstance(capacity, int) or capacity < 0:
+            raise TourmalineError(f"channel capacity must be a whole number of at least 0, got {capacity!r}")
+        self.interpreter = interpreter
+        self.capacity = capacity
+        self.items = collections.deque()
+        self.receivers = collections.deque()  # tasks waiting for a value
+        self.senders = collections.deque()  # tasks waiting to hand over their value
+        self.closed = False
+
+    def scheduler(self, action: str) -> TaskScheduler:
+        scheduler = self.interpreter.scheduler
+        if scheduler is None:
+            raise TourmalineError(f"{action} would wait forever: no other task is running")
+        return scheduler
+
+    def send(self, value: Any):
+        if self.closed:
+            raise TourmalineError("send on a closed channel")
+        if self.receivers:
+            task = self.receivers.popleft()
+            task.value = value
+            self.interpreter.scheduler.wake_soon(task)
+        elif len(self.items) < self.capacity:
+            self.items.append(value)
+        else:
+            scheduler = self.scheduler("send on a full channel")
+            task = scheduler.current
+            task.value = value
+            self.senders.append(task)
+            try:
+                scheduler.wait()
+            finally:
+                task.value = UNSET
+                if task in self.senders:
+                    self.senders.remove(task)
+
+    def take(self, timeout: Optional[float] = None) -> Any:
+        """Next value, or UNSET once the channel is closed and empty or the timeout passes"""
+        if self.items:
+            value = self.items.popleft()
+            if self.senders:
+                self.items.append(self.handover())
+            return value
+        if self.senders:
+            return self.handover()
+        if self.closed:
+            return UNSET
+        if self.interpreter.scheduler is None and timeout is not None:
+            time.sleep(timeout)
+            return UNSET
+        scheduler = self.scheduler("recv on an empty channel")
+        task = scheduler.current
+        self.receivers.append(task)
+        try:
+            scheduler.wait(timeout)
+        finally:
+            if task in self.receivers:
+                self.receivers.remove(task)
+        value, task.value = task.value, UNSET
+        return value
+
+    def handover(self) -> Any:
+        task = self.senders.popleft()
+        value, task.value = task.value, UNSET
+        self.interpreter.scheduler.wake_soon(task)
+        return value
+
+    def close(self):
+        self.closed = True
+        for task in self.receivers:
+            self.interpreter.scheduler.wake_soon(task)
+        for task in self.senders:
+            task.interrupt = TourmalineError("send on a closed channel")
+            self.interpreter.scheduler.wake_soon(task)
+        self.receivers.clear()
+        self.senders.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[Any]:
+        # Receives until the channel is closed and empty
+        while True:
+            value = self.take()
+            if value is UNSET:
+                return
+            yield value
+
+    def __str__(self):
+        return f"<channel {len(self.items)}/{self.capacity}{' closed' if self.closed else ''}>"
+
+    __repr__ = __str__
+
+def expect_channel(value: Any) -> Channel:
+    if not isinstance(value, Channel):
+        raise TourmalineError(f"expected a channel from tasks.channel(), got {type(value).__name__}")
+    return value
+
+def channel_recv(channel: Any, timeout: Optional[float] = None) -> Any:
+    value = expect_channel(channel).take(timeout)
+    return None if value is UNSET else value
+
+########################
+# Execution hooks and profiler
+########################
+
+HOOK_EVENTS = ('line', 'call', 'return', 'library_call', 'exception')
+
+class TraceEvent:
+    """What the interpreter was doing when a hook fired"""
+    __slots__ = ('kind', 'function', 'line', 'library', 'name', 'args', 'value', 'error', 'column', 'module')
+
+    def __init__(self, kind: str, function: str, line: int, library: Optional[str] = None,
+                 name: Optional[str] = None, args: Tuple = (), value: Any = None,
+                 error: Optional[Exception] = None, column: int = 0,
+                 module: Optional['TourmalineModule'] = None):
+        self.kind = kind
+        self.function = function  # user function the event happened in, or '<program>'
+        self.line = line
+        self.column = column
+        self.module = module  # the module of the running code; None before any has run
+        self.library = library
+        self.name = name
+        self.args = args
+        self.value = value
+        self.error = error
+
+    def __repr__(self):
+        return f"TraceEvent({self.kind!r}, {self.function!r}, line {self.line}, column {self.column})"
+
+class TourmalineHooks:
+    """Registered hook callbacks, fed by the engines while any are registered
+
+    The engines report line(line_no, col, module) before each statement, call(name, args)
+    when a user function starts, ret(value) when it finishes (with nil when it
+    fails), library(lib, name, args) before a library call and exception(error)
+    when a try block catches an error.
+    """
+    def __init__(self):
+        self.callbacks = {kind: [] for kind in HOOK_EVENTS}
+        self.frames = []  # [function name, current line, column, module], innermost last
+        # Each task has its own call stack, here and in listeners like the profiler
+        self.task_frames = [self]
+
+    def __bool__(self):
+        return any(self.callbacks.values())
+
+    def add(self, kind: str, callback: Callable[[TraceEvent], Any]):
+        if kind not in self.callbacks:
+            raise TourmalineError(f"Unknown hook event '{kind}' (expected one of: {', '.join(HOOK_EVENTS)})")
+        self.callbacks[kind].append(callback)
+
+    def remove(self, kind: str, callback: Callable[[TraceEvent], Any]):
+        if callback not in self.callbacks.get(kind, ()):
+            raise TourmalineError(f"Hook is not registered for '{kind}'")
+        self.callbacks[kind].remove(callback)
+
+    def save_frames(self) -> Tuple:
+        return tuple((owner, owner.frames) for owner in self.task_frames)
+
+    def restore_frames(self, saved: Optional[Tuple]):
+        """Put back the stacks of a task, or empty ones for a new task when saved is None"""
+        if saved is None:
+            saved = [(owner, []) for owner in self.task_frames]
+        for owner, frames in saved:
+            owner.frames = frames
+
+    def emit(self, kind: str, event: TraceEvent):
+        for callback in self.callbacks[kind]:
+            callback(event)
+
+    def line(self, line_no: int, col: int, module: 'TourmalineModule'):
+        frame = self.frames[-1]
+        frame[1] = line_no
+        frame[2] = col
+        frame[3] = module
+        if self.callbacks['line']:
+            self.emit('line', TraceEvent('line', frame[0], line_no, column=col, module=module))
+
+    def call(self, name: str, args: List[Any]):
+        # Until its first statement runs, a call is positioned at its call site
+        _, line, col, module = self.frames[-1] if self.frames else (None, 0, 0, None)
+        self.frames.append([name, line, col, module])
+        if self.callbacks['call']:
+            self.emit('call', TraceEvent('call', name, line, args=tuple(args), column=col, module=module))
+
+    def ret(self, value: Any = None):
+        name, line, col, module = self.frames.pop()
+        if self.callbacks['return']:
+            self.emit('return', TraceEvent('return', name, line, value=value, column=col, module=module))
+
+    def library(self, library: str, name: str, args: List[Any]):
+        if self.callbacks['library_call']:
+            function, line, col, module = self.frames[-1]
+            self.emit('library_call', TraceEvent('library_call', function, line, library=library,
+                                                 name=name, args=tuple(args), column=col, module=module))
+
+    def exception(self, error: Exception):
+        if self.callbacks['exception']:
+            function, line, col, module = self.frames[-1]
+            self.emit('exception', TraceEvent('exception', function, line, error=error,
+                                              column=col, module=module))
+
+class TourmalineProfiler:
+    """Per-function and per-line timings, collected through execution hooks"""
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.functions = {}  # name -> [calls, inclusive, exclusive]
+        self.lines = {}  # line, or (module, line) for imported code -> [hits, time]
+        self.main = None
+        self.active = {}  # name -> calls of it currently running
+        self.root = CallNode('')
+        # [name, start, time in callees, current line, call tree node]
+        self.frames = []
+        self.last = 0.0
+
+    def charge(self, now: float):
+        """Charge the time since the previous event to the line that was running"""
+        line = self.frames[-1][3] if self.frames else None
+        if line is not None:
+            self.lines[line][1] += now - self.last
+        self.last = now
+
+    def attach(self, interpreter: 'TourmalineInterpreter'):
+        self.main = interpreter.main
+        interpreter.add_hook('line', self.on_line)
+        interpreter.add_hook('call', self.on_call)
+        interpreter.add_hook('return', self.on_return)
+        interpreter.hooks.task_frames.append(self)
+
+    def on_line(self, event: TraceEvent):
+        self.charge(self.clock())
+        # Line numbers alone would mix imported files up with the main one
+        key = event.line if event.module is self.main else (event.module, event.line)
+        stats = self.lines.get(key)
+        if stats is None:
+            stats = self.lines[key] = [0, 0.0]
+        stats[0] += 1
+        self.frames[-1][3] = key
+
+    def on_call(self, event: TraceEvent):
+        name = event.function
+        now = self.clock()
+        self.charge(now)
+        parent = self.frames[-1][4] if self.frames else self.root
+        node = parent.children.get(name)
+        if node is None:
+            node = parent.children[name] = CallNode(name)
+        self.frames.append([name, now, 0.0, None, node])
+        stats = self.functions.get(name)
+        if stats is None:
+            stats = self.functions[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        self.active[name] = self.active.get(name, 0) + 1
+
+    def on_return(self, event: TraceEvent):
+        if not self.frames or self.frames[-1][0] != event.function:
+            return  # the call started before the profiler was attached
+        now = self.clock()
+        self.charge(now)
+        name, start, callees, _, node = self.frames.pop()
+        elapsed = now - start
+        stats = self.functions[name]
+        self.active[name] -= 1
+        # Recursive calls are already inside the outermost call's time
+        if not self.active[name]:
+            stats[1] += elapsed
+        stats[2] += elapsed - callees
+        node.time += elapsed - callees
+        if self.frames:
+            self.frames[-1][2] += elapsed
+
+    def report(self, source_lines: Optional[List[str]] = None, limit: int = 20) -> str:
+        """Format the slowest functions and lines as a table"""
+        total = sum(node.time for node in self.root.walk())
+        out = [f"Total time: {total:.6f}s", "",
+               f"{'calls':>9} {'inclusive':>11} {'exclusive':>11}  function"]
+        by_time = sorted(self.functions.items(), key=lambda item: -item[1][2])
+        for name, (calls, inclusive, exclusive) in by_time[:limit]:
+            out.append(f"{calls:>9} {inclusive:>11.6f} {exclusive:>11.6f}  {name}")
+        out += ["", f"{'line':>9} {'hits':>11} {'time':>11}  source"]
+        by_time = sorted(self.lines.items(), key=lambda item: -item[1][1])
+        module_lines = {}
+        for key, (hits, spent) in by_time[:limit]:
+            lines, line, label = source_lines, key, key
+            if isinstance(key, tuple):
+                module, line = key
+                label = f"{module.name}:{line}"
+                lines = module_lines.get(module)
+                if lines is None:
+                    lines = module_lines[module] = module_source_lines(module)
+            text = ''
+            if lines and 0 < line <= len(lines):
+                text = lines[line - 1].strip()
+            out.append(f"{label:>9} {hits:>11} {spent:>11.6f}  {text}")
+        return '\n'.join(out) + '\n'
+
+    def collapsed(self) -> str:
+        """Format call stacks as `a;b;c microseconds` lines for flame graph tools"""
+        out = []
+        for path, node in self.root.stacks():
+            micros = int(round(node.time * 1e6))
+            if micros:
+                out.append(f"{';'.join(path)} {micros}")
+        return ''.join(line + '\n' for line in out)
+
+def module_source_lines(module: 'TourmalineModule') -> List[str]:
+    try:
+        with open(module.path, 'r', encoding='utf-8') as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+class CallNode:
+    """One call stack in the profiler's call tree, with its exclusive time"""
+    __slots__ = ('name', 'children', 'time')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.children = {}
+        self.time = 0.0
+
+    def walk(self) -> Iterator['CallNode']:
+        pending = [self]
+        while pending:
+            node = pending.pop()
+            yield node
+            pending.extend(node.children.values())
+
+    def stacks(self) -> Iterator[Tuple[Tuple[str, ...], 'CallNode']]:
+        """Yield each descendant with the names on the path to it"""
+        pending = [((), self)]
+        while pending:
+            path, node = pending.pop()
+            if path:
+                yield path, node
+            for child in node.children.values():
+                pending.append((path + (child.name,), child))
+
+########################
+# Program cache
+########################
+
+VERSION = '1.0.1'
+CACHE_DIR = '__trmcache__'
+CACHE_SUFFIX = '.trmc'
+
+def cache_path(filename: str) -> str:
+    """Where the cached syntax tree of a source file is kept, like __pycache__"""
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, CACHE_DIR, os.path.splitext(name)[0] + CACHE_SUFFIX)
+
+@functools.lru_cache(maxsize=None)
+def interpreter_fingerprint() -> bytes:
+    """Identifies this interpreter build, so editing Tourmaline.py invalidates old caches"""
+    # Trees pickle their classes by module, and `python Tourmaline.py` defines them in
+    # __main__ while the tourmaline command imports them, so the two cannot share a cache
+    digest = hashlib.sha256(f"{VERSION} {sys.version_info[:2]} {__name__}".encode('utf-8'))
+    try:
+        with open(__file__, 'rb') as f:
+            digest.update(f.read())
+    except (NameError, OSError):
+        pass
+    return digest.digest()
+
+def cache_key(source: str) -> str:
+    digest = hashlib.sha256(interpreter_fingerprint())
+    digest.update(source.encode('utf-8'))
+    return digest.hexdigest()
+
+def load_cached_program(path: str, key: str) -> Optional[Block]:
+    """Return the cached tree at path if it was stored under key"""
+    try:
+        with open(path, 'rb') as f, gc_paused():
+            stored_key, program = pickle.load(f)
+    except Exception:
+        # Missing, truncated or written by an incompatible interpreter
+        return None
+    return program if stored_key == key else None
+
+def store_cached_program(path: str, key: str, program: Block):
+    """Write a tree to the cache; readers never see a partly written file"""
+    import tempfile
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f, gc_paused():
+                pickle.dump((key, program), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except (OSError, pickle.PicklingError, RecursionError):
+        # Caching is best effort, e.g. the source directory may be read-only
+        pass
+
+class TourmalineProgram:
+    """Parsed and optimized program from TourmalineInterpreter.compile"""
+    # Running a program never changes it, so one can be shared by any number of
+    # interpreters and threads
+    __slots__ = ('source', 'tree', 'optimize', '__weakref__')
+    def __init__(self, source: str, tree: Block, optimize: int):
+        self.source = source
+        self.tree = tree
+        self.optimize = optimize
+
+    def __repr__(self):
+        return f"<program of {len(self.tree.statements)} statements>"
+
+ENGINES = ('ast', 'vm')
+MAX_CALL_DEPTH = 10000
+# The tree walker nests a dozen or more Python calls for every Tourmaline call,
+# and before 3.11 each of them grows the C stack too. Calls nested deeper than this
+# run on the VM, which keeps its own stack of frames, so how deep a program can
+# recurse depends only on max_depth and not on Python's recursion limit
+TREE_WALKER_DEPTH = 25
+
+# Libraries holding no interpreter state, shared by every interpreter in the process
+STATELESS_LIBRARIES = frozenset(('random', 'array', 'strings'))
+
+class TourmalineInterpreter:
+    shared_builtins = None  # built by the first interpreter, see setup_builtins
+    shared_libraries = {}  # the stateless libraries built so far, see load_library
+    compiled_modules = {}  # (path, optimize) -> (file stamp, TourmalineProgram), see compile_module
+    
+    def __init__(self, engine: str = 'ast', max_depth: int = MAX_CALL_DEPTH, optimize: int = 1,
+                 workers: Optional[int] = None):
+        if engine not in ENGINES:
+            raise TourmalineError(f"Unknown engine '{engine}' (expected one of: {', '.join(ENGINES)})")
+        if max_depth < 1:
+            raise TourmalineError("max_depth must be at least 1")
+        if optimize not in OPTIMIZE_LEVELS:
+            raise TourmalineError(f"Unknown optimization level {optimize} (expected one of: {', '.join(map(str, OPTIMIZE_LEVELS))})")
+        if workers is not None and workers < 1:
+            raise TourmalineError("workers must be at least 1")
+        self.engine = engine
+        self.max_depth = max_depth
+        self.optimize = optimize
+        # Processes used by the parallel library; None means one per CPU
+        self.workers = workers or os.cpu_count() or 1
+        self.worker_pool = None  # started on the first parallel call that needs it
+        self.scheduler = None  # runs spawned tasks, from the first spawn until the program ends
+        # Resolved trees or bytecode of compiled programs, ready to run again
+        self.prepared = weakref.WeakKeyDictionary()
+        self.depth = 0  # user function calls currently running
+        self.hooks = TourmalineHooks()
+        self.tracer = None  # the hooks while a program runs with any registered
+        # The globals, functions and structs in use are those of the running program,
+        # or of an imported module while its code runs
+        self.main = TourmalineModule('<program>', None)
+        self.modules = {}  # absolute path -> TourmalineModule, imported by this interpreter
+        self.importing = []  # modules whose top level is running, to catch circular imports
+        self.use_cache = True  # whether imported modules use the on-disk program cache
+        self.use_module(self.main)
+        # Slots of the running function's locals; None at top level
+        self.frame = None
         self.return_value = None
         self.has_returned = False
-        self.exception_caught = False
-        self.exception_var = None
+        self.tail_call = None  # (function, args) for a pending `return f(...)`
         self.libraries = {}
         self.setup_builtins()
         self.setup_libraries()
+        self.parser = TourmalineParser()
+        self.optimizer = TourmalineOptimizer(self.builtins, self.functions)
+        self.resolver = TourmalineResolver(self.builtins, self.load_library)
+        self.compiler = TourmalineCompiler(self.resolver)
+        self.vm = TourmalineVM(self)
+        self.statement_handlers = {
+            ImportStatement: self.exec_import,
+            ModuleImport: self.exec_module_import,
+            LetStatement: self.exec_let,
+            AssignStatement: self.exec_assign,
+            FunctionDef: self.exec_function_def,
+            StructDef: self.exec_struct_def,
+            TryStatement: self.exec_try,
+            IfStatement: self.exec_if,
+            WhileStatement: self.exec_while,
+            ForStatement: self.exec_for,
+            ReturnStatement: self.exec_return,
+            SpawnStatement: self.exec_spawn,
+            ExpressionStatement: self.exec_expression,
+        }
+        self.expression_handlers = {
+            Constant: self.eval_constant,
+            Name: self.eval_name,
+            BinaryOp: self.eval_binary,
+            UnaryOp: self.eval_unary,
+            Call: self.eval_call,
+            LibraryCall: self.eval_library_call,
+            Member: self.eval_member,
+            Index: self.eval_index,
+            ListLiteral: self.eval_list,
+            DictLiteral: self.eval_dict,
+            InvalidExpression: self.eval_invalid,
+            LocalName: self.eval_local,
+        }
     
     def setup_builtins(self):
         """Setup built-in functions"""
-        self.builtins = {
+        # They hold no interpreter state, so every interpreter shares one read-only
+        # table until add_builtin gives it a copy of its own
+        cls = type(self)
+        if cls.shared_builtins is None:
+            cls.shared_builtins = MappingProxyType(self.builtin_table())
+        self.builtins = cls.shared_builtins
+    
+    def builtin_table(self) -> Dict[str, Callable]:
+        return {
             'print': lambda *args: print(*[str(a) for a in args]),
             'input': lambda prompt="": input(prompt),
             'len': len,
@@ -76,12 +3104,74 @@ class TourmalineInterpreter:
             'remove': self.list_remove,
             'pop': self.list_pop,
             'clear': self.list_clear,
+            # Sequences
+            'range': self.make_range,
         }
     
     def setup_libraries(self):
         """Setup standard libraries"""
-        # Random library
-        self.libraries['random'] = {
+        # Nothing is built here: a library's table is made the first time a script imports it
+        self.library_setup = {
+            'random': self.random_library,
+            'array': self.array_library,
+            'strings': self.strings_library,
+            'io': self.io_library,
+            'parallel': self.parallel_library,
+            'tasks': self.tasks_library,
+        }
+    
+    def load_library(self, name: str) -> Optional[Dict[str, Callable]]:
+        """The functions of a standard library, or None if there is no such library"""
+        table = self.libraries.get(name)
+        if table is None and name in self.library_setup:
+            if name in STATELESS_LIBRARIES:
+                # Libraries without interpreter state are shared between interpreters, like the builtins
+                shared = type(self).shared_libraries
+                if name not in shared:
+                    shared[name] = MappingProxyType(self.library_setup[name]())
+                table = shared[name]
+            else:
+                table = self.library_setup[name]()
+            self.libraries[name] = table
+        return table
+    
+    def io_library(self) -> Dict[str, Callable]:
+        # Calls that wait on the disk let other tasks run meanwhile
+        return {
+            'open': self.yielding(lambda path, mode='r': TourmalineFile(path, mode)),
+            'close': self.yielding(io_close),
+            'lines': self.file_lines,
+            'read': self.yielding(io_read),
+            'read_line': self.yielding(io_read_line),
+            'write': self.yielding(io_write),
+            'write_line': self.yielding(io_write_line),
+            'flush': self.yielding(io_flush),
+            'exists': os.path.exists,
+            'map': MappedFile,
+            'slice': io_slice,
+            'find': io_find,
+        }
+    
+    def parallel_library(self) -> Dict[str, Callable]:
+        return {
+            'map': self.parallel_map,
+            'reduce': self.parallel_reduce,
+            'for_each': self.parallel_for_each,
+            'workers': lambda: self.workers,
+        }
+    
+    def tasks_library(self) -> Dict[str, Callable]:
+        return {
+            'channel': lambda capacity=0: Channel(self, capacity),
+            'send': lambda channel, value: expect_channel(channel).send(value),
+            'recv': channel_recv,
+            'close': lambda channel: expect_channel(channel).close(),
+            'sleep': self.task_sleep,
+        }
+    
+    @staticmethod
+    def random_library() -> Dict[str, Callable]:
+        return {
             'randint': lambda a, b: py_random.randint(a, b),
             'random': lambda: py_random.random(),
             'choice': lambda lst: py_random.choice(lst),
@@ -90,21 +3180,52 @@ class TourmalineInterpreter:
             'randrange': lambda start, stop=None, step=1: py_random.randrange(start, stop, step) if stop else py_random.randrange(start),
         }
     
-    def list_append(self, lst, item):
+    @staticmethod
+    def array_library() -> Dict[str, Callable]:
+        return {
+            'from_list': array_from_list,
+            'to_list': array_to_list,
+            'zeros': array_zeros,
+            'range': array_range,
+            'copy': array_copy,
+            'slice': array_slice,
+            'set': array_set,
+            'sum': array_sum,
+            'mean': array_mean,
+            'min': array_min,
+            'max': array_max,
+            'dot': array_dot,
+        }
+    
+    @staticmethod
+    def strings_library() -> Dict[str, Callable]:
+        return {
+            'builder': StringBuilder,
+            'add': strings_add,
+            'build': strings_build,
+            'join': strings_join,
+            'split': strings_split,
+            'format': strings_format,
+        }
+    
+    @staticmethod
+    def list_append(lst, item):
         """Append item to list"""
         if not isinstance(lst, list):
             raise TourmalineError("append() requires a list as first argument")
         lst.append(item)
         return lst
     
-    def list_insert(self, lst, index, item):
+    @staticmethod
+    def list_insert(lst, index, item):
         """Insert item at index in list"""
         if not isinstance(lst, list):
             raise TourmalineError("insert() requires a list as first argument")
         lst.insert(index, item)
         return lst
     
-    def list_remove(self, lst, item):
+    @staticmethod
+    def list_remove(lst, item):
         """Remove first occurrence of item from list"""
         if not isinstance(lst, list):
             raise TourmalineError("remove() requires a list as first argument")
@@ -114,7 +3235,8 @@ class TourmalineInterpreter:
             raise TourmalineError(f"Item '{item}' not found in list")
         return lst
     
-    def list_pop(self, lst, index=-1):
+    @staticmethod
+    def list_pop(lst, index=-1):
         """Remove and return item at index (default last)"""
         if not isinstance(lst, list):
             raise TourmalineError("pop() requires a list as first argument")
@@ -122,14 +3244,170 @@ class TourmalineInterpreter:
             raise TourmalineError("Cannot pop from empty list")
         return lst.pop(index)
     
-    def list_clear(self, lst):
+    @staticmethod
+    def list_clear(lst):
         """Remove all items from list"""
         if not isinstance(lst, list):
             raise TourmalineError("clear() requires a list as first argument")
         lst.clear()
         return lst
     
-    def safe_int(self, value):
+    @staticmethod
+    def make_range(start, stop=None, step=1):
+        """Lazy sequence of integers from start up to, not including, stop"""
+        if stop is None:
+            start, stop = 0, start
+        bounds = []
+        for value in (start, stop, step):
+            # Division always gives floats, so accept whole ones like 10.0
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise TourmalineError(f"range() expects whole numbers, got {value!r}")
+            bounds.append(value)
+        if bounds[2] == 0:
+            raise TourmalineError("range() step cannot be zero")
+        return range(*bounds)
+    
+    def iterate(self, value: Any) -> Iterator:
+        """Iterator for a `for` loop: list items, dictionary keys, string characters, ..."""
+        if isinstance(value, TourmalineFile):
+            return self.yielding_lines(iter(value))
+        try:
+            return iter(value)
+        except TypeError:
+            raise TourmalineError(f"Cannot loop over a value of type {type(value).__name__}")
+    
+    def parallel_function(self, value: Any) -> str:
+        """Name of the user function a parallel call should run"""
+        # A function name evaluates to itself; builtins cannot be sent to workers
+        if isinstance(value, str) and value in self.functions:
+            if self.functions[value].module is not self.module:
+                raise TourmalineError(f"'{value}' is imported from another module; parallel calls need a function defined in this one")
+            return value
+        raise TourmalineError(f"expected a function defined in the program, got {type(value).__name__}")
+    
+    def worker_setup(self) -> Tuple[bytes, bytes]:
+        """What workers need to run this program's functions, pickled: the definitions they
+        start with, and the globals those read, sent with every call instead"""
+        # Changing a global then only changes what the next call sends, not the workers
+        definitions = [func.definition for func in self.functions.values()]
+        shared = {}
+        for name in set(referenced_names(definitions)):
+            if name in self.variables:
+                # Values such as open files stay behind; using one in a worker is an error there
+                try:
+                    shared[name] = pickle.dumps(self.variables[name])
+                except Exception:
+                    pass
+        setup = pickle.dumps((self.engine, self.max_depth, self.optimize, definitions, self.structs))
+        return setup, pickle.dumps(shared)
+    
+    def run_in_workers(self, task: Callable, name: str, items: List[Any], chunk_size: Optional[int]) -> List[Any]:
+        """Run task(name, globals, item) on every item in the worker processes, keeping the results in order"""
+        if self.worker_pool is None:
+            self.worker_pool = WorkerPool(self.workers)
+        setup, shared = self.worker_setup()
+        self.worker_pool.prepare(setup)
+        if chunk_size is None:
+            chunk_size = -(-len(items) // (self.workers * CHUNKS_PER_WORKER))
+        return self.worker_pool.map(functools.partial(task, name, shared), items, max(1, int(chunk_size)))
+    
+    def parallel_map(self, func: Any, items: Any, chunk_size: Optional[int] = None) -> List[Any]:
+        """List of func(item) for every item, computed by worker processes"""
+        name = self.parallel_function(func)
+        items = list(self.iterate(items))
+        if self.workers == 1 or len(items) < 2:
+            return [self.call_function(name, [item]) for item in items]
+        return self.run_in_workers(worker_call, name, items, chunk_size)
+    
+    def parallel_for_each(self, func: Any, items: Any, chunk_size: Optional[int] = None):
+        """Call func(item) for every item in worker processes, for its side effects"""
+        name = self.parallel_function(func)
+        items = list(self.iterate(items))
+        if self.workers == 1 or len(items) < 2:
+            for item in items:
+                self.call_function(name, [item])
+        else:
+            self.run_in_workers(worker_run, name, items, chunk_size)
+        return None
+    
+    def parallel_reduce(self, func: Any, items: Any, initial: Any = UNSET) -> Any:
+        """Combine items with func(total, item); batches are combined in parallel, so func must be associative"""
+        name = self.parallel_function(func)
+        items = list(self.iterate(items))
+        if not items and initial is UNSET:
+            raise TourmalineError("reduce() of an empty list needs an initial value")
+        if self.workers > 1 and len(items) >= 2 * self.workers:
+            # Each worker reduces one batch, then the batch totals are reduced here
+            batches = chunked(items, -(-len(items) // self.workers))
+            items = self.run_in_workers(worker_reduce, name, batches, 1)
+        if initial is not UNSET:
+            items.insert(0, initial)
+        return functools.reduce(lambda total, item: self.call_function(name, [total, item]), items)
+    
+    def yielding(self, func: Callable) -> Callable:
+        """Wrap a library function that waits on the operating system to let other tasks run meanwhile"""
+        def call(*args):
+            if self.scheduler is None:
+                return func(*args)
+            return self.scheduler.blocking(func, args)
+        return call
+    
+    def file_lines(self, source: Any) -> Iterator[str]:
+        """io.lines(), reading each line without holding up other tasks"""
+        # Mapped files are already in memory, so there is nothing to wait for
+        if isinstance(source, MappedFile):
+            return io_lines(source)
+        return self.yielding_lines(io_lines(source))
+    
+    def yielding_lines(self, lines: Iterator[str]) -> Iterator[str]:
+        """Lines read from disk one at a time, letting other tasks run while each one is read"""
+        read = self.yielding(next)
+        while True:
+            try:
+                yield read(lines)
+            except StopIteration:
+                return
+    
+    def spawn(self, name: str, args: List[Any]):
+        """Start a task running name(*args); it first runs when the current task waits"""
+        if name not in self.functions and name not in self.builtins:
+            raise TourmalineError(f"Undefined function: {name}")
+        if self.scheduler is None:
+            self.scheduler = TaskScheduler(self)
+        self.scheduler.spawn(name, args, self.module)
+    
+    def task_sleep(self, seconds: Any):
+        """Pause the current task, letting the others run"""
+        if not is_number(seconds) or seconds < 0:
+            raise TourmalineError(f"sleep() expects a number of seconds of at least 0, got {seconds!r}")
+        if self.scheduler is None:
+            time.sleep(seconds)
+        else:
+            self.scheduler.wait(seconds)
+    
+    def save_state(self) -> Tuple:
+        """The running task's share of the interpreter, to put back when it resumes"""
+        return (self.frame, self.depth, self.return_value, self.has_returned, self.tail_call, self.module,
+                self.hooks.save_frames())
+    
+    def restore_state(self, state: Optional[Tuple]):
+        """Put back a saved state, or a fresh one for a new task when state is None"""
+        if state is None:
+            state = (None, 0, None, False, None, self.main, None)
+        self.frame, self.depth, self.return_value, self.has_returned, self.tail_call, module, frames = state
+        self.use_module(module)
+        self.hooks.restore_frames(frames)
+    
+    def close(self):
+        """Stop the worker processes started by the parallel library"""
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+            self.worker_pool = None
+    
+    @staticmethod
+    def safe_int(value):
         """Safe integer conversion with better error handling"""
         try:
             if isinstance(value, str):
@@ -148,7 +3426,8 @@ class TourmalineInterpreter:
         except ValueError as e:
             raise TourmalineError(f"Cannot convert '{value}' to integer: {str(e)}")
     
-    def safe_float(self, value):
+    @staticmethod
+    def safe_float(value):
         """Safe float conversion with better error handling"""
         try:
             if isinstance(value, str):
@@ -162,813 +3441,748 @@ class TourmalineInterpreter:
         except ValueError as e:
             raise TourmalineError(f"Cannot convert '{value}' to float: {str(e)}")
     
-    def tokenize(self, code: str) -> List[str]:
-        """Simple tokenizer"""
-        # Handle strings and preserve them
-        tokens = []
-        current = ""
-        in_string = False
-        string_char = None
-        
-        i = 0
-        while i < len(code):
-            char = code[i]
-            
-            if char in ('"', "'") and (i == 0 or code[i-1] != '\\'):
-                if not in_string:
-                    in_string = True
-                    string_char = char
-                    current = char
-                elif char == string_char:
-                    in_string = False
-                    current += char
-                    tokens.append(current)
-                    current = ""
-                    string_char = None
-                    i += 1
-                    continue
-                else:
-                    current += char
-            elif in_string:
-                current += char
-            elif char in ' \t\n':
-                if current:
-                    tokens.append(current)
-                    current = ""
-            elif char in '()[]{},:':
-                if current:
-                    tokens.append(current)
-                    current = ""
-                tokens.append(char)
-            elif char in '=!<>+-*/%':
-                if current:
-                    tokens.append(current)
-                    current = ""
-                # Check for multi-char operators
-                if i + 1 < len(code) and code[i:i+2] in ['==', '!=', '<=', '>=', '+=', '-=', '*=', '/=']:
-                    tokens.append(code[i:i+2])
-                    i += 2
-                    continue
-                tokens.append(char)
-            elif char == '.':
-                # Check if it's a decimal point in a number or member access
-                if current and current[0].isdigit():
-                    current += char
-                else:
-                    if current:
-                        tokens.append(current)
-                        current = ""
-                    tokens.append(char)
-            else:
-                current += char
-            
-            i += 1
-        
-        if current:
-            tokens.append(current)
-        
-        return tokens
-    
-    def parse_value(self, token: str) -> Any:
-        """Parse a token into a value"""
-        # String
-        if token.startswith('"') or token.startswith("'"):
-            return token[1:-1].replace('\\n', '\n').replace('\\t', '\t')
-        # Boolean
-        if token == 'true':
-            return True
-        if token == 'false':
-            return False
-        # None/nil
-        if token == 'nil':
-            return None
-        # Number
-        try:
-            if '.' in token:
-                return float(token)
-            return int(token)
-        except ValueError:
-            pass
-        # Variable reference (don't try to resolve functions here)
-        if token in self.variables:
-            return self.variables[token]
-        if token in self.builtins:
-            return self.builtins[token]
-        
+    def tokenize(self, code: str) -> List[Token]:
+        """Split code into tokens, leaving out line breaks"""
+        return [token for token in lex(code) if token.kind != 'newline']
+    
+    def lookup_variable(self, name: str) -> Any:
+        """Resolve a name to a variable, builtin or function name"""
+        if name in self.variables:
+            return self.variables[name]
+        if name in self.builtins:
+            return self.builtins[name]
         # If it's a function name, return the name for later resolution
-        if token in self.functions:
-            return token
-        
-        raise TourmalineError(f"Undefined variable: {token}")
+        if name in self.functions:
+            return name
+        raise TourmalineError(f"Undefined variable: {name}")
+    
+    def get_member(self, obj: Any, member: str) -> Any:
+        """Access a library member or dictionary key with dot notation"""
+        # Handle library access
+        library = self.load_library(obj) if isinstance(obj, str) else None
+        if library is not None:
+            if member in library:
+                return library[member]
+            raise TourmalineError(f"Library '{obj}' has no function '{member}'")
+        if isinstance(obj, TourmalineModule):
+            return self.module_member(obj, member)
+        # Handle dictionary access
+        if isinstance(obj, dict):
+            return obj.get(member)
+        raise TourmalineError(f"Cannot access member of {type(obj).__name__}")
+    
+    def call_function(self, name: str, args: List[Any]) -> Any:
+        """Call a user-defined or built-in function by name"""
+        if name not in self.functions and name not in self.builtins:
+            raise TourmalineError(f"Undefined function: {name}")
+        try:
+            if name in self.functions:
+                return self.call_user_function(name, args)
+            return self.builtins[name](*args)
+        except CallDepthError:
+            raise
+        except RecursionError:
+            raise CallDepthError(f"Maximum call depth exceeded in '{name}' (Python recursion limit)")
+        except Exception as e:
+            raise TourmalineError(f"Error calling function '{name}': {e}")
+    
+    def call_builtin(self, name: str, builtin: Callable, args: List[Any]) -> Any:
+        """Call a builtin bound ahead of time"""
+        try:
+            return builtin(*args)
+        except Exception as e:
+            raise TourmalineError(f"Error calling function '{name}': {e}")
+    
+    def call_library(self, lib_name: str, func_name: str, args: List[Any]) -> Any:
+        """Call a function from a standard library"""
+        library = self.load_library(lib_name)
+        if library is None:
+            module = self.variables.get(lib_name)
+            if isinstance(module, TourmalineModule):
+                return self.call_module(module, func_name, args)
+            raise TourmalineError(f"Library '{lib_name}' not found")
+        if func_name not in library:
+            raise TourmalineError(f"Library '{lib_name}' has no function '{func_name}'")
+        return self.call_bound_library(lib_name, func_name, library[func_name], args)
+    
+    def call_bound_library(self, lib_name: str, func_name: str, func: Callable, args: List[Any]) -> Any:
+        """Call a library function bound ahead of time"""
+        if self.tracer is not None:
+            self.tracer.library(lib_name, func_name, args)
+        try:
+            return func(*args)
+        except Exception as e:
+            raise TourmalineError(f"Error calling {lib_name}.{func_name}(): {e}")
     
-    def evaluate_expression(self, tokens: List[str], start: int = 0, end: int = None) -> Any:
+    def evaluate_expression(self, tokens: List[Token], start: int = 0, end: int = None) -> Any:
         """Evaluate an expression"""
         if end is None:
             end = len(tokens)
-        
-        if start >= end:
-            raise TourmalineError("Empty expression")
-        
-        # Handle list literals BEFORE anything else
-        if tokens[start] == '[':
-            return self.parse_list(tokens, start)
-        
-        # Handle dictionary literals BEFORE anything else
-        if tokens[start] == '{':
-            return self.parse_dict(tokens, start)
-        
-        # Single token
-        if end - start == 1:
-            return self.parse_value(tokens[start])
-        
-        # Now resolve all function calls in the expression
-        tokens = self.resolve_function_calls(tokens, start, end)
-        start = 0
-        end = len(tokens)
-        
-        # Check again after function resolution
-        if start >= end:
-            return None
-        
-        if end - start == 1:
-            return self.parse_value(tokens[0])
-        
-        # Handle parentheses (wrapped expression)
-        if tokens[start] == '(' and tokens[end-1] == ')':
-            depth = 1
-            i = start + 1
-            valid_wrap = True
-            while i < end - 1:
-                if tokens[i] == '(':
-                    depth += 1
-                elif tokens[i] == ')':
-                    depth -= 1
-                    if depth == 0:
-                        valid_wrap = False
-                        break
-                i += 1
-            if valid_wrap:
-                return self.evaluate_expression(tokens, start + 1, end - 1)
-        
-        # Handle dictionary literals
-        if tokens[start] == '{':
-            return self.parse_dict(tokens, start)
-        
-        # Logical OR
-        for i in range(end - 1, start, -1):
-            if tokens[i] == 'or':
-                left = self.evaluate_expression(tokens, start, i)
-                right = self.evaluate_expression(tokens, i + 1, end)
-                return left or right
-        
-        # Logical AND
-        for i in range(end - 1, start, -1):
-            if tokens[i] == 'and':
-                left = self.evaluate_expression(tokens, start, i)
-                right = self.evaluate_expression(tokens, i + 1, end)
-                return left and right
-        
-        # Comparison operators
-        for i in range(end - 1, start, -1):
-            if tokens[i] in ['==', '!=', '<', '>', '<=', '>=']:
-                left = self.evaluate_expression(tokens, start, i)
-                right = self.evaluate_expression(tokens, i + 1, end)
-                op = tokens[i]
-                if op == '==': return left == right
-                if op == '!=': return left != right
-                if op == '<': return left < right
-                if op == '>': return left > right
-                if op == '<=': return left <= right
-                if op == '>=': return left >= right
-        
-        # Addition and subtraction
-        for i in range(end - 1, start, -1):
-            if tokens[i] in ['+', '-'] and i > start:
-                left = self.evaluate_expression(tokens, start, i)
-                right = self.evaluate_expression(tokens, i + 1, end)
-                if tokens[i] == '+':
-                    return left + right
-                else:
-                    return left - right
-        
-        # Multiplication, division, modulo
-        for i in range(end - 1, start, -1):
-            if tokens[i] in ['*', '/', '%']:
-                left = self.evaluate_expression(tokens, start, i)
-                right = self.evaluate_expression(tokens, i + 1, end)
-                if tokens[i] == '*':
-                    return left * right
-                elif tokens[i] == '/':
-                    return left / right
-                else:
-                    return left % right
-        
-        # Member access (dot notation) - including library access
-        for i in range(start, end):
-            if tokens[i] == '.':
-                obj = self.evaluate_expression(tokens, start, i)
-                
-                # Handle library access
-                if isinstance(obj, str) and obj in self.libraries:
-                    if i + 1 < end:
-                        member_name = tokens[i + 1]
-                        if member_name in self.libraries[obj]:
-                            return self.libraries[obj][member_name]
-                        raise TourmalineError(f"Library '{obj}' has no function '{member_name}'")
-                
-                # Handle dictionary access
-                if isinstance(obj, dict):
-                    member = tokens[i + 1]
-                    return obj.get(member)
-                
-                raise TourmalineError(f"Cannot access member of {type(obj).__name__}")
-        
-        # Index access
-        for i in range(start, end):
-            if tokens[i] == '[':
-                obj = self.evaluate_expression(tokens, start, i)
-                depth = 1
-                j = i + 1
-                while j < end and depth > 0:
-                    if tokens[j] == '[':
-                        depth += 1
-                    elif tokens[j] == ']':
-                        depth -= 1
-                    j += 1
-                index = self.evaluate_expression(tokens, i + 1, j - 1)
-                return obj[index]
-        
-        raise TourmalineError(f"Cannot evaluate expression: {' '.join(tokens[start:end])}")
+        return self.eval_node(self.parser.expressions.parse(tokens[start:end], 0))
     
-    def parse_arguments(self, tokens: List[str], start: int) -> List[Any]:
-        """Parse function arguments"""
-        if start >= len(tokens) or tokens[start] != '(':
-            raise TourmalineError("Expected '('")
-        
-        depth = 1
-        i = start + 1
-        args = []
-        arg_start = i
-        
-        while i < len(tokens) and depth > 0:
-            if tokens[i] == '(':
-                depth += 1
-            elif tokens[i] == ')':
-                depth -= 1
-                if depth == 0:
-                    if i > arg_start:
-                        args.append(self.evaluate_expression(tokens, arg_start, i))
-                    break
-            elif tokens[i] == '[':
-                depth += 1
-            elif tokens[i] == ']':
-                depth -= 1
-            elif tokens[i] == ',' and depth == 1:
-                if i > arg_start:
-                    args.append(self.evaluate_expression(tokens, arg_start, i))
-                arg_start = i + 1
-            i += 1
-        
-        return args
+    def eval_node(self, node: Node) -> Any:
+        """Evaluate a parsed expression tree"""
+        return self.expression_handlers[type(node)](node)
     
-    def parse_list(self, tokens: List[str], start: int) -> List[Any]:
-        """Parse a list literal"""
-        if tokens[start] != '[':
-            raise TourmalineError("Expected '['")
-        
-        depth = 1
-        i = start + 1
-        items = []
-        item_start = i
-        
-        while i < len(tokens) and depth > 0:
-            if tokens[i] == '[':
-                depth += 1
-            elif tokens[i] == ']':
-                depth -= 1
-                if depth == 0:
-                    if i > item_start:
-                        items.append(self.evaluate_expression(tokens, item_start, i))
-            elif tokens[i] == ',' and depth == 1:
-                if i > item_start:
-                    items.append(self.evaluate_expression(tokens, item_start, i))
-                item_start = i + 1
-            i += 1
-        
-        return items
+    def eval_constant(self, node: Constant) -> Any:
+        return node.value
     
-    def parse_dict(self, tokens: List[str], start: int) -> Dict[str, Any]:
-        """Parse a dictionary literal"""
-        if tokens[start] != '{':
-            raise TourmalineError("Expected '{'")
-        
-        depth = 1
-        i = start + 1
-        result = {}
-        
-        while i < len(tokens) and depth > 0:
-            if tokens[i] == '{':
-                depth += 1
-                i += 1
-            elif tokens[i] == '}':
-                depth -= 1
-                if depth == 0:
-                    break
-                i += 1
-            elif tokens[i] == ',':
-                i += 1
-            else:
-                # Parse key
-                key_start = i
-                while i < len(tokens) and tokens[i] != ':':
-                    if tokens[i] in ['{', '[']:
-                        # Skip nested structures
-                        bracket = tokens[i]
-                        close_bracket = '}' if bracket == '{' else ']'
-                        depth2 = 1
-                        i += 1
-                        while i < len(tokens) and depth2 > 0:
-                            if tokens[i] == bracket:
-                                depth2 += 1
-                            elif tokens[i] == close_bracket:
-                                depth2 -= 1
-                            i += 1
-                    else:
-                        i += 1
-                
-                if key_start >= i:
-                    raise TourmalineError("Expected key in dictionary")
-                    
-                key = self.evaluate_expression(tokens, key_start, i)
-                
-                if i >= len(tokens) or tokens[i] != ':':
-                    raise TourmalineError("Expected ':' after dictionary key")
-                i += 1  # Skip ':'
-                
-                # Parse value
-                value_start = i
-                while i < len(tokens) and tokens[i] not in [',', '}']:
-                    if tokens[i] in ['{', '[']:
-                        bracket = tokens[i]
-                        close_bracket = '}' if bracket == '{' else ']'
-                        depth2 = 1
-                        i += 1
-                        while i < len(tokens) and depth2 > 0:
-                            if tokens[i] == bracket:
-                                depth2 += 1
-                            elif tokens[i] == close_bracket:
-                                depth2 -= 1
-                            i += 1
-                    else:
-                        i += 1
-                
-                if value_start >= i:
-                    raise TourmalineError("Expected value in dictionary")
-                
-                value = self.evaluate_expression(tokens, value_start, i)
-                result[str(key)] = value
-        
-        return result
+    def eval_name(self, node: Name) -> Any:
+        name = node.name
+        if name in self.variables:
+            return self.variables[name]
+        return self.lookup_variable(name)
     
-    def resolve_function_calls(self, tokens: List[str], start: int, end: int) -> List[str]:
-        """Resolve all function calls in a token list and return new token list"""
-        result = []
-        i = start
-        
-        while i < end:
-            # Skip dictionary literals entirely
-            if tokens[i] == '{':
-                depth = 1
-                result.append(tokens[i])
-                i += 1
-                while i < end and depth > 0:
-                    if tokens[i] == '{':
-                        depth += 1
-                    elif tokens[i] == '}':
-                        depth -= 1
-                    result.append(tokens[i])
-                    i += 1
-                continue
-            
-            # Skip list literals entirely
-            if tokens[i] == '[':
-                depth = 1
-                result.append(tokens[i])
-                i += 1
-                while i < end and depth > 0:
-                    if tokens[i] == '[':
-                        depth += 1
-                    elif tokens[i] == ']':
-                        depth -= 1
-                    result.append(tokens[i])
-                    i += 1
-                continue
-            
-            # Check for library.function() calls
-            if i + 2 < end and tokens[i + 1] == '.' and tokens[i + 3] == '(':
-                lib_name = tokens[i]
-                func_name = tokens[i + 2]
-                
-                if lib_name in self.libraries and func_name in self.libraries[lib_name]:
-                    # Find matching closing parenthesis
-                    depth = 1
-                    j = i + 4
-                    while j < end and depth > 0:
-                        if tokens[j] == '(':
-                            depth += 1
-                        elif tokens[j] == ')':
-                            depth -= 1
-                        j += 1
-                    
-                    # Parse and call the function
-                    try:
-                        args = self.parse_arguments(tokens, i + 3)
-                        func = self.libraries[lib_name][func_name]
-                        func_result = func(*args)
-                        
-                        # Add result as a token
-                        if func_result is not None:
-                            if isinstance(func_result, str):
-                                result.append('"' + func_result + '"')
-                            else:
-                                result.append(str(func_result))
-                    except Exception as e:
-                        raise TourmalineError(f"Error calling {lib_name}.{func_name}(): {e}")
-                    
-                    i = j
-                    continue
-            
-            # Check if this is a function call
-            if i + 1 < end and tokens[i + 1] == '(':
-                func_name = tokens[i]
-                
-                if func_name in self.functions or func_name in self.builtins:
-                    # Find matching closing parenthesis
-                    depth = 1
-                    j = i + 2
-                    while j < end and depth > 0:
-                        if tokens[j] == '(':
-                            depth += 1
-                        elif tokens[j] == ')':
-                            depth -= 1
-                        j += 1
-                    
-                    # Parse and call the function
-                    try:
-                        args = self.parse_arguments(tokens, i + 1)
-                        
-                        if func_name in self.functions:
-                            func_result = self.call_user_function(func_name, args)
-                        else:
-                            func_result = self.builtins[func_name](*args)
-                        
-                        # Add result as a token (preserve type for non-strings)
-                        if func_result is not None:
-                            if isinstance(func_result, str):
-                                result.append('"' + func_result + '"')
-                            else:
-                                result.append(str(func_result))
-                    except Exception as e:
-                        raise TourmalineError(f"Error calling function '{func_name}': {e}")
-                    
-                    i = j
-                    continue
-            
-            result.append(tokens[i])
-            i += 1
-        
-        return result
+    def eval_local(self, node: LocalName) -> Any:
+        value = self.frame[node.slot]
+        if value is UNSET:
+            # Not bound yet in this call; fall back to the global
+            return self.lookup_variable(node.name)
+        return value
+    
+    def eval_binary(self, node: BinaryOp) -> Any:
+        op = node.op
+        left = self.eval_node(node.left)
+        # Logical operators short-circuit
+        if op == 'and':
+            return left and self.eval_node(node.right)
+        if op == 'or':
+            return left or self.eval_node(node.right)
+        return BINARY_OPERATORS[op](left, self.eval_node(node.right))
+    
+    def eval_unary(self, node: UnaryOp) -> Any:
+        return UNARY_OPERATORS[node.op](self.eval_node(node.operand))
+    
+    def eval_call(self, node: Call) -> Any:
+        args = [self.eval_node(arg) for arg in node.args]
+        # A user function defined after binding may shadow the builtin
+        if node.target is not None and node.name not in self.functions:
+            return self.call_builtin(node.name, node.target, args)
+        return self.call_function(node.name, args)
+    
+    def eval_library_call(self, node: LibraryCall) -> Any:
+        args = [self.eval_node(arg) for arg in node.args]
+        if node.target is not None:
+            return self.call_bound_library(node.library, node.name, node.target, args)
+        return self.call_library(node.library, node.name, args)
+    
+    def eval_member(self, node: Member) -> Any:
+        return self.get_member(self.eval_node(node.obj), node.name)
+    
+    def eval_index(self, node: Index) -> Any:
+        return self.eval_node(node.obj)[self.eval_node(node.index)]
+    
+    def eval_list(self, node: ListLiteral) -> List[Any]:
+        return [self.eval_node(item) for item in node.items]
+    
+    def eval_dict(self, node: DictLiteral) -> Dict[str, Any]:
+        return {str(self.eval_node(key)): self.eval_node(value) for key, value in node.pairs}
+    
+    def eval_invalid(self, node: InvalidExpression) -> Any:
+        raise TourmalineError(node.message)
+    
+    def enter_call(self, func_name: str):
+        """Count a new user function call against max_depth"""
+        if self.depth >= self.max_depth:
+            raise CallDepthError(f"Maximum call depth of {self.max_depth} exceeded in '{func_name}'")
+        self.depth += 1
     
     def call_user_function(self, func_name: str, args: List[Any]) -> Any:
         """Call a user-defined function"""
         if func_name not in self.functions:
             raise TourmalineError(f"Function '{func_name}' not defined")
         
-        func_lines = self.functions[func_name]
-        
-        # Parse function definition to get parameters
-        first_line = func_lines[0].strip()
-        tokens = self.tokenize(first_line)
-        
-        # Extract parameter names
-        params = []
-        if '(' in tokens:
-            paren_idx = tokens.index('(')
-            i = paren_idx + 1
-            while i < len(tokens) and tokens[i] != ')':
-                if tokens[i] != ',':
-                    params.append(tokens[i])
-                i += 1
-        
-        # Save current variable state
-        saved_vars = self.variables.copy()
-        
-        # Set parameter values
-        for i, param in enumerate(params):
-            if i < len(args):
-                self.variables[param] = args[i]
-        
-        # Set a flag for return value
-        self.return_value = None
-        self.has_returned = False
-        
-        # Execute function body
-        body = '\n'.join(func_lines[1:-1])  # Exclude first and last (end) lines
+        func = self.functions[func_name]
+        if func.module is not self.module:
+            # Imported with `from`: the body sees its own module's globals
+            return self.call_in_module(func.module, func_name, args)
+        func.check_arity(len(args))
+        memo = func.memo
+        if memo is not None:
+            key = memo.key(args)
+            if key is not None:
+                value = memo.lookup(key)
+                if value is not UNSET:
+                    return value
+        self.enter_call(func_name)
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.call(func_name, args)
+        value = None
+        try:
+            if self.depth > TREE_WALKER_DEPTH or isinstance(func.body, CodeObject):
+                body = self.compiler.function_code(func) if tracer is None else self.compiler.traced_body(func)
+                value = self.vm.run(body, args)
+            else:
+                value = self.run_function(func, args)
+            if memo is not None and key is not None:
+                memo.store(key, value)
+            return value
+        finally:
+            self.depth -= 1
+            if tracer is not None:
+                tracer.ret(value)
+    
+    def run_function(self, func: TourmalineFunction, args: List[Any]) -> Any:
+        """Run a function body on the tree walker"""
+        saved_frame = self.frame
+        pending = []  # (MemoCache, key) of cached functions tail-called on the way
         try:
-            self.execute(body)
+            while True:
+                # Parameters fill the first slots of a fresh frame
+                self.frame = args + [UNSET] * (len(func.local_names) - func.arity)
+                self.return_value = None
+                self.has_returned = False
+                self.exec_block(func.body)
+                if self.tail_call is None:
+                    value = self.return_value
+                    break
+                # `return f(...)` ran no call yet; run f in place of this function
+                func, args = self.tail_call
+                self.tail_call = None
+                memo = func.memo
+                if memo is not None:
+                    key = memo.key(args)
+                    if key is not None:
+                        value = memo.lookup(key)
+                        if value is not UNSET:
+                            break
+                        pending.append((memo, key))
+                if self.tracer is not None:
+                    self.tracer.ret()
+                    self.tracer.call(func.name, args)
+            for memo, key in pending:
+                memo.store(key, value)
+            return value
         finally:
-            # Get return value before restoring
-            result = self.return_value
-            # Restore variable state
-            self.variables = saved_vars
+            self.frame = saved_frame
             # Clear return flags
             self.has_returned = False
             self.return_value = None
-        
-        return result
+            self.tail_call = None
+    
+    def parse(self, code: str) -> Block:
+        """Parse Tourmaline code into a syntax tree"""
+        return self.parser.parse(code)
+    
+    def parse_file(self, filename: str, use_cache: bool = True) -> Block:
+        """Parse a source file, reusing its cached syntax tree while the source is unchanged"""
+        with open(filename, 'r', encoding='utf-8') as f:
+            code = f.read()
+        return self.parse_source(code, filename, use_cache)
+    
+    def parse_source(self, code: str, filename: str, use_cache: bool) -> Block:
+        """Parse the source of a file, through the cache next to it when use_cache is set"""
+        if not use_cache:
+            return self.parse(code)
+        path = cache_path(filename)
+        key = cache_key(code)
+        program = load_cached_program(path, key)
+        if program is None:
+            program = self.parse(code)
+            store_cached_program(path, key, program)
+        return program
     
     def execute(self, code: str):
         """Execute Tourmaline code"""
-        lines = code.split('\n')
-        i = 0
+        self.run_program(self.parse(code))
+    
+    def execute_file(self, filename: str, use_cache: bool = True):
+        """Execute a Tourmaline source file"""
+        # Modules it imports are found relative to it, and cached like it
+        self.main.path = os.path.abspath(filename)
+        self.use_cache = use_cache
+        self.run_program(self.parse_file(filename, use_cache))
+    
+    def run_program(self, program: Block):
+        """Execute a parsed program"""
+        if self.optimize:
+            program = self.optimizer.optimize(program)
+        self.run_optimized(program)
+    
+    def run_optimized(self, program: Block, prepared: Any = None):
+        """Run an optimized program, reusing its prepared form when one is given"""
+        try:
+            if self.hooks:
+                self.run_traced(program)
+            else:
+                self.run_prepared(prepared if prepared is not None else self.prepare(program))
+        finally:
+            if self.scheduler is not None:
+                # Tasks the program did not wait for, because it failed, are cancelled
+                scheduler, self.scheduler = self.scheduler, None
+                scheduler.close()
+    
+    def run_traced(self, program: Block):
+        """Run a program with instrumented code, reporting to the hooks"""
+        # Hooks swap in instrumented code so runs without them pay nothing
+        handlers = self.statement_handlers
+        self.statement_handlers = self.traced_handlers(handlers)
+        self.compiler.trace_lines = True
+        self.tracer = self.hooks
+        self.tracer.call('<program>', [])
+        try:
+            self.run_prepared(self.prepare(program))
+        finally:
+            self.tracer.ret()
+            self.tracer = None
+            self.statement_handlers = handlers
+            self.compiler.trace_lines = False
+    
+    def prepare(self, program: Block) -> Any:
+        """Resolve an optimized program for the tree walker, or compile it for the VM"""
+        if self.engine == 'vm':
+            return self.compiler.compile_program(program)
+        return self.resolver.resolve_program(program)
+    
+    def run_prepared(self, prepared: Any):
+        """Run a program prepared for the selected engine"""
+        if isinstance(prepared, CodeObject):
+            self.vm.run(prepared)
+            self.wait_for_tasks()
+            return
+        try:
+            self.exec_block(prepared)
+            self.wait_for_tasks()
+        finally:
+            # A top-level return only ends the current program
+            self.has_returned = False
+            self.return_value = None
+    
+    def compile(self, source: str) -> TourmalineProgram:
+        """Parse and optimize source once, to run it any number of times with run()"""
+        tree = self.parse(source)
+        if self.optimize:
+            # Against no functions: each run starts without any
+            tree = TourmalineOptimizer(self.builtins, {}).optimize(tree)
+        return TourmalineProgram(source, tree, self.optimize)
+    
+    def run(self, program: TourmalineProgram, inputs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run a compiled program in fresh globals, starting from inputs, and return its globals"""
+        self.reset(inputs)
+        prepared = None
+        if not self.hooks:
+            prepared = self.prepared.get(program)
+            if prepared is None:
+                prepared = self.prepared[program] = self.prepare(program.tree)
+        self.run_optimized(program.tree, prepared)
+        return dict(self.variables)
+    
+    def reset(self, inputs: Optional[Dict[str, Any]] = None):
+        """Forget the globals, functions and structs of earlier programs"""
+        # Cleared in place: the optimizer shares the functions dictionary
+        self.restore_state(None)
+        self.variables.clear()
+        self.functions.clear()
+        self.structs.clear()
+        # Modules run again for the next program; their compiled form is kept
+        self.modules.clear()
+        self.main.path = None
+        if inputs:
+            self.variables.update(inputs)
+    
+    def add_builtin(self, name: str, func: Callable):
+        """Make func callable from this interpreter's programs as name()"""
+        if isinstance(self.builtins, MappingProxyType):
+            # Copy on write: other interpreters keep the shared table
+            self.builtins = dict(self.builtins)
+            self.optimizer.builtins = self.resolver.builtins = self.builtins
+        self.builtins[name] = func
+        # Prepared programs were bound to the old builtins
+        self.prepared.clear()
+
+    def restore_defaults(self):
+        """Forget added builtins and hooks as well as what reset() forgets, as if newly created"""
+        self.reset()
+        if self.builtins is not type(self).shared_builtins:
+            self.builtins = type(self).shared_builtins
+            self.optimizer.builtins = self.resolver.builtins = self.builtins
+            # Bound to the added builtins; programs prepared against the shared ones stay
+            self.prepared.clear()
+        self.hooks = TourmalineHooks()
+        self.tracer = None
+        self.compiler.trace_lines = False
+
+    def use_module(self, module: TourmalineModule):
+        """Make a module's globals, functions and structs the ones code sees"""
+        self.module = module
+        self.variables = module.variables
+        self.functions = module.functions
+        self.structs = module.structs
+
+    def import_module(self, path: str, name: Optional[str], names: Optional[List[str]]):
+        """Bind a module to name, or the listed members of it to their own names"""
+        if name in self.library_setup:
+            raise TourmalineError(f"'{name}' is the name of a standard library; write import \"{path}\" as another name")
+        module = self.find_module(path)
+        if names is None:
+            # Nothing runs yet, so an import that is never used costs nothing
+            self.variables[name] = module
+            return
+        self.load_module(module)
+        for member in names:
+            if member in module.functions:
+                self.functions[member] = module.functions[member]
+            elif member in module.variables:
+                self.variables[member] = module.variables[member]
+            elif member in module.structs:
+                self.structs[member] = module.structs[member]
+            else:
+                raise TourmalineError(f"Module '{module.name}' has no member '{member}'")
+
+    def find_module(self, path: str) -> TourmalineModule:
+        """The module of a file, found relative to the file importing it"""
+        if not os.path.splitext(path)[1]:
+            path += '.trm'
+        importer = self.module.path
+        folder = os.path.dirname(importer) if importer is not None else os.getcwd()
+        full_path = os.path.normpath(os.path.join(folder, path))
+        module = self.modules.get(full_path)
+        if module is None:
+            if not os.path.isfile(full_path):
+                raise TourmalineError(f"Module '{path}' not found")
+            name = os.path.splitext(os.path.basename(full_path))[0]
+            module = self.modules[full_path] = TourmalineModule(name, full_path)
+        return module
+
+    def load_module(self, module: TourmalineModule):
+        """Run a module's top level, the first time anything in it is used"""
+        if module.loaded:
+            return
+        if module in self.importing:
+            cycle = self.importing[self.importing.index(module):] + [module]
+            raise TourmalineError(f"Circular import: {' -> '.join(m.name for m in cycle)}")
+        program = self.compile_module(module.path)
+        if self.tracer is None:
+            prepared = self.prepared.get(program)
+            if prepared is None:
+                prepared = self.prepared[program] = self.prepare(program.tree)
+        else:
+            # Traced runs need instrumented code, which is not kept
+            prepared = self.prepare(program.tree)
+        state = self.save_state()
+        self.importing.append(module)
+        self.use_module(module)
+        try:
+            if isinstance(prepared, CodeObject):
+                self.vm.run(prepared)
+            else:
+                self.exec_block(prepared)
+        except CallDepthError:
+            raise
+        except TourmalineError as e:
+            # Run again from the start the next time it is used
+            module.variables.clear()
+            module.functions.clear()
+            module.structs.clear()
+            raise TourmalineError(f"Error in module '{module.name}': {e}")
+        finally:
+            self.importing.pop()
+            self.restore_state(state)
+        module.loaded = True
+
+    def compile_module(self, path: str) -> TourmalineProgram:
+        """A module file parsed and optimized once for every interpreter in the process"""
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = (path, self.optimize)
+        cached = TourmalineInterpreter.compiled_modules.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        tree = self.parse_source(source, path, self.use_cache)
+        if self.optimize:
+            # Against no functions, like compile(): a module starts without any
+            tree = TourmalineOptimizer(self.builtins, {}).optimize(tree)
+        program = TourmalineProgram(source, tree, self.optimize)
+        TourmalineInterpreter.compiled_modules[key] = (stamp, program)
+        return program
+
+    def module_member(self, module: TourmalineModule, member: str) -> Any:
+        """A global, function or struct of a module"""
+        self.load_module(module)
+        for table in (module.variables, module.functions, module.structs):
+            if member in table:
+                return table[member]
+        raise TourmalineError(f"Module '{module.name}' has no member '{member}'")
+
+    def call_module(self, module: TourmalineModule, func_name: str, args: List[Any]) -> Any:
+        """Call a function of a module, as in utils.add(1, 2)"""
+        self.load_module(module)
+        if func_name not in module.functions:
+            raise TourmalineError(f"Module '{module.name}' has no function '{func_name}'")
+        try:
+            return self.call_in_module(module, func_name, args)
+        except CallDepthError:
+            raise
+        except RecursionError:
+            raise CallDepthError(f"Maximum call depth exceeded in '{func_name}' (Python recursion limit)")
+        except Exception as e:
+            raise TourmalineError(f"Error calling {module.name}.{func_name}(): {e}")
+
+    def call_in_module(self, module: TourmalineModule, func_name: str, args: List[Any]) -> Any:
+        """Call a function with its module's globals in place of the caller's"""
+        caller = self.module
+        self.use_module(module)
+        try:
+            return self.call_user_function(func_name, args)
+        finally:
+            self.use_module(caller)
+
+    def wait_for_tasks(self):
+        """Let spawned tasks finish before the program ends"""
+        if self.scheduler is not None:
+            self.scheduler.join()
+    
+    def memo_info(self, name: str) -> Dict[str, int]:
+        """Hit, miss and size counts of a cached function's results"""
+        func = self.functions.get(name)
+        if func is None or func.memo is None:
+            raise TourmalineError(f"'{name}' is not a cached function")
+        return func.memo.info()
+    
+    def memo_clear(self, name: Optional[str] = None):
+        """Forget the stored results of one cached function, or of all of them"""
+        if name is not None:
+            self.memo_info(name)
+        for func in self.functions.values():
+            if func.memo is not None and name in (None, func.name):
+                func.memo.clear()
+    
+    def add_hook(self, event: str, callback: Callable[[TraceEvent], Any]):
+        """Call callback with a TraceEvent on every event of the given kind"""
+        self.hooks.add(event, callback)
+    
+    def remove_hook(self, event: str, callback: Callable[[TraceEvent], Any]):
+        """Stop calling a callback registered with add_hook"""
+        self.hooks.remove(event, callback)
+    
+    def traced_handlers(self, handlers: Dict[type, Callable]) -> Dict[type, Callable]:
+        """Wrap statement handlers to report each statement's line to the hooks"""
+        line = self.hooks.line
+        def traced(handler):
+            def run(stmt):
+                line(stmt.line, stmt.col, self.module)
+                handler(stmt)
+            return run
+        return {kind: traced(handler) for kind, handler in handlers.items()}
+    
+    def exec_block(self, block: Block):
+        """Execute a block of statements, stopping early on return"""
+        handlers = self.statement_handlers
+        for statement in block.statements:
+            handlers[type(statement)](statement)
+            if self.has_returned:
+                return
+    
+    def bind(self, name: str, slot: Optional[int], value: Any):
+        """Store a value in a local slot, or in the globals when slot is None"""
+        if slot is None:
+            self.variables[name] = value
+        else:
+            self.frame[slot] = value
+    
+    def exec_import(self, stmt: ImportStatement):
+        if self.load_library(stmt.name) is None:
+            raise TourmalineError(f"Library '{stmt.name}' not found")
+        # Store library name as a variable for access
+        self.bind(stmt.name, stmt.slot, stmt.name)
+    
+    def exec_module_import(self, stmt: ModuleImport):
+        self.import_module(stmt.path, stmt.name, stmt.names)
+    
+    def exec_let(self, stmt: LetStatement):
+        self.bind(stmt.name, stmt.slot, self.eval_node(stmt.value))
+    
+    def exec_assign(self, stmt: AssignStatement):
+        var_name = stmt.name
+        # Assign to the local if it is bound, otherwise to the global
+        if stmt.slot is not None and self.frame[stmt.slot] is not UNSET:
+            target, key = self.frame, stmt.slot
+        elif var_name in self.variables:
+            target, key = self.variables, var_name
+        else:
+            raise TourmalineError(f"Variable '{var_name}' not declared")
         
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            if not line or line.startswith('#'):
-                i += 1
-                continue
-            
-            tokens = self.tokenize(line)
-            
-            if not tokens:
-                i += 1
-                continue
-            
-            # Import statement
-            if tokens[0] == 'import':
-                if len(tokens) < 2:
-                    raise TourmalineError("Invalid import statement")
-                lib_name = tokens[1]
-                if lib_name not in self.libraries:
-                    raise TourmalineError(f"Library '{lib_name}' not found")
-                # Store library name as a variable for access
-                self.variables[lib_name] = lib_name
-                i += 1
-                continue
-            
-            # Variable declaration
-            if tokens[0] == 'let':
-                if len(tokens) < 4 or tokens[2] != '=':
-                    raise TourmalineError("Invalid variable declaration")
-                var_name = tokens[1]
-                value = self.evaluate_expression(tokens, 3)
-                self.variables[var_name] = value
-            
-            # Variable assignment
-            elif len(tokens) >= 3 and tokens[1] in ['=', '+=', '-=', '*=', '/=']:
-                var_name = tokens[0]
-                if var_name not in self.variables:
-                    raise TourmalineError(f"Variable '{var_name}' not declared")
-                
-                op = tokens[1]
-                value = self.evaluate_expression(tokens, 2)
-                
-                if op == '=':
-                    self.variables[var_name] = value
-                elif op == '+=':
-                    self.variables[var_name] += value
-                elif op == '-=':
-                    self.variables[var_name] -= value
-                elif op == '*=':
-                    self.variables[var_name] *= value
-                elif op == '/=':
-                    self.variables[var_name] /= value
-            
-            # Function definition
-            elif tokens[0] == 'function':
-                func_name = tokens[1]
-                # Find end of function
-                func_lines = [line]
-                i += 1
-                depth = 1
-                while i < len(lines) and depth > 0:
-                    l = lines[i].strip()
-                    func_lines.append(lines[i])
-                    if l.startswith('function') or l.startswith('if') or l.startswith('while') or l.startswith('for'):
-                        depth += 1
-                    elif l == 'end':
-                        depth -= 1
-                    i += 1
-                
-                self.functions[func_name] = func_lines
-                continue
-            
-            # Struct definition
-            elif tokens[0] == 'struct':
-                struct_name = tokens[1]
-                struct_fields = []
-                i += 1
-                while i < len(lines):
-                    l = lines[i].strip()
-                    if l == 'end':
-                        break
-                    if l and not l.startswith('#'):
-                        struct_fields.append(l)
-                    i += 1
-                
-                self.structs[struct_name] = struct_fields
-            
-            # Try-except block
-            elif tokens[0] == 'try':
-                try_lines = []
-                except_lines = []
-                exception_var = None
-                
-                i += 1
-                depth = 1
-                in_except = False
-                
-                while i < len(lines) and depth > 0:
-                    l = lines[i].strip()
-                    
-                    if l.startswith('try') or l.startswith('if') or l.startswith('while') or l.startswith('for') or l.startswith('function'):
-                        depth += 1
-                        if in_except:
-                            except_lines.append(lines[i])
-                        else:
-                            try_lines.append(lines[i])
-                    elif l == 'end':
-                        depth -= 1
-                        if depth > 0:
-                            if in_except:
-                                except_lines.append(lines[i])
-                            else:
-                                try_lines.append(lines[i])
-                    elif l.startswith('except') and depth == 1:
-                        in_except = True
-                        # Parse exception variable if present
-                        except_tokens = self.tokenize(l)
-                        if len(except_tokens) > 1:
-                            exception_var = except_tokens[1]
-                    else:
-                        if in_except:
-                            except_lines.append(lines[i])
-                        else:
-                            try_lines.append(lines[i])
-                    
-                    i += 1
-                
-                # Execute try block
-                try:
-                    self.execute('\n'.join(try_lines))
-                except (TourmalineError, Exception) as e:
-                    # Store exception in variable if specified
-                    if exception_var:
-                        self.variables[exception_var] = str(e)
-                    # Execute except block
-                    if except_lines:
-                        self.execute('\n'.join(except_lines))
-                
-                continue
-            
-            # If statement
-            elif tokens[0] == 'if':
-                condition = self.evaluate_expression(tokens, 1)
-                if_lines = []
-                elif_blocks = []
-                else_lines = []
-                
-                i += 1
-                depth = 1
-                current_block = if_lines
-                
-                while i < len(lines) and depth > 0:
-                    l = lines[i].strip()
-                    
-                    if l.startswith('if') or l.startswith('while') or l.startswith('for') or l.startswith('function'):
-                        depth += 1
-                        current_block.append(lines[i])
-                    elif l == 'end':
-                        depth -= 1
-                        if depth > 0:
-                            current_block.append(lines[i])
-                    elif l.startswith('elif') and depth == 1:
-                        elif_tokens = self.tokenize(l)
-                        elif_condition = self.evaluate_expression(elif_tokens, 1)
-                        elif_blocks.append((elif_condition, []))
-                        current_block = elif_blocks[-1][1]
-                    elif l == 'else' and depth == 1:
-                        current_block = else_lines
-                    else:
-                        current_block.append(lines[i])
-                    
-                    i += 1
-                
-                if condition:
-                    self.execute('\n'.join(if_lines))
-                else:
-                    executed = False
-                    for elif_cond, elif_lines_block in elif_blocks:
-                        if elif_cond:
-                            self.execute('\n'.join(elif_lines_block))
-                            executed = True
-                            break
-                    if not executed and else_lines:
-                        self.execute('\n'.join(else_lines))
-                
-                continue
-            
-            # While loop
-            elif tokens[0] == 'while':
-                condition_tokens = tokens[1:]
-                loop_lines = []
-                i += 1
-                depth = 1
-                
-                while i < len(lines) and depth > 0:
-                    l = lines[i].strip()
-                    if l.startswith('while') or l.startswith('for') or l.startswith('if') or l.startswith('function'):
-                        depth += 1
-                    elif l == 'end':
-                        depth -= 1
-                    
-                    if depth > 0:
-                        loop_lines.append(lines[i])
-                    i += 1
-                
-                while self.evaluate_expression(condition_tokens):
-                    self.execute('\n'.join(loop_lines))
-                
-                continue
-            
-            # For loop
-            elif tokens[0] == 'for':
-                var_name = tokens[1]
-                if tokens[2] != 'in':
-                    raise TourmalineError("Expected 'in' in for loop")
-                
-                iterable = self.evaluate_expression(tokens, 3)
-                loop_lines = []
-                i += 1
-                depth = 1
-                
-                while i < len(lines) and depth > 0:
-                    l = lines[i].strip()
-                    if l.startswith('for') or l.startswith('while') or l.startswith('if') or l.startswith('function'):
-                        depth += 1
-                    elif l == 'end':
-                        depth -= 1
-                    
-                    if depth > 0:
-                        loop_lines.append(lines[i])
-                    i += 1
-                
-                for item in iterable:
-                    if self.has_returned:
-                        break
-                    self.variables[var_name] = item
-                    self.execute('\n'.join(loop_lines))
-                
-                continue
-            
-            # Return statement
-            elif tokens[0] == 'return':
-                if len(tokens) > 1:
-                    self.return_value = self.evaluate_expression(tokens, 1)
-                else:
-                    self.return_value = None
-                self.has_returned = True
+        value = self.eval_node(stmt.value)
+        if stmt.op == '=':
+            target[key] = value
+        elif stmt.op == '+=' and type(value) is str:
+            add_in_place(target, key, value)
+        else:
+            target[key] = INPLACE_OPERATORS[stmt.op](target[key], value)
+    
+    def exec_function_def(self, stmt: FunctionDef):
+        body, names = self.resolver.resolve_function(stmt)
+        self.functions[stmt.name] = TourmalineFunction(stmt.name, stmt.params, body, names, stmt, stmt.cached,
+                                                       self.module)
+    
+    def exec_struct_def(self, stmt: StructDef):
+        self.structs[stmt.name] = stmt.fields
+    
+    def exec_try(self, stmt: TryStatement):
+        try:
+            self.exec_block(stmt.body)
+        except (TourmalineError, Exception) as e:
+            if self.tracer is not None:
+                self.tracer.exception(e)
+            if self.scheduler is not None:
+                self.scheduler.caught(e)
+            # Store exception in variable if specified
+            if stmt.exception_var:
+                self.bind(stmt.exception_var, stmt.slot, str(e))
+            # Execute except block
+            if stmt.handler:
+                self.exec_block(stmt.handler)
+    
+    def exec_if(self, stmt: IfStatement):
+        # Conditions are evaluated in order, stopping at the first true one
+        if self.eval_node(stmt.condition):
+            self.exec_block(stmt.body)
+            return
+        for condition, body in stmt.elif_branches:
+            if self.eval_node(condition):
+                self.exec_block(body)
                 return
-            
-            # Function call or expression
+        if stmt.else_body:
+            self.exec_block(stmt.else_body)
+    
+    def exec_while(self, stmt: WhileStatement):
+        while self.eval_node(stmt.condition):
+            self.exec_block(stmt.body)
+            if self.has_returned:
+                break
+    
+    def exec_for(self, stmt: ForStatement):
+        for item in self.iterate(self.eval_node(stmt.iterable)):
+            self.bind(stmt.var_name, stmt.slot, item)
+            self.exec_block(stmt.body)
+            if self.has_returned:
+                break
+    
+    def exec_return(self, stmt: ReturnStatement):
+        if stmt.tail:
+            call = stmt.value
+            args = [self.eval_node(arg) for arg in call.args]
+            func = self.functions.get(call.name)
+            if (func is not None and func.arity == len(args) and func.module is self.module
+                    and not isinstance(func.body, CodeObject)):
+                # Leave the call to run_function so the stack does not grow
+                self.tail_call = (func, args)
+                self.return_value = None
             else:
-                try:
-                    self.evaluate_expression(tokens)
-                except Exception as e:
-                    # Silent errors for expressions that don't return values
-                    pass
-            
-            i += 1
+                self.return_value = self.call_function(call.name, args)
+        elif stmt.value is not None:
+            self.return_value = self.eval_node(stmt.value)
+        else:
+            self.return_value = None
+        self.has_returned = True
+    
+    def exec_spawn(self, stmt: SpawnStatement):
+        self.spawn(stmt.call.name, [self.eval_node(arg) for arg in stmt.call.args])
+    
+    def exec_expression(self, stmt: ExpressionStatement):
+        try:
+            self.eval_node(stmt.expr)
+        except Exception as e:
+            # Silent errors for expressions that don't return values
+            pass
+
+class InterpreterPool:
+    """Interpreters built ahead of time and lent out one caller at a time"""
+    def __init__(self, size: int = 4, **options: Any):
+        if size < 1:
+            raise TourmalineError("size must be at least 1")
+        import queue
+        self.idle = queue.LifoQueue()  # the most recently used interpreter has the warmest caches
+        for _ in range(size):
+            self.idle.put(TourmalineInterpreter(**options))
+    
+    @contextlib.contextmanager
+    def interpreter(self) -> Iterator[TourmalineInterpreter]:
+        """Borrow an interpreter, waiting for one if all are in use"""
+        interpreter = self.idle.get()
+        try:
+            yield interpreter
+        finally:
+            # Returned as new, so the next borrower sees nothing of this one's program,
+            # builtins or hooks
+            interpreter.restore_defaults()
+            self.idle.put(interpreter)
+    
+    def compile(self, source: str) -> TourmalineProgram:
+        with self.interpreter() as interpreter:
+            return interpreter.compile(source)
+    
+    def run(self, program: TourmalineProgram, inputs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run a compiled program on a borrowed interpreter and return its globals"""
+        with self.interpreter() as interpreter:
+            return interpreter.run(program, inputs)
+    
+    def close(self):
+        """Stop the interpreters' parallel worker processes"""
+        while not self.idle.empty():
+            self.idle.get().close()
 
 # Example usage and REPL
-if __name__ == "__main__":
-    import sys
+def main():
+    """Run a file or the REPL; installed as the `tourmaline` command"""
+    # Options come before the file name, e.g. --engine=vm
+    args = sys.argv[1:]
+    engine = 'ast'
+    max_depth = MAX_CALL_DEPTH
+    optimize = 1
+    use_cache = True
+    profile = False
+    workers = None
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option in ('-O0', '-O1'):
+            optimize = int(option[2:])
+        elif option == '--no-cache':
+            use_cache = False
+        elif option == '--profile':
+            profile = True
+        elif option.startswith('--engine='):
+            engine = option.split('=', 1)[1]
+        elif option.startswith('--max-depth='):
+            try:
+                max_depth = int(option.split('=', 1)[1])
+            except ValueError:
+                print(f"Error: Invalid value for --max-depth: '{option.split('=', 1)[1]}'")
+                sys.exit(1)
+        elif option.startswith('--workers='):
+            try:
+                workers = int(option.split('=', 1)[1])
+            except ValueError:
+                print(f"Error: Invalid value for --workers: '{option.split('=', 1)[1]}'")
+                sys.exit(1)
+        else:
+            print(f"Error: Unknown option '{option}'")
+            sys.exit(1)
     
-    interpreter = TourmalineInterpreter()
+    try:
+        interpreter = TourmalineInterpreter(engine=engine, max_depth=max_depth, optimize=optimize, workers=workers)
+    except TourmalineError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    profiler = None
+    if profile:
+        profiler = TourmalineProfiler()
+        profiler.attach(interpreter)
     
     # Check if a file is provided as argument
-    if len(sys.argv) > 1:
-        filename = sys.argv[1]
+    if args:
+        filename = args[0]
         # Limited only to .trm files so functionality doesn't break
         if not filename.endswith('.trm'):
             print(f"Error: File must have .trm extension")
             sys.exit(1)
 
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                code = f.read()
-            interpreter.execute(code)
+            interpreter.execute_file(filename, use_cache)
         except FileNotFoundError:
             print(f"Error: File '{filename}' not found")
             sys.exit(1)
@@ -980,11 +4194,23 @@ if __name__ == "__main__":
             import traceback
             traceback.print_exc()
             sys.exit(1)
+        finally:
+            interpreter.close()
+            if profiler is not None and profiler.functions:
+                # Reports go next to where the script was run, named after it
+                stem = os.path.splitext(os.path.basename(filename))[0]
+                with open(filename, 'r', encoding='utf-8') as f:
+                    source_lines = f.read().splitlines()
+                with open(stem + '.profile.txt', 'w', encoding='utf-8') as f:
+                    f.write(profiler.report(source_lines))
+                with open(stem + '.folded', 'w', encoding='utf-8') as f:
+                    f.write(profiler.collapsed())
+                print(f"Profile written to {stem}.profile.txt and {stem}.folded", file=sys.stderr)
     else:
         # REPL mode
-        print("Tourmaline Language Interpreter (TLI) v1.0.1 - Tourmal Waters")
+        print(f"Tourmaline Language Interpreter (TLI) v{VERSION} - Tourmal Waters")
         print("Type 'exit' to quit")
-        print("Usage: python tourmaline.py <file.trm> to run a file")
+        print("Usage: tourmaline [-O0|-O1] [--engine=ast|vm] [--max-depth=N] [--workers=N] [--no-cache] [--profile] <file.trm> to run a file")
         print("Interactive mode (type 'exit' to quit):")
         
         while True:
@@ -997,4 +4223,7 @@ if __name__ == "__main__":
             except TourmalineError as e:
                 print(f"Error: {e}")
             except Exception as e:
-                print(f"Unexpected error: {e}")
\ No newline at end of file
+                print(f"Unexpected error: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Benchmark runner for the Tourmaline interpreter
+
+Runs the .trm workloads in this folder and reports ops/sec, wall time and peak
+memory for each. Results can be saved as JSON and later used as a baseline:
+
+    python benchmarks/run.py --output=baseline.json
+    python benchmarks/run.py --baseline=baseline.json --threshold=0.1
+
+With a baseline, the run exits with status 1 if any workload got slower by
+more than the threshold (a fraction of the baseline wall time).
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import platform
+import contextlib
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from Tourmaline import TourmalineInterpreter, TourmalineError, ENGINES, VERSION
+
+# Each workload states how many operations one run performs, e.g. `# ops: 1000`
+OPS_PATTERN = re.compile(r'^#\s*ops:\s*(\d+)\s*$', re.MULTILINE)
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.10
+
+def load_workloads(names: List[str]) -> List[Tuple[str, str, int]]:
+    """Read the workloads as (name, code, ops), all of them if no names are given"""
+    available = sorted(f[:-4] for f in os.listdir(BENCH_DIR) if f.endswith('.trm'))
+    for name in names:
+        if name not in available:
+            raise TourmalineError(f"Unknown workload '{name}' (expected one of: {', '.join(available)})")
+    workloads = []
+    for name in names or available:
+        with open(os.path.join(BENCH_DIR, name + '.trm'), 'r', encoding='utf-8') as f:
+            code = f.read()
+        match = OPS_PATTERN.search(code)
+        if match is None:
+            raise TourmalineError(f"Workload '{name}' has no '# ops: N' line")
+        workloads.append((name, code, int(match.group(1))))
+    return workloads
+
+def run_once(code: str, engine: str) -> float:
+    """Parse and run a workload on a fresh interpreter, returning the wall time"""
+    interpreter = TourmalineInterpreter(engine=engine)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        interpreter.execute(code)
+        return time.perf_counter() - start
+
+def peak_memory(code: str, engine: str) -> int:
+    """Peak bytes allocated while running a workload"""
+    # Tracing slows everything down, so this is a separate run from the timed ones
+    tracemalloc.start()
+    try:
+        run_once(code, engine)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_workloads(workloads: List[Tuple[str, str, int]], engine: str, repeat: int) -> Dict[str, Any]:
+    results = {}
+    for name, code, ops in workloads:
+        run_once(code, engine)  # warm up
+        wall = min(run_once(code, engine) for _ in range(repeat))
+        results[name] = {
+            'ops': ops,
+            'wall': wall,
+            'ops_per_sec': ops / wall,
+            'peak_memory': peak_memory(code, engine),
+        }
+    return {
+        'version': VERSION,
+        'engine': engine,
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'workloads': results,
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, float]:
+    """Relative change in wall time per workload present in both runs"""
+    changes = {}
+    for name, result in report['workloads'].items():
+        base = baseline['workloads'].get(name)
+        if base is not None:
+            changes[name] = result['wall'] / base['wall'] - 1
+    return changes
+
+def format_report(report: Dict[str, Any], changes: Optional[Dict[str, float]], threshold: float) -> str:
+    out = [f"Tourmaline {report['version']} on Python {report['python']}, engine={report['engine']}, "
+           f"best of {report['repeat']}", "",
+           f"{'workload':<16} {'ops/sec':>12} {'wall (ms)':>10} {'peak (KiB)':>11}"
+           + ("  vs baseline" if changes is not None else "")]
+    for name, result in report['workloads'].items():
+        line = (f"{name:<16} {result['ops_per_sec']:>12,.0f} {result['wall'] * 1000:>10.1f} "
+                f"{result['peak_memory'] / 1024:>11,.0f}")
+        if changes is not None:
+            if name not in changes:
+                line += "  (new)"
+            else:
+                line += f"  {changes[name]:+.1%}"
+                if changes[name] > threshold:
+                    line += "  REGRESSION"
+        out.append(line)
+    return '\n'.join(out)
+
+def main(argv: List[str]) -> int:
+    engine = 'ast'
+    repeat = DEFAULT_REPEAT
+    threshold = DEFAULT_THRESHOLD
+    output = None
+    baseline_path = None
+    args = list(argv)
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        name, _, value = option.partition('=')
+        try:
+            if name == '--engine':
+                engine = value
+            elif name == '--repeat':
+                repeat = int(value)
+            elif name == '--threshold':
+                threshold = float(value)
+            elif name == '--output':
+                output = value
+            elif name == '--baseline':
+                baseline_path = value
+            else:
+                print(f"Error: Unknown option '{option}'")
+                return 2
+        except ValueError:
+            print(f"Error: Invalid value for {name}: '{value}'")
+            return 2
+    if engine not in ENGINES:
+        print(f"Error: Unknown engine '{engine}' (expected one of: {', '.join(ENGINES)})")
+        return 2
+    if repeat < 1:
+        print("Error: --repeat must be at least 1")
+        return 2
+
+    try:
+        workloads = load_workloads(args)
+    except TourmalineError as e:
+        print(f"Error: {e}")
+        return 2
+
+    baseline = None
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('engine') != engine:
+            print(f"Warning: baseline was recorded with engine={baseline.get('engine')}")
+
+    report = run_workloads(workloads, engine, repeat)
+    changes = compare(report, baseline) if baseline is not None else None
+    print(format_report(report, changes, threshold))
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"\nResults written to {output}")
+
+    if changes is not None:
+        regressions = [name for name, change in changes.items() if change > threshold]
+        if regressions:
+            print(f"\n{len(regressions)} workload(s) slower than baseline by more than {threshold:.0%}: "
+                  f"{', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,82 @@
+"""Cold start check for the tourmaline command
+
+Times a hello world script run the way the tourmaline command and the launchers
+run it, and compares that with starting Python itself:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --budget=40 --repeat=30
+
+Exits with status 1 if Tourmaline adds more than the budget (in milliseconds)
+on top of Python's own start.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# Milliseconds Tourmaline may add to Python's start before printing hello world
+STARTUP_BUDGET_MS = 50
+DEFAULT_REPEAT = 20
+
+# What the tourmaline console script and scripts/tli.sh run
+RUN_TOURMALINE = 'import sys; sys.path[0] = sys.argv.pop(1); from Tourmaline import main; main()'
+
+def median_ms(command: List[str], env: Dict[str, str], repeat: int) -> float:
+    """Median wall time of running a command to completion"""
+    subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)  # warm up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def main(argv: List[str]) -> int:
+    budget = STARTUP_BUDGET_MS
+    repeat = DEFAULT_REPEAT
+    for option in argv:
+        name, _, value = option.partition('=')
+        try:
+            if name == '--budget':
+                budget = float(value)
+            elif name == '--repeat':
+                repeat = int(value)
+            else:
+                print(f"Error: Unknown option '{option}'")
+                return 2
+        except ValueError:
+            print(f"Error: Invalid value for {name}: '{value}'")
+            return 2
+    if repeat < 1:
+        print("Error: --repeat must be at least 1")
+        return 2
+
+    # Users get compiled bytecode and the program cache after their first run, so
+    # the warm-up run may write both
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, 'hello.trm')
+        with open(script, 'w', encoding='utf-8') as f:
+            f.write('print("Hello, World!")\n')
+        python = median_ms([sys.executable, '-c', 'pass'], env, repeat)
+        tourmaline = median_ms([sys.executable, '-c', RUN_TOURMALINE, ROOT_DIR, script], env, repeat)
+
+    overhead = tourmaline - python
+    print(f"Python start:      {python:7.1f} ms")
+    print(f"Tourmaline start:  {tourmaline:7.1f} ms")
+    print(f"Added:             {overhead:7.1f} ms (budget {budget:g} ms, median of {repeat})")
+    if overhead > budget:
+        print(f"\nStartup is over budget by {overhead - budget:.1f} ms")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,24 +1,43 @@
 @echo off
-REM Tourma launcher — locate tourmaline.py in parent directories or PATH and execute it with provided args
+REM Tourma launcher — locate Tourmaline.py in parent directories or PATH and execute it with provided args
 setlocal
 
+REM Where the last search ended, as "<launcher dir>|<file found>", so later runs can skip it
+set "CACHE_DIR=%LOCALAPPDATA%\tourmaline"
+set "CACHE_FILE=%CACHE_DIR%\location"
+
 REM Start searching from the directory of this script
+set "SCRIPT_DIR=%~dp0"
 set "SEARCH_DIR=%~dp0"
 set "FOUND="
 
-REM Search up to 6 levels of parent directories for tourmaline.py
-for /L %%i in (1,1,6) do (
-  if exist "%SEARCH_DIR%tourmaline.py" (
-    set "FOUND=%SEARCH_DIR%tourmaline.py"
-    goto :found
+REM Fast path: the remembered location, if it was found for this launcher and still exists
+if exist "%CACHE_FILE%" (
+  for /f "usebackq tokens=1,* delims=|" %%a in ("%CACHE_FILE%") do (
+    if /i "%%a"=="%SCRIPT_DIR%" if exist "%%b" set "FOUND=%%b"
   )
-  for %%p in ("%SEARCH_DIR%..\") do set "SEARCH_DIR=%%~fpp"
 )
+if defined FOUND goto :run
+
+REM Search up to 6 levels of parent directories for Tourmaline.py. A goto loop,
+REM since %SEARCH_DIR% inside a parenthesized for body would not see it change
+set "LEVEL=0"
+:search
+if exist "%SEARCH_DIR%Tourmaline.py" (
+  set "FOUND=%SEARCH_DIR%Tourmaline.py"
+  goto :found
+)
+set /a LEVEL+=1
+if %LEVEL% GEQ 6 goto :searchpath
+for %%p in ("%SEARCH_DIR%..") do set "SEARCH_DIR=%%~fp\"
+goto :search
+
+:searchpath
 
 REM If not found in parent directories, check in PATH
-where tourmaline.py >nul 2>&1
+where Tourmaline.py >nul 2>&1
 if %ERRORLEVEL%==0 (
-  for /f "usebackq delims=" %%f in (`where tourmaline.py`) do set "FOUND=%%f" & goto :found
+  for /f "usebackq delims=" %%f in (`where Tourmaline.py`) do set "FOUND=%%f" & goto :found
 )
 
 REM Finally, check if 'tourmaline' command is available in PATH
@@ -28,18 +47,26 @@ if %ERRORLEVEL%==0 (
 )
 
 REM If still not found, print error and exit
-echo Error: could not find 'tourmaline.py' in script directory or PATH.
+echo Error: could not find 'Tourmaline.py' in script directory or PATH.
 pause
 endlocal & exit /b 1
 
-REM If found, execute it with Python
+REM Remember where it was found for next time
 :found
-if defined FOUND (
-  py -3 "%FOUND%" %* 2>nul || python "%FOUND%" %*
-  endlocal & exit /b %ERRORLEVEL%
-)
+if not exist "%CACHE_DIR%" mkdir "%CACHE_DIR%" >nul 2>&1
+> "%CACHE_FILE%" 2>nul echo %SCRIPT_DIR%^|%FOUND%
+
+REM Import the interpreter instead of running the file as a script: imported modules
+REM load from compiled bytecode, scripts are compiled from source on every start
+:run
+for %%f in ("%FOUND%") do set "FOUND_DIR=%%~dpf"
+set "FOUND_DIR=%FOUND_DIR:~0,-1%"
+set "PYTHON=python"
+where py >nul 2>&1 && set "PYTHON=py -3"
+%PYTHON% -c "import sys; sys.path[0] = sys.argv.pop(1); from Tourmaline import main; main()" "%FOUND_DIR%" %*
+endlocal & exit /b %ERRORLEVEL%
 
 REM If 'tourmaline' command is available, use it
 :foundcmd
 tourmaline %*
-endlocal & exit /b %ERRORLEVEL%
\ No newline at end of file
+endlocal & exit /b %ERRORLEVEL%
@@ -1,33 +1,56 @@
 #!/bin/sh
 set -e
 
-# Locate tourmaline.py by searching script dir and parent directories (up to 6 levels)
-SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
-SEARCH_DIR="$SCRIPT_DIR"
+# Where the last search for Tourmaline.py ended, so later runs can skip it.
+# The first line is the directory of the launcher that searched, the second the file found
+CACHE_FILE="${XDG_CACHE_HOME:-$HOME/.cache}/tourmaline/location"
+
+case "$0" in
+  */*) SCRIPT_DIR="$(cd "${0%/*}" && pwd)" ;;
+  *) SCRIPT_DIR="$(pwd)" ;;
+esac
 FOUND=""
-i=0
-while [ $i -lt 6 ]; do
-  if [ -f "$SEARCH_DIR/tourmaline.py" ]; then
-    FOUND="$SEARCH_DIR/tourmaline.py"
-    break
-  fi
-  SEARCH_DIR="$(dirname "$SEARCH_DIR")"
-  i=$((i + 1))
-done
 
-# If there's an installed entry point called 'tourmaline', use it
-if [ -z "$FOUND" ] && command -v tourmaline >/dev/null 2>&1; then
-  exec tourmaline "$@"
+# Fast path: the remembered location, if it was found for this launcher and still exists
+if [ -f "$CACHE_FILE" ]; then
+  { read -r CACHED_FOR; read -r CACHED; } < "$CACHE_FILE" || true
+  if [ "$CACHED_FOR" = "$SCRIPT_DIR" ] && [ -f "$CACHED" ]; then
+    FOUND="$CACHED"
+  fi
 fi
 
-# Fallback: search common locations quickly
+# Locate Tourmaline.py by searching script dir and parent directories (up to 6 levels)
 if [ -z "$FOUND" ]; then
-  FOUND="$(find "$HOME" /usr/local /opt 2>/dev/null -type f -name 'tourmaline.py' -print -quit || true)"
-fi
+  SEARCH_DIR="$SCRIPT_DIR"
+  i=0
+  while [ $i -lt 6 ]; do
+    if [ -f "$SEARCH_DIR/Tourmaline.py" ]; then
+      FOUND="$SEARCH_DIR/Tourmaline.py"
+      break
+    fi
+    SEARCH_DIR="$(dirname "$SEARCH_DIR")"
+    i=$((i + 1))
+  done
 
-if [ -z "$FOUND" ]; then
-  echo "Error: could not find 'tourmaline.py' (checked script parents, PATH and common locations)."
-  exit 1
+  # If there's an installed entry point called 'tourmaline', use it
+  if [ -z "$FOUND" ] && command -v tourmaline >/dev/null 2>&1; then
+    exec tourmaline "$@"
+  fi
+
+  # Fallback: search common locations (slow, so the result is remembered)
+  if [ -z "$FOUND" ]; then
+    FOUND="$(find "$HOME" /usr/local /opt 2>/dev/null -type f -name 'Tourmaline.py' -print -quit || true)"
+  fi
+
+  if [ -z "$FOUND" ]; then
+    echo "Error: could not find 'Tourmaline.py' (checked script parents, PATH and common locations)."
+    exit 1
+  fi
+
+  { mkdir -p "$(dirname "$CACHE_FILE")" && printf '%s\n%s\n' "$SCRIPT_DIR" "$FOUND" > "$CACHE_FILE"; } 2>/dev/null || true
 fi
 
-exec python3 "$FOUND" "$@"
\ No newline at end of file
+# Import the interpreter instead of running the file as a script: imported modules
+# load from compiled bytecode, scripts are compiled from source on every start
+exec python3 -c 'import sys; sys.path[0] = sys.argv.pop(1); from Tourmaline import main; main()' \
+  "${FOUND%/*}" "$@"
@@ -0,0 +1,67 @@
+"""The array library"""
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter, TourmalineError, TourmalineArray, ENGINES
+
+def run(code, engine='ast'):
+    interpreter = TourmalineInterpreter(engine=engine)
+    interpreter.execute('import array\n' + code)
+    return interpreter.variables
+
+def values(array):
+    return list(array)
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_elementwise_arithmetic(engine):
+    variables = run("""
+let a = array.from_list([1, 2, 3])
+let doubled = a * 2
+let summed = a + doubled
+let halves = a / 2
+""", engine)
+    assert values(variables['doubled']) == [2, 4, 6]
+    assert values(variables['summed']) == [3, 6, 9]
+    assert values(variables['halves']) == [0.5, 1.0, 1.5]
+    assert isinstance(variables['summed'], TourmalineArray)
+
+def test_kinds():
+    variables = run("""
+let whole = array.from_list([1, 2])
+let decimal = array.from_list([1, 2], "float")
+let zeros = array.zeros(2, "int")
+""")
+    assert [variables[name].kind for name in ('whole', 'decimal', 'zeros')] == ['int', 'float', 'int']
+    with pytest.raises(TourmalineError, match="whole numbers"):
+        run('let a = array.from_list([1])\nlet b = array.set(a, 0, 1.5)')
+
+def test_slices_share_memory_and_copies_do_not():
+    variables = run("""
+let a = array.from_list([1, 2, 3])
+let view = array.slice(a, 1, 3)
+array.set(view, 0, 50)
+let copied = array.copy(a)
+array.set(copied, 0, -1)
+""")
+    assert values(variables['a']) == [1, 50, 3]
+    assert values(variables['copied']) == [-1, 50, 3]
+
+def test_reductions():
+    variables = run("""
+let a = array.range(1, 5)
+let total = array.sum(a)
+let mean = array.mean(a)
+let low = array.min(a)
+let high = array.max(a)
+let back = array.to_list(a)
+""")
+    assert [variables[name] for name in ('total', 'mean', 'low', 'high')] == [10, 2.5, 1, 4]
+    assert variables['back'] == [1, 2, 3, 4]
+
+@pytest.mark.parametrize('code, message', [
+    ('let a = array.from_list(["x"])', "must be numbers"),
+    ('let a = array.from_list([1, 2]) + array.from_list([1, 2, 3])', "different lengths"),
+])
+def test_errors(code, message):
+    with pytest.raises(TourmalineError, match=message):
+        run(code)
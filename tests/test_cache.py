@@ -0,0 +1,72 @@
+"""The __trmcache__ cache of parsed programs"""
+
+import os
+import sys
+import pickle
+import subprocess
+
+import pytest
+
+import Tourmaline
+from Tourmaline import TourmalineInterpreter, cache_path
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def script(tmp_path):
+    path = tmp_path / 'script.trm'
+    path.write_text('let answer = 42\n', encoding='utf-8')
+    return path
+
+def run_counting_parses(path, monkeypatch, use_cache=True):
+    """Run a file and return its globals and how many times it was parsed from source"""
+    parses = []
+    parse = Tourmaline.TourmalineParser.parse
+    monkeypatch.setattr(Tourmaline.TourmalineParser, 'parse',
+                        lambda self, code: parses.append(code) or parse(self, code))
+    interpreter = TourmalineInterpreter()
+    interpreter.execute_file(str(path), use_cache)
+    return interpreter.variables, len(parses)
+
+def test_second_run_uses_the_cache(script, monkeypatch):
+    assert run_counting_parses(script, monkeypatch)[1] == 1
+    assert os.path.exists(cache_path(str(script)))
+    variables, parses = run_counting_parses(script, monkeypatch)
+    assert (variables['answer'], parses) == (42, 0)
+
+def test_changed_source_is_parsed_again(script, monkeypatch):
+    run_counting_parses(script, monkeypatch)
+    script.write_text('let answer = 43\n', encoding='utf-8')
+    variables, parses = run_counting_parses(script, monkeypatch)
+    assert (variables['answer'], parses) == (43, 1)
+    # The new tree replaced the stale one
+    assert run_counting_parses(script, monkeypatch)[1] == 0
+
+@pytest.mark.parametrize('damage', [
+    lambda data: b'not a pickle',
+    lambda data: data[:len(data) // 2],
+    lambda data: b'',
+    lambda data: pickle.dumps(('some other key', None)),
+])
+def test_damaged_cache_is_replaced(script, monkeypatch, damage):
+    run_counting_parses(script, monkeypatch)
+    path = cache_path(str(script))
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(damage(data))
+    variables, parses = run_counting_parses(script, monkeypatch)
+    assert (variables['answer'], parses) == (42, 1)
+    assert run_counting_parses(script, monkeypatch)[1] == 0
+
+def test_no_cache_leaves_no_files(script, monkeypatch):
+    variables, parses = run_counting_parses(script, monkeypatch, use_cache=False)
+    assert (variables['answer'], parses) == (42, 1)
+    assert not os.path.exists(os.path.dirname(cache_path(str(script))))
+
+def test_no_cache_option(script):
+    script.write_text('print("hi")\n', encoding='utf-8')
+    result = subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'Tourmaline.py'), '--no-cache', str(script)],
+                            capture_output=True, text=True)
+    assert result.stdout == 'hi\n'
+    assert not os.path.exists(os.path.dirname(cache_path(str(script))))
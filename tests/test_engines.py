@@ -0,0 +1,159 @@
+"""The tree walker and the VM must agree on every program"""
+
+import io
+import os
+import glob
+import contextlib
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+
+PROGRAMS = {
+    'loops': """
+let total = 0
+let i = 0
+while i < 10
+    for j in range(i)
+        total += j * 2 % 7
+    end
+    i += 1
+end
+let never = 0
+while false
+    never += 1
+end
+for x in []
+    never += 1
+end
+""",
+    'strings': """
+let s = ""
+for c in "abc"
+    s += c
+    s += "-"
+end
+let n = 0
+n += 1.5
+""",
+    'functions': """
+function fact(n)
+    if n <= 1
+        return 1
+    end
+    return n * fact(n - 1)
+end
+function count(n, acc)
+    if n == 0
+        return acc
+    end
+    return count(n - 1, acc + 1)
+end
+function local_sum(items)
+    let total = 0
+    for item in items
+        total += item
+    end
+    total += 10
+    return total
+end
+let f = fact(10)
+let c = count(500, 0)
+let s = local_sum([1, 2, 3])
+""",
+    'swallowed errors': """
+let log = []
+function boom(x)
+    return x / 0
+end
+for i in range(3)
+    boom(i)
+    append(log, i)
+end
+function inner()
+    for k in range(2)
+        undefined_thing(k)
+        append(log, k * 10)
+    end
+    return "done"
+end
+let r = inner()
+""",
+    'caught errors': """
+let messages = []
+for i in range(3)
+    try
+        let y = 10 / (i - 1)
+        append(messages, y)
+    except e
+        append(messages, e)
+    end
+end
+function fails()
+    let z = missing + 1
+    return z
+end
+try
+    let w = fails()
+except e
+    append(messages, e)
+end
+""",
+    'globals from functions': """
+let counter = 0
+function bump()
+    counter += 1
+    counter += 2
+    return counter
+end
+for i in range(4)
+    bump()
+end
+let last = bump()
+""",
+}
+
+ERRORS = {
+    'undeclared +=': 'x += 1',
+    'undeclared local +=': """
+function f()
+    y += 1
+    return y
+end
+let r = f()
+""",
+    'bad operands': 'let x = 1 + "a"',
+    'unknown function': 'let x = nothing(1)',
+}
+
+def run(engine, code):
+    interpreter = TourmalineInterpreter(engine=engine)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        interpreter.execute(code)
+    return interpreter.variables, out.getvalue()
+
+@pytest.mark.parametrize('name', PROGRAMS)
+def test_programs(name):
+    assert run('ast', PROGRAMS[name]) == run('vm', PROGRAMS[name])
+
+@pytest.mark.parametrize('name', ERRORS)
+def test_errors(name):
+    messages = []
+    for engine in ('ast', 'vm'):
+        # Python errors such as TypeError reach the caller unwrapped, on both engines
+        with pytest.raises(Exception) as info:
+            run(engine, ERRORS[name])
+        messages.append((info.type, str(info.value)))
+    assert messages[0] == messages[1]
+
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(BENCH_DIR, '*.trm'))),
+                         ids=lambda path: os.path.basename(path)[:-4])
+def test_benchmarks(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        code = f.read()
+    if 'random.' in code:
+        pytest.skip("output depends on random numbers")
+    assert run('ast', code)[1] == run('vm', code)[1]
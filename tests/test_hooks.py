@@ -0,0 +1,95 @@
+"""Execution hooks"""
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter, TourmalineProfiler, ENGINES
+
+FUNCTION = """
+function f(x)
+    let y = x + 1
+    return y * 2
+end
+"""
+
+def line_events(interpreter, code):
+    lines = []
+    def on_line(event):
+        lines.append((event.function, event.line))
+    interpreter.add_hook('line', on_line)
+    try:
+        interpreter.execute(code)
+    finally:
+        interpreter.remove_hook('line', on_line)
+    return lines
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_function_defined_while_traced_runs_after_hooks_removed(engine):
+    interpreter = TourmalineInterpreter(engine=engine)
+    line_events(interpreter, FUNCTION)
+    interpreter.execute('let y = f(1)')
+    assert interpreter.variables['y'] == 4
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_function_defined_before_hooks_reports_lines(engine):
+    interpreter = TourmalineInterpreter(engine=engine)
+    interpreter.execute(FUNCTION)
+    assert line_events(interpreter, 'let y = f(1)') == [('<program>', 1), ('f', 3), ('f', 4)]
+
+def test_engines_report_the_same_events():
+    code = FUNCTION + """
+function g(n)
+    if n == 0
+        return 0
+    end
+    return g(n - 1)
+end
+let total = 0
+for i in range(3)
+    total += f(i)
+end
+let z = g(2)
+"""
+    events = {}
+    for engine in ENGINES:
+        interpreter = TourmalineInterpreter(engine=engine)
+        seen = events[engine] = []
+        for kind in ('line', 'call', 'return'):
+            interpreter.add_hook(kind, lambda event: seen.append(
+                (event.kind, event.function, event.line, event.column, event.module and event.module.name)))
+        interpreter.execute(code)
+    assert events['ast'] == events['vm']
+    assert ('line', 'f', 3, 5, '<program>') in events['ast']
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_tasks_have_their_own_call_stacks(engine):
+    interpreter = TourmalineInterpreter(engine=engine)
+    profiler = TourmalineProfiler()
+    profiler.attach(interpreter)
+    returns = []
+    interpreter.add_hook('return', lambda event: returns.append(event.function))
+    # g starts first and finishes last, so one shared stack would pop f's frame for g
+    interpreter.execute("""
+import tasks
+function g()
+    tasks.sleep(0.2)
+end
+function f()
+    tasks.sleep(0.001)
+end
+spawn g()
+f()
+""")
+    assert returns == ['f', 'g', '<program>']
+    assert profiler.functions['f'][1] < 0.2 <= profiler.functions['g'][1]
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_events_name_the_module_of_the_code(tmp_path, engine):
+    (tmp_path / 'shapes.trm').write_text('function area(w, h)\n    return w * h\nend\n', encoding='utf-8')
+    main = tmp_path / 'main.trm'
+    main.write_text('import "shapes.trm"\nlet a = shapes.area(3, 4)\n', encoding='utf-8')
+    interpreter = TourmalineInterpreter(engine=engine)
+    lines = []
+    interpreter.add_hook('line', lambda event: lines.append((event.module.name, event.line, event.column)))
+    interpreter.execute_file(str(main))
+    assert ('shapes', 2, 5) in lines
+    assert ('<program>', 2, 1) in lines
@@ -0,0 +1,74 @@
+"""The io library"""
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter, TourmalineError, ENGINES
+
+def run(code, engine='ast', **inputs):
+    interpreter = TourmalineInterpreter(engine=engine)
+    interpreter.reset(inputs)
+    interpreter.execute('import io\n' + code)
+    return interpreter.variables
+
+@pytest.fixture
+def text_file(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_text('first\nsecond\nthird ERROR here\n', encoding='utf-8')
+    return str(path)
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_lines_of_a_path(text_file, engine):
+    variables = run("""
+let got = []
+for line in io.lines(path)
+    append(got, line)
+end
+""", engine, path=text_file)
+    assert variables['got'] == ['first', 'second', 'third ERROR here']
+
+def test_write_then_read(tmp_path):
+    path = str(tmp_path / 'out.txt')
+    variables = run("""
+let out = io.open(path, "w")
+io.write(out, "a")
+io.write_line(out, 1)
+io.close(out)
+let whole = io.read(path)
+let f = io.open(path)
+let line = io.read_line(f)
+let after = io.read_line(f)
+io.close(f)
+let there = io.exists(path)
+""", path=path)
+    assert (variables['whole'], variables['line'], variables['after'], variables['there']) == ('a1\n', 'a1', None, True)
+
+def test_mapped_file(text_file):
+    variables = run("""
+let m = io.map(path)
+let size = len(m)
+let at = io.find(m, "ERROR")
+let found = io.slice(m, at, at + 5)
+let missing = io.find(m, "nothing")
+let got = []
+for line in m
+    append(got, line)
+end
+io.close(m)
+""", path=text_file)
+    assert (variables['size'], variables['found'], variables['missing']) == (30, 'ERROR', -1)
+    assert variables['got'] == ['first', 'second', 'third ERROR here']
+    assert variables['m'].closed
+
+def test_closed_mapped_file_cannot_be_read(text_file):
+    with pytest.raises(TourmalineError, match="is closed"):
+        run('let m = io.map(path)\nio.close(m)\nlet x = io.find(m, "first")\n', path=text_file)
+
+def test_empty_mapped_file(tmp_path):
+    path = tmp_path / 'empty.txt'
+    path.write_bytes(b'')
+    variables = run('let m = io.map(path)\nlet size = len(m)\nio.close(m)\n', path=str(path))
+    assert variables['size'] == 0
+
+def test_unknown_mode(tmp_path):
+    with pytest.raises(TourmalineError, match="Unknown file mode"):
+        run('let f = io.open(path, "x")\n', path=str(tmp_path / 'f.txt'))
@@ -0,0 +1,64 @@
+"""Cached functions"""
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter, ENGINES
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_repeated_calls_use_the_cache(engine):
+    interpreter = TourmalineInterpreter(engine=engine)
+    interpreter.execute("""
+cached function fib(n)
+    if n < 2
+        return n
+    end
+    return fib(n - 1) + fib(n - 2)
+end
+let r = fib(30)
+""")
+    assert interpreter.variables['r'] == 832040
+    assert interpreter.memo_info('fib')['misses'] == 31
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_mutated_array_argument_is_not_cached(engine):
+    interpreter = TourmalineInterpreter(engine=engine)
+    interpreter.execute("""
+import array
+cached function total(xs)
+    return array.sum(xs)
+end
+let xs = array.from_list([1, 2, 3])
+let before = total(xs)
+array.set(xs, 0, 100)
+let after = total(xs)
+""")
+    assert (interpreter.variables['before'], interpreter.variables['after']) == (6, 105)
+    assert interpreter.memo_info('total')['uncached'] == 2
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_mutated_builder_argument_is_not_cached(engine):
+    interpreter = TourmalineInterpreter(engine=engine)
+    interpreter.execute("""
+import strings
+cached function text(b)
+    return strings.build(b)
+end
+let b = strings.builder()
+strings.add(b, "a")
+let before = text(b)
+strings.add(b, "b")
+let after = text(b)
+""")
+    assert (interpreter.variables['before'], interpreter.variables['after']) == ('a', 'ab')
+
+def test_equal_values_of_different_types_are_separate():
+    interpreter = TourmalineInterpreter()
+    interpreter.execute("""
+cached function show(x)
+    return str(x)
+end
+let a = show(1)
+let b = show(1.0)
+let c = show(true)
+""")
+    assert [interpreter.variables[name] for name in 'abc'] == ['1', '1.0', 'True']
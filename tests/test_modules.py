@@ -0,0 +1,118 @@
+"""Importing other .trm files"""
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter, TourmalineError, ENGINES
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+@pytest.fixture
+def utils(tmp_path):
+    write(tmp_path / 'lib' / 'utils.trm', """
+let loads = 0
+loads += 1
+let unit = "cm"
+function area(w, h)
+    return w * h
+end
+function scaled(x)
+    return x * factor
+end
+let factor = 10
+""")
+    return tmp_path
+
+def run_main(folder, source, engine='ast', interpreter=None):
+    interpreter = interpreter or TourmalineInterpreter(engine=engine)
+    interpreter.execute_file(write(folder / 'main.trm', source), use_cache=False)
+    return interpreter
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_import_binds_a_module(utils, engine):
+    variables = run_main(utils, """
+import "lib/utils.trm"
+import "lib/utils" as u
+let a = utils.area(3, 4)
+let s = u.scaled(2)
+let unit = utils.unit
+let loads = u.loads
+""", engine).variables
+    assert (variables['a'], variables['s'], variables['unit']) == (12, 20, 'cm')
+    # Both names are the same module, which ran once
+    assert variables['loads'] == 1
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_from_import_binds_members(utils, engine):
+    variables = run_main(utils, """
+from "lib/utils.trm" import area, scaled, unit
+let a = area(2, 5)
+let s = scaled(3)
+""", engine).variables
+    assert (variables['a'], variables['s'], variables['unit']) == (10, 30, 'cm')
+
+def test_module_runs_only_when_used(tmp_path):
+    write(tmp_path / 'broken.trm', 'let x = missing_name\n')
+    run_main(tmp_path, 'import "broken.trm"\nlet fine = true\n')
+    with pytest.raises(TourmalineError, match="Error in module 'broken'"):
+        run_main(tmp_path, 'import "broken.trm"\nlet x = broken.x\n')
+
+def test_missing_module_and_member(utils):
+    with pytest.raises(TourmalineError, match="not found"):
+        run_main(utils, 'import "lib/nothing.trm"\n')
+    with pytest.raises(TourmalineError, match="has no member 'nope'"):
+        run_main(utils, 'from "lib/utils.trm" import nope\n')
+
+def test_standard_library_name_needs_as(tmp_path):
+    write(tmp_path / 'random.trm', 'let x = 1\n')
+    with pytest.raises(TourmalineError, match="standard library"):
+        run_main(tmp_path, 'import "random.trm"\n')
+    assert run_main(tmp_path, 'import "random.trm" as r\nlet x = r.x\n').variables['x'] == 1
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_circular_import_while_loading(tmp_path, engine):
+    write(tmp_path / 'a.trm', 'import "b.trm"\nlet x = b.y\n')
+    write(tmp_path / 'b.trm', 'import "a.trm"\nlet y = a.x\n')
+    with pytest.raises(TourmalineError, match=r"Circular import: a -> b -> a"):
+        run_main(tmp_path, 'import "a.trm"\nlet v = a.x\n', engine)
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_modules_may_call_each_other_after_loading(tmp_path, engine):
+    write(tmp_path / 'even.trm', """
+import "odd.trm"
+function is_even(n)
+    if n == 0
+        return true
+    end
+    return odd.is_odd(n - 1)
+end
+""")
+    write(tmp_path / 'odd.trm', """
+import "even.trm"
+function is_odd(n)
+    if n == 0
+        return false
+    end
+    return even.is_even(n - 1)
+end
+""")
+    assert run_main(tmp_path, 'import "even.trm"\nlet r = even.is_even(10)\n', engine).variables['r'] is True
+
+def test_compiled_module_is_shared_between_interpreters(utils):
+    path = str(utils / 'lib' / 'utils.trm')
+    first = run_main(utils, 'import "lib/utils.trm"\nlet a = utils.area(1, 2)\n')
+    compiled = TourmalineInterpreter.compiled_modules[(path, first.optimize)][1]
+    run_main(utils, 'import "lib/utils.trm"\nlet a = utils.area(1, 2)\n')
+    assert TourmalineInterpreter.compiled_modules[(path, first.optimize)][1] is compiled
+
+def test_changed_module_is_compiled_again(utils):
+    path = utils / 'lib' / 'utils.trm'
+    interpreter = TourmalineInterpreter()
+    assert run_main(utils, 'import "lib/utils.trm"\nlet u = utils.unit\n', interpreter=interpreter).variables['u'] == 'cm'
+    compiled = TourmalineInterpreter.compiled_modules[(str(path), interpreter.optimize)][1]
+    write(path, 'let unit = "inches"\n')
+    interpreter.reset()
+    assert run_main(utils, 'import "lib/utils.trm"\nlet u = utils.unit\n', interpreter=interpreter).variables['u'] == 'inches'
+    assert TourmalineInterpreter.compiled_modules[(str(path), interpreter.optimize)][1] is not compiled
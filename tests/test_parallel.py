@@ -0,0 +1,88 @@
+"""The parallel library and its worker processes"""
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter, TourmalineError, ENGINES
+
+SCALE = """
+import parallel
+let factor = 3
+function scale(x)
+    return x * factor
+end
+function add(a, b)
+    return a + b
+end
+"""
+
+@pytest.fixture
+def interpreter(request):
+    interpreter = TourmalineInterpreter(engine=getattr(request, 'param', 'ast'), workers=2)
+    yield interpreter
+    interpreter.close()
+
+@pytest.mark.parametrize('interpreter', ENGINES, indirect=True)
+def test_map_keeps_the_order_of_items(interpreter):
+    interpreter.execute(SCALE + 'let got = parallel.map(scale, range(20))')
+    assert interpreter.variables['got'] == [x * 3 for x in range(20)]
+
+def test_reduce(interpreter):
+    interpreter.execute(SCALE + """
+let total = parallel.reduce(add, range(101))
+let empty = parallel.reduce(add, [], 0)
+let started = parallel.reduce(add, range(10), 100)
+""")
+    variables = interpreter.variables
+    assert (variables['total'], variables['empty'], variables['started']) == (5050, 0, 145)
+
+def test_reduce_of_nothing_needs_an_initial_value(interpreter):
+    with pytest.raises(TourmalineError, match="needs an initial value"):
+        interpreter.execute(SCALE + 'let total = parallel.reduce(add, [])')
+
+def test_changed_global_reuses_the_workers(interpreter):
+    interpreter.execute(SCALE + 'let first = parallel.map(scale, range(8))')
+    executor = interpreter.worker_pool.executor
+    interpreter.execute('factor = 10\nlet second = parallel.map(scale, range(8))')
+    assert interpreter.variables['first'] == [x * 3 for x in range(8)]
+    assert interpreter.variables['second'] == [x * 10 for x in range(8)]
+    assert interpreter.worker_pool.executor is executor
+
+def test_new_function_restarts_the_workers(interpreter):
+    interpreter.execute(SCALE + 'let first = parallel.map(scale, range(8))')
+    executor = interpreter.worker_pool.executor
+    interpreter.execute("""
+function negate(x)
+    return -x
+end
+let second = parallel.map(negate, range(8))
+""")
+    assert interpreter.variables['second'] == [-x for x in range(8)]
+    assert interpreter.worker_pool.executor is not executor
+
+def test_error_in_a_worker_is_raised_in_the_program(interpreter):
+    interpreter.execute("""
+import parallel
+function check(x)
+    if x < 0
+        return 1 / 0
+    end
+    return x
+end
+let caught = nil
+try
+    let results = parallel.map(check, [1, -2, 3, 4])
+except err
+    caught = err
+end
+""")
+    assert "division by zero" in interpreter.variables['caught']
+
+def test_one_worker_runs_in_the_program():
+    interpreter = TourmalineInterpreter(workers=1)
+    interpreter.execute(SCALE + 'let got = parallel.map(scale, [1, 2])\nparallel.for_each(scale, [1, 2])')
+    assert interpreter.variables['got'] == [3, 6]
+    assert interpreter.worker_pool is None
+
+def test_builtins_cannot_run_in_workers(interpreter):
+    with pytest.raises(TourmalineError, match="expected a function defined in the program"):
+        interpreter.execute(SCALE + 'let got = parallel.map(len, ["a", "bc"])')
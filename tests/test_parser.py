@@ -0,0 +1,42 @@
+"""Parsing"""
+
+import gc
+import threading
+
+from Tourmaline import TourmalineParser
+
+def struct_source(fields: int) -> str:
+    return 'struct Big\n' + ''.join(f'    field{i}\n' for i in range(fields)) + 'end\n'
+
+class CountingSource(str):
+    """Source text that counts how often it is split into lines"""
+    splits = 0
+
+    def split(self, *args, **kwargs):
+        CountingSource.splits += 1
+        return super().split(*args, **kwargs)
+
+def test_struct_fields_keep_their_source_text():
+    tree = TourmalineParser().parse('struct Point\n    x  # across\n    y\nend\n')
+    assert tree.statements[0].fields == ['x', 'y']
+
+def test_source_is_split_once_however_many_fields():
+    CountingSource.splits = 0
+    tree = TourmalineParser().parse(CountingSource(struct_source(500)))
+    assert len(tree.statements[0].fields) == 500
+    assert CountingSource.splits == 1
+
+def test_collector_stays_on_while_other_threads_run(monkeypatch):
+    disabled = []
+    monkeypatch.setattr(gc, 'disable', lambda: disabled.append(True))
+    release = threading.Event()
+    other = threading.Thread(target=release.wait)
+    other.start()
+    try:
+        TourmalineParser().parse(struct_source(10))
+    finally:
+        release.set()
+        other.join()
+    assert disabled == []
+    TourmalineParser().parse(struct_source(10))
+    assert disabled == [True]
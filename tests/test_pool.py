@@ -0,0 +1,58 @@
+"""Interpreter pools"""
+
+import sys
+import threading
+
+import pytest
+
+from Tourmaline import InterpreterPool, TourmalineError, ENGINES
+
+RECURSE = """
+function f(n)
+    if n == 0
+        return 0
+    end
+    return 1 + f(n - 1)
+end
+let r = f(x)
+"""
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_runs_from_many_threads(engine):
+    limit = sys.getrecursionlimit()
+    pool = InterpreterPool(4, engine=engine)
+    program = pool.compile(RECURSE)
+    results, errors = [], []
+    def worker():
+        try:
+            for _ in range(20):
+                results.append(pool.run(program, {'x': 500})['r'])
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+    assert errors == []
+    assert results == [500] * 160
+    assert sys.getrecursionlimit() == limit
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_borrower_builtins_and_hooks_do_not_reach_the_next(engine):
+    pool = InterpreterPool(1, engine=engine)
+    program = pool.compile('let r = secret()')
+    calls = []
+    with pool.interpreter() as interpreter:
+        interpreter.add_builtin('secret', lambda: 42)
+        interpreter.add_hook('call', calls.append)
+        assert interpreter.run(program)['r'] == 42
+    seen = len(calls)
+    with pool.interpreter() as interpreter:
+        assert 'secret' not in interpreter.builtins
+        assert not interpreter.hooks
+        interpreter.execute('function f()\n    return 1\nend\nlet y = f()')
+    assert len(calls) == seen
+    with pytest.raises(TourmalineError):
+        pool.run(program)
@@ -0,0 +1,60 @@
+"""Call depth limits and Python's recursion limit"""
+
+import sys
+import subprocess
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter, CallDepthError, TourmalineError, ENGINES
+
+RECURSE = """
+function f(n)
+    if n == 0
+        return 0
+    end
+    return 1 + f(n - 1)
+end
+let r = f(depth)
+"""
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_recursion_within_python_limit(engine):
+    interpreter = TourmalineInterpreter(engine=engine)
+    assert interpreter.run(interpreter.compile(RECURSE), {'depth': 500})['r'] == 500
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_recursion_to_the_default_max_depth(engine):
+    # f(9999) down to f(0) is 10000 nested calls, whatever Python's recursion limit
+    interpreter = TourmalineInterpreter(engine=engine)
+    assert interpreter.max_depth == 10000
+    assert interpreter.run(interpreter.compile(RECURSE), {'depth': 9999})['r'] == 9999
+    with pytest.raises(CallDepthError):
+        interpreter.run(interpreter.compile(RECURSE), {'depth': 10000})
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_max_depth_is_an_error(engine):
+    interpreter = TourmalineInterpreter(engine=engine, max_depth=100)
+    with pytest.raises(CallDepthError):
+        interpreter.run(interpreter.compile(RECURSE), {'depth': 200})
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_recursion_limit_restored(engine):
+    limit = sys.getrecursionlimit()
+    interpreter = TourmalineInterpreter(engine=engine)
+    interpreter.run(interpreter.compile(RECURSE), {'depth': 50})
+    assert sys.getrecursionlimit() == limit
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_deeply_nested_str_does_not_crash(engine):
+    # C code recursing past the raised limit would overflow the C stack
+    code = (
+        "from Tourmaline import TourmalineInterpreter, TourmalineError\n"
+        f"interpreter = TourmalineInterpreter(engine={engine!r})\n"
+        "try:\n"
+        "    interpreter.execute('let a = []\\nfor i in range(200000)\\n    a = [a]\\nend\\nlet s = str(a)')\n"
+        "except TourmalineError as e:\n"
+        "    print(e)\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    assert result.returncode == 0
+    assert 'recursion' in result.stdout
@@ -0,0 +1,55 @@
+"""The strings library and string +="""
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter, TourmalineError, ENGINES
+
+def run(code, engine='ast'):
+    interpreter = TourmalineInterpreter(engine=engine)
+    interpreter.execute('import strings\n' + code)
+    return interpreter.variables
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_builder(engine):
+    variables = run("""
+let b = strings.builder()
+for i in range(3)
+    strings.add(b, i, "-")
+end
+let text = strings.build(b)
+let again = strings.build(b)
+let size = len(b)
+""", engine)
+    assert (variables['text'], variables['again'], variables['size']) == ('0-1-2-', '0-1-2-', 6)
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_plus_equals_in_a_loop(engine):
+    variables = run("""
+let s = ""
+for i in range(1000)
+    s += "ab"
+end
+let t = s
+s += "c"
+""", engine)
+    assert len(variables['s']) == 2001
+    # Appending to s leaves an earlier copy alone
+    assert len(variables['t']) == 2000
+
+def test_join_split_format():
+    variables = run("""
+let joined = strings.join([1, 2, 3], ", ")
+let parts = strings.split("a,b,c", ",")
+let limited = strings.split("a b  c", nil, 1)
+let words = strings.split("  a  b ")
+let text = strings.format("{1} after {0}", 2, 3)
+""")
+    assert variables['joined'] == '1, 2, 3'
+    assert variables['parts'] == ['a', 'b', 'c']
+    assert variables['limited'] == ['a', 'b  c']
+    assert variables['words'] == ['a', 'b']
+    assert variables['text'] == '3 after 2'
+
+def test_add_needs_a_builder():
+    with pytest.raises(TourmalineError, match="expected a builder"):
+        run('let x = strings.add("text", "more")')
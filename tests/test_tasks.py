@@ -0,0 +1,145 @@
+"""Tasks, channels and the scheduler"""
+
+import time
+import threading
+
+import pytest
+
+from Tourmaline import TourmalineInterpreter, TourmalineError, ENGINES
+
+def run(engine, code, timeout=10):
+    """Run code on a thread, so a hung scheduler fails the test instead of the run"""
+    interpreter = TourmalineInterpreter(engine=engine)
+    outcome = {}
+    def target():
+        try:
+            interpreter.execute('import tasks\n' + code)
+        except TourmalineError as e:
+            outcome['error'] = str(e)
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "program did not finish"
+    return interpreter.variables, outcome.get('error')
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_channel_passes_values_between_tasks(engine):
+    variables, error = run(engine, """
+let ch = tasks.channel()
+function produce(n)
+    for i in range(n)
+        tasks.send(ch, i * i)
+    end
+    tasks.close(ch)
+end
+spawn produce(4)
+let got = []
+let v = tasks.recv(ch)
+while v != nil
+    append(got, v)
+    v = tasks.recv(ch)
+end
+""")
+    assert error is None
+    assert variables['got'] == [0, 1, 4, 9]
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_recv_timeout_returns_nil(engine):
+    start = time.perf_counter()
+    variables, error = run(engine, """
+let ch = tasks.channel(1)
+function late()
+    tasks.sleep(1)
+    tasks.send(ch, 1)
+end
+spawn late()
+let v = tasks.recv(ch, 0.05)
+""")
+    assert variables['v'] is None
+    assert error is None
+    assert time.perf_counter() - start >= 1
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_deadlock_is_an_error(engine):
+    variables, error = run(engine, """
+let ch = tasks.channel()
+let ch2 = tasks.channel()
+function waiter()
+    let x = tasks.recv(ch2)
+end
+spawn waiter()
+let v = tasks.recv(ch)
+""")
+    assert 'deadlock' in error
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_deadlock_after_a_stale_timeout(engine):
+    # The first recv is answered before its timeout, which fires later and wakes no one
+    variables, error = run(engine, """
+let ch = tasks.channel()
+let ch2 = tasks.channel()
+function producer()
+    tasks.send(ch, 1)
+end
+spawn producer()
+let v = tasks.recv(ch, 0.2)
+let w = tasks.recv(ch2)
+""")
+    assert variables['v'] == 1
+    assert 'deadlock' in error
+
+FAILING_TASK = """
+function broken()
+    let x = 1 / 0
+end
+spawn broken()
+"""
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_task_failure_discarded_by_a_bare_wait_ends_the_program(engine):
+    variables, error = run(engine, FAILING_TASK + 'tasks.sleep(0.05)\nlet after = true\n')
+    assert variables['after'] is True
+    assert "Task 'broken' failed" in error
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_task_failure_caught_by_try(engine):
+    variables, error = run(engine, FAILING_TASK + """
+function nap()
+    let z = tasks.sleep(0.05)
+end
+let caught = nil
+try
+    let r = nap()
+except e
+    caught = e
+end
+""")
+    assert error is None
+    assert "Task 'broken' failed" in variables['caught']
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_task_failure_raised_at_the_end(engine):
+    variables, error = run(engine, FAILING_TASK)
+    assert "division by zero" in error
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('lines', ['io.lines(path)', 'io.open(path)'])
+def test_reading_lines_lets_other_tasks_run(tmp_path, engine, lines):
+    path = tmp_path / 'lines.txt'
+    path.write_text('a\nb\n', encoding='utf-8')
+    variables, error = run(engine, f"""
+import io
+let path = "{path.as_posix()}"
+let source = {lines}
+let log = []
+function other()
+    append(log, "other")
+end
+spawn other()
+for line in source
+    append(log, line)
+end
+""")
+    assert error is None
+    # other runs while the first line is read, not at the end of the program
+    assert variables['log'] == ['other', 'a', 'b']